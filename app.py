@@ -1,10 +1,32 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
-import yfinance as yf
+from plotly.subplots import make_subplots
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
-from web3 import Web3
-import requests
+
+from looping.aave import NETWORKS, network_pool, pool_address, read_account_data, read_reserves_breakdown
+from looping.backtest_engine import ACTION_LIQUIDATED, run_backtest
+from looping.charts import downsample_frame, event_mask, scatter_trace, window
+from looping.sweep import frange, run_sweep, sweep_pivot
+from looping.shocks import METHOD_HISTORICAL, METHOD_NORMAL, STABLE_TICKER, fit_shock_model, load_returns, position_exposures, shock_table
+from looping.snapshots import get_snapshot_store, rows_from_frame, snapshot_row
+from looping.solver import ENTRY_START, ENTRY_WORST, reserve_for, solve_reserve
+from looping.price_store import load_history
+from looping.portfolio_backtest import fetch_panel, run_portfolio_backtest
+from looping.plans import SURFACE_LEVERAGES, SURFACE_THRESHOLDS, calculator_plan, calculator_surface, mode_a_plan, mode_b_plan
+from looping.multicall import DEFAULT_CHUNK_SIZE, parse_addresses, scan_accounts
+from looping.rpc_pool import make_session
+from looping.multichain import scan_networks
+from looping.hf_history import block_range_for_days, hf_history
+from looping.reserves import single_asset_view
+from looping.montecarlo import DEFAULT_BLOCK, fit_returns, simulate_paths, summarize
+from looping.intraday import INTRADAY_LIMITS, clip_start, iter_intraday_chunks, run_streaming_backtest
+from looping.result_cache import get_result_cache, result_key
+from looping.quotes import get_quote_cache
+from looping.leads import get_lead_worker
+from looping.metrics import REGISTRY, serve_from_env, span, start_trace
 
 # ==============================================================================
 #  CONFIGURACIÓN DE LA PÁGINA Y ESTILOS
@@ -36,107 +58,32 @@ st.markdown(hide_st_style, unsafe_allow_html=True)
 
 st.title("🛡️ Looping Master: Calculadora, Backtest & On-Chain")
 
+# Trazas por etapa de esta ejecución (panel de depuración) y /metrics si LOOPING_METRICS_PORT está definido
+run_spans = start_trace()
+serve_from_env()
+
 # ==============================================================================
 #  0. CONFIGURACIÓN MARKETING (MOOSEND)
 # ==============================================================================
 MOOSEND_LIST_ID = "75c61863-63dc-4fd3-9ed8-856aee90d04a"
 
 def add_subscriber_moosend(name, email):
-    """Envía el suscriptor a la lista de Moosend vía API"""
+    """Encola el suscriptor para Moosend; lo envía un hilo de fondo con reintentos (looping/leads.py)"""
     try:
         if "MOOSEND_API_KEY" not in st.secrets:
             return False, "Falta configuración de API Key en Secrets."
-            
-        api_key = st.secrets["MOOSEND_API_KEY"]
-        url = f"https://api.moosend.com/v3/subscribers/{MOOSEND_LIST_ID}/subscribe.json?apikey={api_key}"
-        
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
-        
-        payload = {
-            "Name": name,
-            "Email": email,
-            "HasExternalDoubleOptIn": False 
-        }
-        
-        response = requests.post(url, headers=headers, json=payload)
         
-        if response.status_code == 200:
-            return True, "Success"
-        else:
-            try:
-                error_msg = response.json().get("Error", "Unknown Error")
-            except:
-                error_msg = str(response.status_code)
-            return False, error_msg
+        # Se guarda en la cola local y se responde al momento: ni una API lenta ni un fallo pierden el lead
+        get_lead_worker(st.secrets["MOOSEND_API_KEY"], MOOSEND_LIST_ID).submit(name, email)
+        return True, "Success"
             
     except Exception as e:
         return False, str(e)
 
 # ==============================================================================
-#  1. CONFIGURACIÓN DE REDES Y CONTRATOS
+#  1. CONFIGURACIÓN DE ACTIVOS
 # ==============================================================================
-
-# Usamos 'pool_provider' (AddressProvider) para encontrar siempre la dirección correcta del Pool
-NETWORKS = {
-    "Base": {
-        "chain_id": 8453,
-        "rpcs": ["https://base.drpc.org", "https://mainnet.base.org"],
-        "pool_provider": "0xe20fCBdBfFC4Dd138cE8b2E6FBb6CB49777ad64D"
-    },
-    "Arbitrum": {
-        "chain_id": 42161,
-        "rpcs": ["https://arb1.arbitrum.io/rpc", "https://rpc.ankr.com/arbitrum"],
-        "pool_provider": "0xa97684ead0e402dC232d5A977953DF7ECBaB3CDb"
-    },
-    "Ethereum": {
-        "chain_id": 1,
-        "rpcs": ["https://eth.llamarpc.com", "https://rpc.ankr.com/eth"], 
-        "pool_provider": "0x2f39d218133AFaB8F2B819B1066c7E434Ad94E9e"
-    },
-    "Optimism": {
-        "chain_id": 10,
-        "rpcs": ["https://mainnet.optimism.io", "https://rpc.ankr.com/optimism"],
-        "pool_provider": "0xa97684ead0e402dC232d5A977953DF7ECBaB3CDb"
-    },
-    "Polygon": {
-        "chain_id": 137,
-        "rpcs": ["https://polygon-rpc.com", "https://rpc.ankr.com/polygon"],
-        "pool_provider": "0xa97684ead0e402dC232d5A977953DF7ECBaB3CDb"
-    },
-    "Avalanche": {
-        "chain_id": 43114,
-        "rpcs": ["https://api.avax.network/ext/bc/C/rpc"],
-        "pool_provider": "0xa97684ead0e402dC232d5A977953DF7ECBaB3CDb"
-    }
-}
-
-# ABI LIGERO (Solo lo necesario para conectar y leer totales rápidamente)
-AAVE_ABI = [
-    {
-        "inputs": [],
-        "name": "getPool",
-        "outputs": [{"internalType": "address", "name": "", "type": "address"}],
-        "stateMutability": "view",
-        "type": "function"
-    },
-    {
-        "inputs": [{"internalType": "address", "name": "user", "type": "address"}],
-        "name": "getUserAccountData",
-        "outputs": [
-            {"internalType": "uint256", "name": "totalCollateralBase", "type": "uint256"},
-            {"internalType": "uint256", "name": "totalDebtBase", "type": "uint256"},
-            {"internalType": "uint256", "name": "availableBorrowsBase", "type": "uint256"},
-            {"internalType": "uint256", "name": "currentLiquidationThreshold", "type": "uint256"},
-            {"internalType": "uint256", "name": "ltv", "type": "uint256"},
-            {"internalType": "uint256", "name": "healthFactor", "type": "uint256"}
-        ],
-        "stateMutability": "view",
-        "type": "function"
-    }
-]
+# Las redes y contratos de Aave viven en looping/aave.py
 
 # Mapeo de activos para los selectores
 ASSET_MAP = {
@@ -153,45 +100,26 @@ ASSET_MAP = {
 #  2. FUNCIONES AUXILIARES (WEB3)
 # ==============================================================================
 
-def get_web3_session(rpc_url):
-    """Crea una sesión Web3 disfrazada de navegador Chrome"""
-    s = requests.Session()
-    s.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-    })
-    # Timeout extendido a 60s
-    return Web3(Web3.HTTPProvider(rpc_url, session=s, request_kwargs={'timeout': 60}))
-
-def connect_robust(network_name):
-    """Intenta conectar rotando RPCs y priorizando Secrets"""
-    config = NETWORKS[network_name]
-    rpcs = config["rpcs"][:] # Copia de la lista
-    
+def get_network_pool(network_name):
+    """Pool RPC compartido de la red, con el RPC privado de Secrets (Alchemy/Infura) como preferente"""
     secret_key = f"{network_name.upper()}_RPC_URL"
-    used_private = False
-    
-    # Inyectar secreto (Alchemy/Infura) si existe en los Secrets
+    preferred = []
     if secret_key in st.secrets:
-        private_rpc = st.secrets[secret_key].strip().replace('"', '').replace("'", "")
-        rpcs.insert(0, private_rpc)
-        used_private = True
-        
-    for rpc in rpcs:
-        try:
-            w3 = get_web3_session(rpc)
-            if w3.is_connected():
-                # Verificamos el Chain ID para estar seguros
-                if w3.eth.chain_id == config["chain_id"]:
-                    return w3, rpc, used_private
-        except: 
-            continue
-            
-    return None, None, False
+        preferred.append(st.secrets[secret_key].strip().replace('"', '').replace("'", ""))
+    return network_pool(network_name, preferred)
+
+def rpc_status(ep):
+    """Conexión usada, para mostrar: el RPC privado nunca se enseña (su URL lleva la API key)"""
+    return "🔒 Privado" if ep.preferred else f"🌍 Público ({ep.host})"
 
 # ==============================================================================
 #  3. INTERFAZ DE USUARIO - ESTRUCTURA DE PESTAÑAS
 # ==============================================================================
 
+# Cada pestaña es un fragmento: al tocar un widget solo se vuelve a ejecutar su pestaña
+# (st.fragment desde Streamlit 1.37; en versiones anteriores todo se ejecuta como antes)
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda fn: fn)
+
 tab_home, tab_calc, tab_backtest, tab_onchain = st.tabs([
     "🏠 Inicio", 
     "🧮 Calculadora", 
@@ -202,7 +130,8 @@ tab_home, tab_calc, tab_backtest, tab_onchain = st.tabs([
 # ------------------------------------------------------------------------------
 #  PESTAÑA 0: PORTADA (DISEÑO FINAL MEZCLADO)
 # ------------------------------------------------------------------------------
-with tab_home:
+@fragment
+def home_tab():
     # --- HERO SECTION LIMPIO (Títulos centrados o limpios) ---
     st.markdown("# 🛡️ Domina el Looping en DeFi")
     st.markdown("#### Maximiza tus rendimientos sin morir en el intento.")
@@ -271,8 +200,7 @@ with tab_home:
                 
                 if submitted:
                     if email_input and "@" in email_input:
-                        with st.spinner("Enviando solicitud..."):
-                            ok, msg = add_subscriber_moosend(name_input, email_input)
+                        ok, msg = add_subscriber_moosend(name_input, email_input)
                             
                         if ok:
                             st.success(f"¡Genial, {name_input}! Revisa tu correo ahora.")
@@ -284,10 +212,14 @@ with tab_home:
 
     st.caption("Desarrollado con ❤️ por el equipo de Campamento DeFi. DYOR.")
 
+with tab_home:
+    home_tab()
+
 # ------------------------------------------------------------------------------
 #  PESTAÑA 1: CALCULADORA ESTÁTICA
 # ------------------------------------------------------------------------------
-with tab_calc:
+@fragment
+def calc_tab():
     st.markdown("### 🧮 Simulador Estático de Defensa")
     
     col_input1, col_input2, col_input3 = st.columns(3)
@@ -309,95 +241,28 @@ with tab_calc:
     with col_input3:
         c_ltv = st.slider("LTV Liquidación (%)", 50, 95, 78, 1, key="c_ltv") / 100.0
         c_threshold = st.number_input("Umbral Defensa (%)", value=15.0, step=1.0, key="c_th") / 100.0
-        c_zones = st.slider("Zonas de Defensa", 1, 10, 5, key="c_zones")
+        c_zones = st.slider("Zonas de Defensa", 1, 30, 5, key="c_zones")
 
-    # Cálculos base
-    c_collat_usd = c_capital * c_leverage
-    c_debt_usd = c_collat_usd - c_capital
-    c_collat_amt = c_collat_usd / c_price
-    
-    if c_collat_amt > 0 and c_ltv > 0:
-        c_liq_price = c_debt_usd / (c_collat_amt * c_ltv)
-        c_target_ratio = c_liq_price / c_price 
-        c_cushion_pct = (c_price - c_liq_price) / c_price
-    else:
-        c_liq_price = 0
-        c_target_ratio = 0
-        c_cushion_pct = 0
-    
-    # Generación de tabla en cascada
-    cascade_data = []
-    curr_collat = c_collat_amt
-    curr_liq = c_liq_price
-    cum_cost = 0.0
-    
-    for i in range(1, c_zones + 1):
-        trig_p = curr_liq * (1 + c_threshold)
-        drop_pct = (c_price - trig_p) / c_price
-        targ_liq = trig_p * c_target_ratio
-        
-        if targ_liq > 0:
-            need_col = c_debt_usd / (targ_liq * c_ltv)
-            add_col = need_col - curr_collat
-        else:
-            add_col = 0
-            
-        cost = add_col * trig_p
-        cum_cost += cost
-        curr_collat += add_col
-        
-        # Métricas financieras
-        total_inv = c_capital + cum_cost
-        final_val = curr_collat * c_target
-        net_prof = (final_val - c_debt_usd) - total_inv
-        
-        if total_inv > 0:
-            roi = (net_prof / total_inv) * 100
-        else:
-            roi = 0
-            
-        if drop_pct > 0:
-            ratio = roi / (drop_pct * 100)
-        else:
-            ratio = 0
-        
-        # Nuevo HF
-        if c_debt_usd > 0:
-            new_hf = ((curr_collat * trig_p) * c_ltv) / c_debt_usd
-        else:
-            new_hf = 999
-        
-        cascade_data.append({
-            "Zona": f"#{i}", 
-            "Precio Activación": trig_p, 
-            "Caída (%)": drop_pct, 
-            "Inversión Extra ($)": cost, 
-            "Total Invertido ($)": total_inv, 
-            "Nuevo P. Liq": targ_liq, 
-            "Nuevo HF": new_hf,
-            "Beneficio ($)": net_prof, 
-            "ROI (%)": roi, 
-            "Ratio": ratio
-        })
-        curr_liq = targ_liq
-
-    df_calc = pd.DataFrame(cascade_data)
+    # Generación de tabla en cascada (todas las zonas en un paso)
+    with span("plan.calculadora", zones=c_zones):
+        df_calc, c_liq_price = calculator_plan(c_price, c_target, c_capital, c_leverage, c_ltv, c_threshold, c_zones)
     
     st.divider()
-    st.dataframe(
-        df_calc.style.format({
-            "Precio Activación": "${:,.2f}", 
-            "Caída (%)": "{:.2%}", 
-            "Inversión Extra ($)": "${:,.0f}", 
-            "Total Invertido ($)": "${:,.0f}", 
-            "Nuevo P. Liq": "${:,.2f}", 
-            "Nuevo HF": "{:.2f}",
-            "Beneficio ($)": "${:,.0f}", 
-            "ROI (%)": "{:.2f}%", 
-            "Ratio": "{:.2f}"
-        }), 
-        use_container_width=True
-    )
+    with span("render.table", table="calculadora"):
+        st.dataframe(
+            df_calc.style.format({
+                "Precio Activación": "${:,.2f}", 
+                "Caída (%)": "{:.2%}", 
+                "Inversión Extra ($)": "${:,.0f}", 
+                "Total Invertido ($)": "${:,.0f}", 
+                "Nuevo P. Liq": "${:,.2f}", 
+                "Nuevo HF": "{:.2f}",
+                "Beneficio ($)": "${:,.0f}", 
+                "ROI (%)": "{:.2f}%", 
+                "Ratio": "{:.2f}"
+            }), 
+            use_container_width=True
+        )
     
     if not df_calc.empty:
         st.divider()
@@ -409,11 +274,37 @@ with tab_calc:
         **Escenario Extremo:** Si el mercado cae un **{last_row['Caída (%)']:.1%}**, necesitarás haber inyectado un total de **\${last_row['Total Invertido ($)']-c_capital:,.0f}** para sobrevivir. Si tras eso el precio recupera al objetivo, tu ROI sería del **{last_row['ROI (%)']:.2f}%**.
         """)
 
+    # --- SUPERFICIE DE SENSIBILIDAD ---
+    st.divider()
+    st.markdown("### 🗺️ Mapa Apalancamiento × Umbral")
+    surf_metric = st.radio("Métrica", ["Capital Total Requerido ($)", "Caída Cubierta (%)"], horizontal=True, key="c_surf_metric")
+    
+    surf_levs, surf_ths = SURFACE_LEVERAGES, SURFACE_THRESHOLDS
+    surf_total, surf_drop = calculator_surface(c_capital, c_price, c_ltv, c_zones)
+    surf_z = surf_total if surf_metric.startswith("Capital") else surf_drop * 100
+    
+    fig_surf = go.Figure(go.Heatmap(
+        z=surf_z, x=surf_ths * 100, y=surf_levs,
+        colorscale="Reds" if surf_metric.startswith("Capital") else "RdYlGn",
+        hovertemplate="Umbral %{x:.0f}% | %{y:.1f}x<br>%{z:,.2f}<extra></extra>"
+    ))
+    fig_surf.add_trace(go.Scatter(x=[c_threshold * 100], y=[c_leverage], mode="markers", name="Actual",
+                                  marker=dict(color="black", size=12, symbol="x")))
+    fig_surf.update_layout(xaxis_title="Umbral Defensa (%)", yaxis_title="Apalancamiento (x)", showlegend=False)
+    st.plotly_chart(fig_surf, use_container_width=True)
+    st.caption(f"Para {c_zones} zonas de defensa con LTV {c_ltv:.0%}. La X marca tu configuración actual.")
+
+with tab_calc:
+    calc_tab()
+
 # ------------------------------------------------------------------------------
 #  PESTAÑA 2: MOTOR DE BACKTESTING
 # ------------------------------------------------------------------------------
-with tab_backtest:
+@fragment
+def backtest_tab():
     st.markdown("### 📉 Validación Histórica")
+    # LTV de la Calculadora: cada pestaña se ejecuta por separado, así que se lee del estado de sesión
+    c_ltv = st.session_state.get("c_ltv", 78) / 100.0
     
     col_bt1, col_bt2, col_bt3 = st.columns(3)
     with col_bt1:
@@ -430,110 +321,389 @@ with tab_backtest:
     
     with col_bt3:
         bt_threshold = st.number_input("Umbral Defensa (%)", value=15.0, step=1.0, key="bt_th") / 100.0
+        bt_interval = st.selectbox("Resolución", ["1d"] + list(INTRADAY_LIMITS.keys()), key="bt_interval",
+                                   help="Las velas intradía capturan las mechas que liquidan. Yahoo limita cuánto histórico sirve.")
         run_bt = st.button("🚀 Ejecutar Backtest", type="primary")
 
     if run_bt:
         with st.spinner(f"Simulando {bt_ticker}..."):
             try:
-                df_hist = yf.download(bt_ticker, start=bt_start_date, end=date.today(), progress=False)
+                ltv_liq = c_ltv # Usamos el LTV de la pestaña 1
+                # Resultados compartidos entre sesiones: el mismo backtest sobre el mismo histórico no se repite
+                result_cache = get_result_cache()
                 
-                if df_hist.empty:
+                if bt_interval == "1d":
+                    df_hist = load_history(bt_ticker, bt_start_date, date.today())
+                    
+                    if df_hist.empty:
+                        st.error("Sin datos.")
+                        st.stop()
+                    
+                    bt_key = result_key("1d", bt_ticker, bt_start_date, df_hist.index[-1], bt_capital, bt_leverage, bt_threshold, ltv_liq)
+                    df_res, bt_summary = result_cache.cached(
+                        bt_key, lambda: run_backtest(df_hist, bt_capital, bt_leverage, bt_threshold, ltv_liq)
+                    )
+                else:
+                    bt_start_intra = clip_start(bt_start_date, bt_interval)
+                    if bt_start_intra > bt_start_date:
+                        st.info(f"Yahoo solo sirve velas de {bt_interval} desde {bt_start_intra}; el backtest empieza ahí.")
+                    # Se descarga y simula ventana a ventana sin construir un DataFrame gigante.
+                    # La descarga no incluye hoy: el histórico (y la clave) solo cambia una vez al día
+                    bt_end = date.today()
+                    bt_key = result_key(bt_interval, bt_ticker, bt_start_intra, bt_end, bt_capital, bt_leverage, bt_threshold, ltv_liq)
+                    df_res, bt_summary = result_cache.cached(bt_key, lambda: run_streaming_backtest(
+                        iter_intraday_chunks(bt_ticker, bt_start_intra, bt_end, bt_interval),
+                        bt_capital, bt_leverage, bt_threshold, ltv_liq
+                    ))
+                
+                if bt_summary is None:
                     st.error("Sin datos.")
                     st.stop()
                 
-                if isinstance(df_hist.columns, pd.MultiIndex):
-                    df_hist.columns = df_hist.columns.get_level_values(0)
+                # Se guarda para poder mover la ventana del gráfico sin repetir el backtest
+                st.session_state.bt_result = (bt_ticker, df_res, bt_summary)
 
-                start_date_actual = df_hist.index[0].date()
-                start_price = float(df_hist.iloc[0]['Close']) 
-                
-                collateral_usd = bt_capital * bt_leverage
-                debt_usd = collateral_usd - bt_capital 
-                collateral_amt = collateral_usd / start_price 
-                
-                ltv_liq = c_ltv # Usamos el LTV de la pestaña 1
-                liq_price = debt_usd / (collateral_amt * ltv_liq)
-                target_ratio = liq_price / start_price 
-                
-                history = []
-                total_injected = 0.0
-                is_liquidated = False
-                
-                for date_idx, row in df_hist.iterrows():
-                    if pd.isna(row['Close']): continue
-                    low_val = float(row['Low'])
-                    close_val = float(row['Close'])
-                    open_val = float(row['Open'])
-                    
-                    trigger_price = liq_price * (1 + bt_threshold)
-                    action = "Hold"
-                    
-                    if low_val <= trigger_price and not is_liquidated:
-                        defense_price = min(open_val, trigger_price) 
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+    # --- HISTÓRICO DE SALUD ON-CHAIN ---
+    with st.expander("📈 Histórico de Salud (HF) de una Wallet"):
+        st.caption("Reconstruye el HF pasado leyendo bloques antiguos. Requiere un RPC de tipo archivo (Secrets `<RED>_ARCHIVE_RPC_URL` o URL manual).")
+        
+        col_hh1, col_hh2, col_hh3 = st.columns([1, 3, 1])
+        with col_hh1:
+            hh_net = st.selectbox("Red", list(NETWORKS.keys()), key="hh_net")
+        with col_hh2:
+            hh_addr = st.text_input("Wallet Address (0x...)", placeholder="0x...", key="hh_addr")
+        with col_hh3:
+            hh_days = st.number_input("Días", value=30, min_value=1, max_value=365, key="hh_days")
+        hh_rpc = st.text_input("RPC archivo (opcional)", placeholder="https://...", key="hh_rpc")
+        
+        if st.button("📈 Reconstruir Histórico", key="hh_run"):
+            from web3 import Web3  # diferido: web3 solo se carga al leer on-chain
+            if not hh_addr or not Web3.is_address(hh_addr):
+                st.warning("Falta dirección")
+            else:
+                with st.spinner(f"Leyendo bloques históricos en {hh_net}..."):
+                    try:
+                        hh_pool = get_network_pool(hh_net)
+                        archive_key = f"{hh_net.upper()}_ARCHIVE_RPC_URL"
+                        archive_url = hh_rpc.strip() or (st.secrets[archive_key].strip() if archive_key in st.secrets else None)
                         
-                        if defense_price <= liq_price:
-                            is_liquidated = True
-                            action = "LIQUIDATED ☠️"
+                        hh_pool_addr, hh_ep = hh_pool.call(lambda w3: pool_address(w3, hh_net))
+                        if archive_url:
+                            hh_session, hh_url = make_session(), archive_url
                         else:
-                            target_liq_new = defense_price * target_ratio
-                            needed_collat_amt = debt_usd / (target_liq_new * ltv_liq)
-                            add_collat_amt = needed_collat_amt - collateral_amt
-                            
-                            if add_collat_amt > 0:
-                                total_injected += add_collat_amt * defense_price
-                                collateral_amt += add_collat_amt
-                                liq_price = target_liq_new 
-                                action = "DEFENSA 🛡️"
-                    
-                    if low_val <= liq_price and not is_liquidated:
-                        is_liquidated = True
+                            hh_session, hh_url = hh_ep.session, hh_ep.url
                         
-                    if not is_liquidated:
-                        pos_value = (collateral_amt * close_val) - debt_usd
+                        from_b, to_b = block_range_for_days(hh_session, hh_url, hh_days)
+                        df_hh, hh_rounds = hf_history(hh_session, hh_url, hh_pool_addr, Web3.to_checksum_address(hh_addr), from_b, to_b)
+                        st.session_state.hf_history_data = (hh_net, df_hh, hh_rounds)
+                    except Exception as e:
+                        st.error(f"Error de lectura: {e}")
+        
+        if st.session_state.get("hf_history_data"):
+            hh_net_v, df_hh, hh_rounds = st.session_state.hf_history_data
+            hh_debt = df_hh[np.isfinite(df_hh["hf"])]
+            hm1, hm2, hm3 = st.columns(3)
+            hm1.metric("Puntos leídos", f"{len(df_hh)}", f"{hh_rounds} rondas batch", delta_color="off")
+            hm2.metric("HF Mínimo", f"{hh_debt['hf'].min():.2f}" if not hh_debt.empty else "-")
+            hm3.metric("HF Actual", f"{df_hh['hf'].iloc[-1]:.2f}" if not df_hh.empty else "-")
+            
+            # Con un backtest en pantalla el HF va debajo de su curva de capital (mismo eje de fechas)
+            if st.session_state.get("bt_result"):
+                st.caption("El HF se muestra bajo el gráfico del backtest.")
+            else:
+                fig_hh = go.Figure()
+                fig_hh.add_trace(go.Scatter(x=hh_debt["Fecha"], y=hh_debt["hf"], name='HF', mode='lines+markers', line=dict(color='royalblue'), marker=dict(size=4)))
+                fig_hh.add_hline(y=1.0, line=dict(color='red', dash='dash'), annotation_text="Liquidación")
+                fig_hh.update_layout(yaxis_title="Health Factor", title=f"HF histórico ({hh_net_v})")
+                st.plotly_chart(fig_hh, use_container_width=True)
+
+    if st.session_state.get("bt_result"):
+        _, df_res, bt_summary = st.session_state.bt_result
+        start_date_actual = bt_summary["start_date"]
+        start_price = bt_summary["start_price"]
+        debt_usd = bt_summary["debt_usd"]
+        total_injected = bt_summary["total_injected"]
+        is_liquidated = bt_summary["is_liquidated"]
+        
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Resultado", "LIQUIDADO" if is_liquidated else "VIVO")
+        c2.metric("Inyectado Total", f"${total_injected:,.0f}")
+        if not df_res.empty:
+            c3.metric("Valor Final", f"${df_res.iloc[-1]['Valor Estrategia']:,.0f}")
+        
+        # Ventana visible: se diezma solo lo que se ve (LTTB), conservando siempre defensas y liquidación
+        df_win = df_res
+        if len(df_res) > 1 and df_res.index[0].date() < df_res.index[-1].date():
+            first, last = df_res.index[0].date(), df_res.index[-1].date()
+            win_start, win_end = st.slider("Ventana del gráfico", min_value=first, max_value=last, value=(first, last), key="bt_window")
+            df_win = window(df_res, win_start, win_end)
+        df_plot = downsample_frame(df_win, ["Valor Estrategia", "Inversión Acumulada"], keep=event_mask(df_win))
+        Trace = scatter_trace(len(df_plot))
+        
+        # HF on-chain reconstruido (si lo hay) en un segundo panel con el mismo eje de fechas
+        hh_win = None
+        if st.session_state.get("hf_history_data") and not df_win.empty:
+            hh_net_v, df_hh, _ = st.session_state.hf_history_data
+            hh_days_v = df_hh["Fecha"].dt.date
+            hh_win = df_hh[np.isfinite(df_hh["hf"]) & (hh_days_v >= df_win.index[0].date()) & (hh_days_v <= df_win.index[-1].date())]
+            if hh_win.empty:
+                st.caption("El histórico de HF on-chain no cae dentro de la ventana del gráfico.")
+                hh_win = None
+        
+        fig = make_subplots(rows=2 if hh_win is not None else 1, cols=1, shared_xaxes=True,
+                            row_heights=[0.7, 0.3] if hh_win is not None else None, vertical_spacing=0.05)
+        fig.add_trace(Trace(x=df_plot.index, y=df_plot["Valor Estrategia"], name='Estrategia', fill='tozeroy', line=dict(color='green')), row=1, col=1)
+        fig.add_trace(Trace(x=df_plot.index, y=df_plot["Inversión Acumulada"], name='Inversión', line=dict(color='red', dash='dash')), row=1, col=1)
+        
+        events = df_win[df_win["Acción"].str.contains("DEFENSA")]
+        if not events.empty:
+            fig.add_trace(go.Scatter(x=events.index, y=events["Valor Estrategia"], mode='markers', name='Defensa', marker=dict(color='orange', size=10, symbol='diamond')), row=1, col=1)
+        liquidation = df_win[df_win["Acción"] == ACTION_LIQUIDATED]
+        if not liquidation.empty:
+            fig.add_trace(go.Scatter(x=liquidation.index, y=liquidation["Valor Estrategia"], mode='markers', name='Liquidación', marker=dict(color='black', size=12, symbol='x')), row=1, col=1)
+        if hh_win is not None:
+            fig.add_trace(go.Scatter(x=hh_win["Fecha"], y=hh_win["hf"], name=f'HF on-chain ({hh_net_v})', mode='lines+markers',
+                                     line=dict(color='royalblue'), marker=dict(size=4)), row=2, col=1)
+            fig.add_hline(y=1.0, line=dict(color='red', dash='dash'), row=2, col=1)
+            fig.update_yaxes(title_text="Health Factor", row=2, col=1)
+        
+        with span("render.chart", points=len(df_plot)):
+            st.plotly_chart(fig, use_container_width=True)
+        if len(df_plot) < len(df_win):
+            st.caption(f"Mostrando {len(df_plot):,} de {len(df_win):,} puntos ({'WebGL' if Trace is not go.Scatter else 'SVG'}).")
+        
+        st.divider()
+        st.subheader("🏁 Datos de Entrada")
+        st.write(f"Inicio: {start_date_actual} | Precio Entrada: ${start_price:,.2f} | Deuda Inicial: ${debt_usd:,.0f}")
+
+    # --- BARRIDO DE PARÁMETROS ---
+    st.divider()
+    with st.expander("🧪 Barrido de Parámetros (Apalancamiento × Umbral × LTV)"):
+        st.caption(f"Prueba todas las combinaciones contra una sola descarga de {bt_ticker}, repartidas entre todos los núcleos.")
+        
+        col_sw1, col_sw2, col_sw3 = st.columns(3)
+        with col_sw1:
+            sw_lev = st.slider("Rango Apalancamiento (x)", 1.1, 4.0, (1.5, 3.0), 0.1, key="sw_lev")
+            sw_lev_step = st.number_input("Paso Apalancamiento", value=0.1, min_value=0.05, step=0.05, key="sw_lev_step")
+        with col_sw2:
+            sw_th = st.slider("Rango Umbral Defensa (%)", 1, 50, (5, 30), 1, key="sw_th")
+            sw_th_step = st.number_input("Paso Umbral (%)", value=1.0, min_value=0.5, step=0.5, key="sw_th_step")
+        with col_sw3:
+            sw_ltv = st.slider("Rango LTV Liquidación (%)", 50, 95, (75, 85), 1, key="sw_ltv")
+            sw_ltv_step = st.number_input("Paso LTV (%)", value=5.0, min_value=1.0, step=1.0, key="sw_ltv_step")
+        
+        sw_levs = frange(sw_lev[0], sw_lev[1], sw_lev_step)
+        sw_ths = [t / 100.0 for t in frange(sw_th[0], sw_th[1], sw_th_step)]
+        sw_ltvs = [l / 100.0 for l in frange(sw_ltv[0], sw_ltv[1], sw_ltv_step)]
+        st.write(f"Combinaciones: **{len(sw_levs) * len(sw_ths) * len(sw_ltvs):,}**")
+        
+        if st.button("🧪 Ejecutar Barrido", key="run_sweep"):
+            with st.spinner(f"Barriendo {bt_ticker}..."):
+                try:
+                    df_hist = load_history(bt_ticker, bt_start_date, date.today())
+                    if df_hist.empty:
+                        st.error("Sin datos.")
                     else:
-                        pos_value = 0
-                        
-                    history.append({
-                        "Fecha": date_idx, 
-                        "Acción": action, 
-                        "Liq Price": liq_price if not is_liquidated else 0,
-                        "Inversión Acumulada": bt_capital + total_injected, 
-                        "Valor Estrategia": pos_value if not is_liquidated else 0, 
-                        "Valor HODL": (bt_capital / start_price) * close_val 
-                    })
-                    
-                    if is_liquidated: break
-                
-                df_res = pd.DataFrame(history).set_index("Fecha")
-                
-                c1, c2, c3 = st.columns(3)
-                c1.metric("Resultado", "LIQUIDADO" if is_liquidated else "VIVO")
-                c2.metric("Inyectado Total", f"${total_injected:,.0f}")
-                if not df_res.empty:
-                    c3.metric("Valor Final", f"${df_res.iloc[-1]['Valor Estrategia']:,.0f}")
-                
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=df_res.index, y=df_res["Valor Estrategia"], name='Estrategia', fill='tozeroy', line=dict(color='green')))
-                fig.add_trace(go.Scatter(x=df_res.index, y=df_res["Inversión Acumulada"], name='Inversión', line=dict(color='red', dash='dash')))
-                
-                events = df_res[df_res["Acción"].str.contains("DEFENSA")]
-                if not events.empty:
-                    fig.add_trace(go.Scatter(x=events.index, y=events["Valor Estrategia"], mode='markers', name='Defensa', marker=dict(color='orange', size=10, symbol='diamond')))
-                
-                st.plotly_chart(fig, use_container_width=True)
-                
-                st.divider()
-                st.subheader("🏁 Datos de Entrada")
-                st.write(f"Inicio: {start_date_actual} | Precio Entrada: ${start_price:,.2f} | Deuda Inicial: ${debt_usd:,.0f}")
+                        st.session_state.sweep_data = run_sweep(df_hist, bt_capital, sw_levs, sw_ths, sw_ltvs)
+                except Exception as e:
+                    st.error(f"Error: {e}")
+        
+        if st.session_state.get("sweep_data") is not None and not st.session_state.sweep_data.empty:
+            df_sw = st.session_state.sweep_data
+            
+            col_hm1, col_hm2 = st.columns(2)
+            with col_hm1:
+                sw_metric = st.selectbox("Métrica", ["Sobrevive", "Inyectado ($)", "Valor Final ($)"], key="sw_metric")
+            with col_hm2:
+                sw_ltv_view = st.selectbox("LTV a visualizar", sorted(df_sw["LTV"].unique()), format_func=lambda v: f"{v:.0%}", key="sw_ltv_view")
+            
+            pv = sweep_pivot(df_sw, sw_metric, sw_ltv_view).astype(float)
+            fig_sw = go.Figure(go.Heatmap(
+                z=pv.values, x=[f"{t:.1%}" for t in pv.columns], y=[f"{l:.1f}x" for l in pv.index],
+                colorscale="RdYlGn" if sw_metric != "Inyectado ($)" else "Reds"
+            ))
+            fig_sw.update_layout(xaxis_title="Umbral Defensa", yaxis_title="Apalancamiento")
+            st.plotly_chart(fig_sw, use_container_width=True)
+            
+            st.write(f"Supervivencia: **{df_sw['Sobrevive'].mean():.1%}** de las combinaciones")
+            st.dataframe(
+                df_sw.sort_values(["Sobrevive", "Valor Final ($)"], ascending=False).style.format({
+                    "Apalancamiento": "{:.1f}x", "Umbral": "{:.1%}", "LTV": "{:.0%}",
+                    "Inyectado ($)": "${:,.0f}", "Valor Final ($)": "${:,.0f}"
+                }),
+                use_container_width=True
+            )
 
-            except Exception as e:
-                st.error(f"Error: {e}")
+    # --- RESERVA MÍNIMA ---
+    with st.expander("🧮 Reserva Mínima para Sobrevivir al Histórico"):
+        st.caption(f"Cuánto hay que tener apartado para que la regla de defensa de arriba nunca liquide en {bt_ticker} "
+                   f"({bt_leverage:.1f}x, LTV {c_ltv:.0%}), y con qué umbral hace falta menos.")
+        rs_entry = st.radio("Entrada", [ENTRY_START, ENTRY_WORST], horizontal=True, key="rs_entry",
+                            format_func=lambda e: "Fecha de inicio" if e == ENTRY_START else "Peor pico del histórico")
+        
+        if st.button("🧮 Calcular Reserva", key="run_reserve"):
+            with st.spinner(f"Analizando caídas de {bt_ticker}..."):
+                try:
+                    df_hist = load_history(bt_ticker, bt_start_date, date.today())
+                    if df_hist.empty:
+                        st.error("Sin datos.")
+                    else:
+                        with span("solver.reserve", bars=len(df_hist)):
+                            st.session_state.reserve_data = solve_reserve(df_hist, bt_capital, bt_leverage, c_ltv, entry=rs_entry)
+                except Exception as e:
+                    st.error(f"Error: {e}")
+        
+        if st.session_state.get("reserve_data") and st.session_state.reserve_data[1] is not None:
+            df_rs, rs_summary = st.session_state.reserve_data
+            
+            if rs_summary["max_threshold"] <= 0:
+                st.warning("Con ese apalancamiento y LTV la posición ya es liquidable al entrar: ninguna defensa puede sostenerla.")
+            elif df_rs.empty:
+                st.warning(f"Ningún umbral de la rejilla aleja la liquidación: hace falta un umbral por debajo de "
+                           f"{rs_summary['max_threshold']:.1%}. Baja el apalancamiento o sube el LTV.")
+            else:
+                r1, r2, r3 = st.columns(3)
+                if bt_threshold < rs_summary["max_threshold"]:
+                    rs_own = reserve_for(df_rs, bt_threshold)
+                    r1.metric(f"Reserva con umbral {rs_own['Umbral']:.0%}",
+                              f"${rs_own['Reserva ($)']:,.0f}" if rs_own["Sobrevive"] else "LIQUIDA")
+                else:
+                    r1.metric("Tu umbral", "No aleja la liquidación")
+                if rs_summary["best_threshold"] is not None:
+                    r2.metric("Mejor umbral", f"{rs_summary['best_threshold']:.0%}")
+                    r3.metric("Reserva mínima", f"${rs_summary['best_reserve']:,.0f}")
+                else:
+                    r2.metric("Mejor umbral", "Ninguno sobrevive")
+            
+                st.write(f"Ventana que manda: **{rs_summary['entry_date']:%Y-%m-%d} → {rs_summary['trough_date']:%Y-%m-%d}** "
+                         f"(${rs_summary['start_price']:,.2f} → ${rs_summary['trough_price']:,.2f}, caída {rs_summary['drawdown']:.1%}). "
+                         f"Mayor caída del histórico: {rs_summary['max_drawdown']:.1%} "
+                         f"({rs_summary['max_drawdown_window'][0]:%Y-%m-%d} → {rs_summary['max_drawdown_window'][1]:%Y-%m-%d}).")
+            
+                rs_alive = df_rs[df_rs["Sobrevive"].astype(bool)]
+                if not rs_alive.empty:
+                    fig_rs = go.Figure(go.Scatter(x=rs_alive["Umbral"], y=rs_alive["Reserva ($)"], mode='lines+markers', line=dict(color='orange')))
+                    fig_rs.update_layout(xaxis_title="Umbral Defensa", yaxis_title="Reserva necesaria ($)", xaxis_tickformat=".0%")
+                    st.plotly_chart(fig_rs, use_container_width=True)
+                st.dataframe(df_rs.style.format({"Umbral": "{:.0%}", "Reserva ($)": "${:,.0f}"}), use_container_width=True)
+
+    # --- BACKTEST DE CARTERA (MULTI-ACTIVO) ---
+    with st.expander("💼 Backtest de Cartera (Multi-Colateral)"):
+        st.caption("Posición tipo Aave con varios colaterales y una sola deuda. Usa el capital, apalancamiento, umbral y fecha de arriba.")
+        
+        pf_options = {name: tick for name, tick in ASSET_MAP.items() if tick != "MANUAL"}
+        pf_assets = st.multiselect("Colaterales", list(pf_options.keys()), default=list(pf_options.keys())[:2], key="pf_assets")
+        pf_tickers = list(dict.fromkeys(pf_options[a] for a in pf_assets))
+        
+        pf_weights, pf_lts = {}, {}
+        if pf_tickers:
+            pf_cols = st.columns(len(pf_tickers))
+            for col, tick in zip(pf_cols, pf_tickers):
+                with col:
+                    st.markdown(f"**{tick}**")
+                    pf_weights[tick] = st.number_input("Peso (%)", value=round(100.0 / len(pf_tickers), 1), min_value=0.0, step=5.0, key=f"pf_w_{tick}")
+                    pf_lts[tick] = st.number_input("LT (%)", value=c_ltv * 100, min_value=1.0, max_value=99.0, step=1.0, key=f"pf_lt_{tick}") / 100.0
+            pf_defense = st.selectbox("Activo para inyectar en las defensas", pf_tickers, key="pf_def")
+        
+        if st.button("💼 Ejecutar Backtest de Cartera", key="run_pf", disabled=not pf_tickers):
+            if sum(pf_weights.values()) <= 0:
+                st.warning("Los pesos deben sumar más de 0.")
+            else:
+                with st.spinner(f"Simulando {', '.join(pf_tickers)}..."):
+                    try:
+                        panel = fetch_panel(pf_tickers, bt_start_date, date.today())
+                        if panel is None or panel["Close"].empty:
+                            st.error("Sin datos comunes para esos activos.")
+                        else:
+                            df_pf, pf_summary = run_portfolio_backtest(panel, pf_weights, pf_lts, bt_capital, bt_leverage, bt_threshold, pf_defense)
+                            
+                            p1, p2, p3, p4 = st.columns(4)
+                            p1.metric("Resultado", "LIQUIDADO" if pf_summary["is_liquidated"] else "VIVO")
+                            p2.metric("Inyectado Total", f"${pf_summary['total_injected']:,.0f}")
+                            p3.metric("Valor Final", f"${pf_summary['final_value']:,.0f}")
+                            p4.metric("HF Objetivo", f"{pf_summary['hf_target']:.2f}")
+                            
+                            pf_plot = downsample_frame(df_pf, ["Valor Estrategia", "Inversión Acumulada", "Valor HODL"], keep=event_mask(df_pf))
+                            PfTrace = scatter_trace(len(pf_plot))
+                            fig_pf = go.Figure()
+                            fig_pf.add_trace(PfTrace(x=pf_plot.index, y=pf_plot["Valor Estrategia"], name='Estrategia', fill='tozeroy', line=dict(color='green')))
+                            fig_pf.add_trace(PfTrace(x=pf_plot.index, y=pf_plot["Inversión Acumulada"], name='Inversión', line=dict(color='red', dash='dash')))
+                            fig_pf.add_trace(PfTrace(x=pf_plot.index, y=pf_plot["Valor HODL"], name='HODL', line=dict(color='gray', dash='dot')))
+                            pf_events = df_pf[df_pf["Acción"].str.contains("DEFENSA")]
+                            if not pf_events.empty:
+                                fig_pf.add_trace(go.Scatter(x=pf_events.index, y=pf_events["Valor Estrategia"], mode='markers', name='Defensa', marker=dict(color='orange', size=10, symbol='diamond')))
+                            st.plotly_chart(fig_pf, use_container_width=True)
+                            
+                            st.write(f"Inicio: {pf_summary['start_date']} | Deuda Inicial: ${pf_summary['debt_usd']:,.0f} | Defensas: {pf_summary['defenses']}")
+                            st.dataframe(pd.DataFrame({
+                                "Precio Entrada": pf_summary["start_prices"],
+                                "Tokens Finales": pf_summary["final_amounts"]
+                            }).style.format({"Precio Entrada": "${:,.2f}", "Tokens Finales": "{:.4f}"}), use_container_width=True)
+                    except Exception as e:
+                        st.error(f"Error: {e}")
+
+    # --- ESTRÉS MONTE CARLO ---
+    with st.expander("🎲 Estrés Monte Carlo (Probabilidad de Liquidación)"):
+        st.caption(f"Genera miles de trayectorias de {bt_ticker} a partir del histórico y aplica la misma regla de defensa que el backtest.")
+        
+        col_mc1, col_mc2, col_mc3 = st.columns(3)
+        with col_mc1:
+            mcs_paths = st.select_slider("Trayectorias", [1_000, 5_000, 10_000, 25_000, 50_000, 100_000], value=10_000, key="mcs_paths")
+        with col_mc2:
+            mcs_horizon = st.number_input("Horizonte (días)", value=365, min_value=30, max_value=3650, step=30, key="mcs_h")
+        with col_mc3:
+            mcs_method = st.radio("Modelo", ["Bootstrap por bloques", "GBM"], key="mcs_m")
+            mcs_block = st.number_input("Días por bloque", value=DEFAULT_BLOCK, min_value=1, max_value=120, key="mcs_b") if mcs_method.startswith("Bootstrap") else DEFAULT_BLOCK
+        
+        if st.button("🎲 Ejecutar Monte Carlo", key="mcs_run"):
+            with st.spinner(f"Simulando {mcs_paths:,} trayectorias..."):
+                try:
+                    mcs_model = fit_returns(load_history(bt_ticker, bt_start_date, date.today()))
+                    mcs_res = simulate_paths(
+                        mcs_model, mcs_paths, int(mcs_horizon), bt_capital, bt_leverage, bt_threshold, c_ltv,
+                        method="gbm" if mcs_method == "GBM" else "bootstrap", block=int(mcs_block)
+                    )
+                    st.session_state.montecarlo_data = (mcs_res["injected"], summarize(mcs_res, bt_capital))
+                except Exception as e:
+                    st.error(f"Error: {e}")
+        
+        if st.session_state.get("montecarlo_data"):
+            mcs_injected, mcs_sum = st.session_state.montecarlo_data
+            q = mcs_sum["quantiles"]
+            mq1, mq2, mq3, mq4 = st.columns(4)
+            mq1.metric("Prob. Liquidación", f"{mcs_sum['p_liquidation']:.2%}")
+            mq2.metric("Prob. de Defender", f"{mcs_sum['p_defense']:.1%}")
+            mq3.metric("Inyección Mediana", f"${q[0.5]['injected']:,.0f}")
+            mq4.metric("Inyección P95", f"${q[0.95]['injected']:,.0f}")
+            
+            st.dataframe(
+                pd.DataFrame({
+                    "Percentil": [f"P{int(k * 100)}" for k in q],
+                    "Capital Inyectado ($)": [v["injected"] for v in q.values()],
+                    "Valor Final ($)": [v["final_value"] for v in q.values()],
+                    "ROI (%)": [v["roi"] * 100 for v in q.values()],
+                }).style.format({"Capital Inyectado ($)": "${:,.0f}", "Valor Final ($)": "${:,.0f}", "ROI (%)": "{:.1f}%"}),
+                use_container_width=True
+            )
+            fig_mc = go.Figure(go.Histogram(x=mcs_injected, nbinsx=60, marker_color="indianred"))
+            fig_mc.update_layout(xaxis_title="Capital inyectado ($)", yaxis_title="Trayectorias", title="Distribución del capital de defensa")
+            st.plotly_chart(fig_mc, use_container_width=True)
+
+with tab_backtest:
+    backtest_tab()
 
 # ------------------------------------------------------------------------------
 #  PESTAÑA 3: ESCÁNER REAL (MODO BLINDADO CON MEMORIA)
 # ------------------------------------------------------------------------------
-with tab_onchain:
+@fragment
+def onchain_tab():
     st.markdown("### 📡 Escáner Aave V3 (Modo Seguro)")
+    
+    # Cotizaciones compartidas entre sesiones: mover un slider ya no dispara una descarga
+    quote_cache = get_quote_cache([t for t in ASSET_MAP.values() if t != "MANUAL"])
     st.caption("Conexión ligera verificada. Elige tu modo de análisis abajo.")
     
     col_net1, col_net2 = st.columns([1, 3])
@@ -551,19 +721,14 @@ with tab_onchain:
             st.warning("Falta dirección")
         else:
             with st.spinner(f"Conectando a {net}..."):
-                w3, rpc_used, is_private = connect_robust(net)
-                if not w3:
-                    st.error("Error conexión RPC. Revisa tus Secrets."); st.stop()
+                rpc_pool = get_network_pool(net)
                 
                 try:
-                    # 1. Obtener Pool Real
-                    prov_addr = w3.to_checksum_address(NETWORKS[net]["pool_provider"])
-                    prov_contract = w3.eth.contract(address=prov_addr, abi=AAVE_ABI)
-                    pool_addr = prov_contract.functions.getPool().call()
-                    
-                    # 2. Llamada Ligera (getUserAccountData)
-                    pool = w3.eth.contract(address=pool_addr, abi=AAVE_ABI)
-                    data = pool.functions.getUserAccountData(w3.to_checksum_address(addr)).call()
+                    # Un solo viaje para la cuenta (red + bloque + lectura en un lote) y el desglose en paralelo
+                    with ThreadPoolExecutor(max_workers=1) as ex:
+                        reserves_future = ex.submit(read_reserves_breakdown, rpc_pool, net, addr)
+                        data, block, ep = read_account_data(rpc_pool, net, addr)
+                        st.session_state.reserves_data = reserves_future.result()
                     
                     # 3. Guardar en Memoria Session State
                     st.session_state.portfolio_data = {
@@ -571,11 +736,60 @@ with tab_onchain:
                         "debt_usd": data[1] / 10**8,
                         "lt_avg": data[3] / 10000,
                         "hf": data[5] / 10**18,
-                        "status_msg": f"🔒 Privado" if is_private else f"🌍 Público ({rpc_used[:20]}...)"
+                        "status_msg": rpc_status(ep)
                     }
+                    d = st.session_state.portfolio_data
+                    get_snapshot_store().record([snapshot_row(net, addr, d["col_usd"], d["debt_usd"], d["lt_avg"],
+                                                              d["hf"] if d["debt_usd"] > 0 else float("inf"), block)])
                 except Exception as e:
                     st.error(f"Error de lectura: {e}")
 
+    # --- BÚSQUEDA EN TODAS LAS REDES ---
+    if st.button("🌐 Buscar en todas las redes"):
+        if not addr:
+            st.warning("Falta dirección")
+        else:
+            # Los pools se preparan aquí (leen Secrets); los hilos solo hacen llamadas RPC
+            net_pools = {n: get_network_pool(n) for n in NETWORKS}
+            
+            def read_network(network_name):
+                data, block, ep = read_account_data(net_pools[network_name], network_name, addr)
+                return data, rpc_status(ep), block
+            
+            mn_rows = []
+            mn_table = st.empty()
+            with st.spinner("Consultando todas las redes a la vez..."):
+                for row in scan_networks(list(NETWORKS.keys()), read_network):
+                    mn_rows.append(row)
+                    mn_table.dataframe(pd.DataFrame(mn_rows).drop(columns=["rpc", "block"]), use_container_width=True)
+            st.session_state.multinet_data = (addr, mn_rows)
+            get_snapshot_store().record(snapshot_row(r["Red"], addr, r["col_usd"], r["debt_usd"], r["lt_avg"], r["hf"], r["block"])
+                                        for r in mn_rows if r["Estado"].startswith("✅"))
+    
+    if st.session_state.get("multinet_data"):
+        mn_addr, mn_rows = st.session_state.multinet_data
+        mn_found = [r for r in mn_rows if r["Estado"].startswith("✅")]
+        if not mn_found:
+            st.info(f"Sin posiciones Aave V3 para {mn_addr[:10]}... en ninguna red.")
+        else:
+            st.dataframe(
+                pd.DataFrame(mn_found).drop(columns=["rpc", "block"]).style.format({
+                    "col_usd": "${:,.2f}", "debt_usd": "${:,.2f}", "lt_avg": "{:.2%}", "hf": "{:.2f}"
+                }),
+                use_container_width=True
+            )
+            mn_pick = st.selectbox("Cargar posición de la red", [r["Red"] for r in mn_found], key="mn_pick")
+            if st.button("📥 Usar esta posición", key="mn_use"):
+                r = next(r for r in mn_found if r["Red"] == mn_pick)
+                st.session_state.portfolio_data = {
+                    "col_usd": r["col_usd"],
+                    "debt_usd": r["debt_usd"],
+                    "lt_avg": r["lt_avg"],
+                    "hf": r["hf"],
+                    "status_msg": f"{mn_pick} · {r['rpc']}"
+                }
+                st.session_state.reserves_data = read_reserves_breakdown(get_network_pool(mn_pick), mn_pick, mn_addr)
+
     # --- MOSTRAR DATOS DESDE MEMORIA ---
     if st.session_state.portfolio_data:
         d = st.session_state.portfolio_data
@@ -588,6 +802,18 @@ with tab_onchain:
         m3.metric("Deuda Total", f"${d['debt_usd']:,.2f}")
         m4.metric("Liq. Threshold (Avg)", f"{d['lt_avg']:.2%}")
         
+        res_df = st.session_state.get("reserves_data")
+        res_coll = res_df[res_df["as_collateral"] & (res_df["collateral"] > 0)] if res_df is not None else None
+        if res_df is not None and not res_df.empty:
+            with st.expander("🧾 Desglose por Activo (on-chain)", expanded=True):
+                st.dataframe(
+                    res_df.drop(columns=["asset", "decimals"]).style.format({
+                        "price_usd": "${:,.4f}", "collateral": "{:,.6f}", "collateral_usd": "${:,.2f}",
+                        "debt": "{:,.6f}", "debt_usd": "${:,.2f}", "lt": "{:.2%}"
+                    }),
+                    use_container_width=True
+                )
+        
         if d['debt_usd'] > 0:
             st.divider()
             st.subheader("🛠️ Estrategia de Defensa")
@@ -604,59 +830,45 @@ with tab_onchain:
             if "Activo Único" in mode:
                 c_sel, c_par = st.columns(2)
                 with c_sel:
-                    sim_asset = st.selectbox("¿Cuál es tu colateral principal?", list(ASSET_MAP.keys()), key="oc_asset")
-                    ticker = ASSET_MAP[sim_asset] if ASSET_MAP[sim_asset] != "MANUAL" else st.text_input("Ticker", "ETH-USD", key="oc_tick")
+                    # Si tenemos el desglose on-chain, se usan las cantidades reales de cada activo
+                    onchain_opts = [f"⛓️ {sym} (on-chain)" for sym in res_coll["symbol"]] if res_coll is not None else []
+                    sim_asset = st.selectbox("¿Cuál es tu colateral principal?", onchain_opts + list(ASSET_MAP.keys()), key="oc_asset")
+                    use_onchain = sim_asset in onchain_opts
+                    if not use_onchain:
+                        ticker = ASSET_MAP[sim_asset] if ASSET_MAP[sim_asset] != "MANUAL" else st.text_input("Ticker", "ETH-USD", key="oc_tick")
                 with c_par:
                     # Umbral mínimo bajado al 5%
                     def_th = st.number_input("Umbral Defensa (%)", 5.0, step=1.0, key="oc_th") / 100.0
-                    zones = st.slider("Zonas", 1, 10, 5, key="oc_z")
+                    zones = st.slider("Zonas", 1, 30, 5, key="oc_z")
                     
                 try:
-                    curr_p = yf.Ticker(ticker).history(period="1d")['Close'].iloc[-1]
-                    st.metric(f"Precio Mercado ({ticker})", f"${curr_p:,.2f}")
-                    
-                    # Ingeniería inversa
-                    implied_amt = d['col_usd'] / curr_p
-                    liq_price_real = d['debt_usd'] / (implied_amt * d['lt_avg'])
-                    cushion = (curr_p - liq_price_real) / curr_p
-                    st.metric("Precio Liquidación Actual", f"${liq_price_real:,.2f}", f"{cushion:.2%} Colchón")
-                    
-                    ratio_target = liq_price_real / curr_p
-                    s_data = []
-                    s_curr_c, s_curr_l, s_cum = implied_amt, liq_price_real, 0.0
-                    
-                    for i in range(1, zones+1):
-                        trig = s_curr_l * (1 + def_th)
-                        targ = trig * ratio_target
-                        
-                        # Cantidad necesaria
-                        needed_amt = d['debt_usd'] / (targ * d['lt_avg'])
-                        add_amt = max(0, needed_amt - s_curr_c)
-                        
-                        cost_usd = add_amt * trig
-                        s_cum += cost_usd
-                        s_curr_c += add_amt
-                        
-                        # Nuevo HF al inyectar
-                        new_col_usd = s_curr_c * trig
-                        new_hf = (new_col_usd * d['lt_avg']) / d['debt_usd']
+                    if use_onchain:
+                        sym = res_coll["symbol"].iloc[onchain_opts.index(sim_asset)]
+                        asset_amt, curr_p, asset_lt, debt_eff = single_asset_view(res_df, sym)
+                        st.metric(f"Precio Oráculo ({sym})", f"${curr_p:,.2f}")
+                    else:
+                        curr_p = quote_cache.get(ticker)
+                        st.metric(f"Precio Mercado ({ticker})", f"${curr_p:,.2f}")
                         
-                        s_data.append({
-                            "Zona": f"#{i}", 
-                            "Precio Activación": trig, 
-                            "Inyectar (Tokens)": add_amt, 
-                            "Costo ($)": cost_usd, 
-                            "Acumulado ($)": s_cum, 
-                            "Nuevo Liq": targ, 
-                            "Nuevo HF": new_hf
-                        })
-                        s_curr_l = targ
+                        # Ingeniería inversa (todo el colateral como un solo activo)
+                        asset_amt, asset_lt, debt_eff = d['col_usd'] / curr_p, d['lt_avg'], d['debt_usd']
+                    
+                    if debt_eff <= 0:
+                        st.success("El resto de colaterales ya cubre la deuda: este activo no puede liquidarte por sí solo.")
+                    else:
+                        liq_price_real = debt_eff / (asset_amt * asset_lt)
+                        cushion = (curr_p - liq_price_real) / curr_p
+                        st.metric("Precio Liquidación Actual", f"${liq_price_real:,.2f}", f"{cushion:.2%} Colchón")
                         
-                    st.dataframe(pd.DataFrame(s_data).style.format({
-                        "Precio Activación": "${:,.2f}", "Costo ($)": "${:,.0f}", 
-                        "Acumulado ($)": "${:,.0f}", "Nuevo Liq": "${:,.2f}", 
-                        "Nuevo HF": "{:.2f}", "Inyectar (Tokens)": "{:.4f}"
-                    }), use_container_width=True)
+                        with span("plan.mode_a", zones=zones):
+                            df_a = mode_a_plan(curr_p, asset_amt, asset_lt, debt_eff, d['debt_usd'], def_th, zones)
+                            
+                        with span("render.table", table="modo_a"):
+                            st.dataframe(df_a.style.format({
+                                "Precio Activación": "${:,.2f}", "Costo ($)": "${:,.0f}", 
+                                "Acumulado ($)": "${:,.0f}", "Nuevo Liq": "${:,.2f}", 
+                                "Nuevo HF": "{:.2f}", "Inyectar (Tokens)": "{:.4f}"
+                            }), use_container_width=True)
                     
                 except Exception as ex:
                     st.error(f"Error precio: {ex}")
@@ -675,7 +887,7 @@ with tab_onchain:
                     w_ticker = ASSET_MAP[witness_asset] if ASSET_MAP[witness_asset] != "MANUAL" else "ETH-USD"
                 
                 try:
-                    w_price = yf.Ticker(w_ticker).history(period="1d")['Close'].iloc[-1]
+                    w_price = quote_cache.get(w_ticker)
                 except: w_price = 0
 
                 current_hf = d['hf']
@@ -683,44 +895,160 @@ with tab_onchain:
                 if current_hf <= 1.0:
                     st.error("La posición ya está en rango de liquidación (HF < 1.0)")
                 else:
-                    hf_gap = current_hf - 1.0
-                    hf_step = hf_gap / num_defenses
+                    with span("plan.mode_b", defenses=num_defenses):
+                        mc_data = mode_b_plan(d['col_usd'], d['debt_usd'], d['lt_avg'], current_hf, num_defenses, w_price, w_ticker)
                     
-                    mc_data = []
+                    with span("render.table", table="modo_b"):
+                        st.dataframe(
+                            mc_data.style.format({
+                                "Capital a Restaurar ($)": "${:,.2f}",
+                                f"Precio {w_ticker}": "${:,.2f}"
+                            }).background_gradient(subset=["Capital a Restaurar ($)"], cmap="Reds"), 
+                            use_container_width=True
+                        )
                     
-                    for i in range(1, num_defenses + 1):
-                        trigger_hf = current_hf - (hf_step * i)
-                        if trigger_hf <= 1.001: trigger_hf = 1.001
-                        
-                        drop_pct = 1 - (trigger_hf / current_hf)
-                        shocked_col = d['col_usd'] * (1 - drop_pct)
-                        shocked_lt_val = (d['col_usd'] * d['lt_avg']) * (1 - drop_pct)
-                        
-                        needed_capital = d['debt_usd'] - (shocked_lt_val / current_hf)
-                        if needed_capital < 0: needed_capital = 0
+                    # --- SHOCKS CORRELACIONADOS ---
+                    with st.expander("🎲 Matriz de Shocks Correlacionados"):
+                        st.caption("En lugar de una caída uniforme, cada activo se mueve según la covarianza de su histórico. "
+                                   "Las stablecoins se tratan como precio fijo.")
+                        if res_df is not None and not res_df.empty:
+                            exposures = position_exposures(res_df)
+                        else:
+                            # Sin desglose on-chain: todo el colateral como el activo testigo y deuda en dólares
+                            exposures = pd.DataFrame({"col_lt_usd": [d['col_usd'] * d['lt_avg'], 0.0], "debt_usd": [0.0, d['debt_usd']]},
+                                                     index=[w_ticker, STABLE_TICKER])
+                        st.write("Exposición: " + ", ".join(f"{t} (col. ${r.col_lt_usd:,.0f} / deuda ${r.debt_usd:,.0f})" for t, r in exposures.iterrows()))
                         
-                        w_price_shock = w_price * (1 - drop_pct)
+                        sh1, sh2, sh3 = st.columns(3)
+                        sh_horizon = sh1.number_input("Horizonte (días)", value=7, min_value=1, max_value=90, key="sh_horizon")
+                        sh_n = sh2.select_slider("Escenarios", [5_000, 20_000, 50_000, 100_000], value=20_000, key="sh_n")
+                        sh_method = sh3.selectbox("Modelo", [METHOD_NORMAL, METHOD_HISTORICAL], key="sh_method",
+                                                  format_func=lambda m: "Normal correlacionada" if m == METHOD_NORMAL else "Histórico (remuestreo)")
                         
-                        final_debt = d['debt_usd'] - needed_capital
-                        if final_debt > 0:
-                            final_hf = (shocked_col * d['lt_avg']) / final_debt
-                        else:
-                            final_hf = 999.0
+                        if st.button("🎲 Simular Shocks", key="run_shocks"):
+                            with st.spinner(f"Estimando covarianza de {len(exposures)} activos..."):
+                                try:
+                                    with span("shocks.fit", assets=len(exposures)):
+                                        shock_model = fit_shock_model(load_returns(list(exposures.index)), int(sh_horizon))
+                                    with span("shocks.simulate", scenarios=sh_n):
+                                        st.session_state.shock_data = shock_table(exposures, shock_model, current_hf, sh_n, sh_method)
+                                except Exception as e:
+                                    st.error(f"Error: {e}")
                         
-                        mc_data.append({
-                            "Trigger HF": f"{trigger_hf:.2f}",
-                            "Caída Mercado": f"-{drop_pct:.2%}",
-                            f"Precio {w_ticker}": w_price_shock,
-                            "Capital a Restaurar ($)": needed_capital,
-                            "Nuevo HF": f"{final_hf:.2f}"
-                        })
-                    
-                    st.dataframe(
-                        pd.DataFrame(mc_data).style.format({
-                            "Capital a Restaurar ($)": "${:,.2f}",
-                            f"Precio {w_ticker}": "${:,.2f}"
-                        }).background_gradient(subset=["Capital a Restaurar ($)"], cmap="Reds"), 
-                        use_container_width=True
-                    )
+                        if st.session_state.get("shock_data"):
+                            df_sh, p_liq = st.session_state.shock_data
+                            st.metric("Probabilidad de HF < 1 en el horizonte", f"{p_liq:.2%}")
+                            st.dataframe(df_sh.style.format({
+                                "Caída Colateral": "{:.2%}", "HF": "{:.2f}", "Capital a Restaurar ($)": "${:,.2f}"
+                            }).background_gradient(subset=["Capital a Restaurar ($)"], cmap="Reds"), use_container_width=True)
         else:
             st.success("Sin deuda activa.")
+
+    # --- ESCÁNER DE WATCHLIST (MULTICALL3) ---
+    st.divider()
+    with st.expander("📋 Escáner de Watchlist (Multicall3)"):
+        st.caption(f"Lee cientos o miles de wallets en {net} empaquetando getUserAccountData en lotes aggregate3.")
+        wl_text = st.text_area("Wallets (una por línea o separadas por comas)", height=150, key="wl_text")
+        wl_file = st.file_uploader("...o sube un CSV/TXT", type=["csv", "txt"], key="wl_file")
+        wl_chunk = st.number_input("Wallets por llamada", value=DEFAULT_CHUNK_SIZE, min_value=10, max_value=5000, step=50, key="wl_chunk")
+        
+        if 'watchlist_data' not in st.session_state:
+            st.session_state.watchlist_data = None
+        
+        if st.button("📋 Escanear Watchlist", key="wl_run"):
+            raw_text = wl_text + ("\n" + wl_file.getvalue().decode("utf-8", errors="ignore") if wl_file else "")
+            wl_addrs, wl_bad = parse_addresses(raw_text)
+            if wl_bad:
+                st.warning(f"Ignoradas {len(wl_bad)} entradas no válidas.")
+            if not wl_addrs:
+                st.warning("Falta dirección")
+            else:
+                with st.spinner(f"Escaneando {len(wl_addrs):,} wallets en {net}..."):
+                    rpc_pool = get_network_pool(net)
+                    with span("rpc.connect", network=net):
+                        rpc_best = rpc_pool.best()
+                    if rpc_best is None:
+                        st.error("Error conexión RPC. Revisa tus Secrets."); st.stop()
+                    
+                    def read_watchlist(w3):
+                        # Fijado a un bloque: todas las wallets del histórico comparten la misma foto
+                        block = w3.eth.block_number
+                        return scan_accounts(w3, pool_address(w3, net), wl_addrs, int(wl_chunk), block_identifier=block), block
+                    
+                    try:
+                        ((df_wl, wl_calls), wl_block), _ = rpc_pool.call(read_watchlist)
+                        st.session_state.watchlist_data = (net, df_wl, wl_calls)
+                        get_snapshot_store().record(rows_from_frame(net, df_wl, wl_block))
+                    except Exception as e:
+                        st.error(f"Error de lectura: {e}")
+        
+        if st.session_state.watchlist_data:
+            wl_net, df_wl, wl_calls = st.session_state.watchlist_data
+            at_risk = df_wl[(df_wl["debt_usd"] > 0) & (df_wl["hf"] < 1.1)]
+            wl_c1, wl_c2, wl_c3 = st.columns(3)
+            wl_c1.metric("Wallets", f"{len(df_wl):,}")
+            wl_c2.metric("En riesgo (HF < 1.1)", f"{len(at_risk):,}")
+            wl_c3.metric("Llamadas RPC", f"{wl_calls}")
+            st.caption(f"Red: {wl_net}")
+            st.dataframe(
+                df_wl.style.format({
+                    "col_usd": "${:,.2f}", "debt_usd": "${:,.2f}", "lt_avg": "{:.2%}", "hf": "{:.3f}"
+                }, na_rep="-"),
+                use_container_width=True
+            )
+
+    # --- HISTÓRICO LOCAL ---
+    with st.expander("🗂️ Histórico Local de Escaneos"):
+        snap_store = get_snapshot_store()
+        snap_rows, snap_wallets = snap_store.count()
+        st.caption(f"Cada lectura se guarda en local: {snap_rows:,} lecturas de {snap_wallets:,} wallets. Sin llamadas RPC.")
+        
+        hist_addr = st.text_input("Wallet", value=addr or "", key="snap_addr")
+        if hist_addr:
+            df_snap = snap_store.history(hist_addr.strip())
+            if df_snap.empty:
+                st.info("Sin lecturas guardadas de esa wallet.")
+            else:
+                fig_snap = go.Figure()
+                for snap_net, g in df_snap.groupby("network"):
+                    g = g[g["debt_usd"] > 0]
+                    fig_snap.add_trace(go.Scatter(x=g["datetime"], y=g["hf"], mode='lines+markers', name=snap_net))
+                fig_snap.add_hline(y=1.0, line_dash="dash", line_color="red")
+                fig_snap.update_layout(yaxis_title="HF")
+                st.plotly_chart(fig_snap, use_container_width=True)
+        
+        snap_max_hf = st.number_input("Wallets con HF por debajo de", value=1.3, min_value=1.0, step=0.05, key="snap_max_hf")
+        df_below = snap_store.below(snap_max_hf)
+        st.write(f"**{len(df_below):,}** wallets según su última lectura")
+        if not df_below.empty:
+            st.dataframe(
+                df_below.drop(columns=["ts"]).style.format({
+                    "col_usd": "${:,.2f}", "debt_usd": "${:,.2f}", "lt_avg": "{:.2%}", "hf": "{:.3f}"
+                }, na_rep="-"),
+                use_container_width=True
+            )
+
+    with st.expander("🩺 Estado de los RPC"):
+        st.caption("Latencia media y tasa de error de cada endpoint del pool compartido (se sondean en paralelo).")
+        if st.button("🔄 Sondear ahora", key="rpc_probe"):
+            get_network_pool(net).probe_all()
+        st.dataframe(pd.DataFrame(get_network_pool(net).stats()), use_container_width=True)
+
+with tab_onchain:
+    onchain_tab()
+
+# ==============================================================================
+#  PANEL DE DEPURACIÓN (TIEMPOS POR ETAPA)
+# ==============================================================================
+# Solo con DEBUG_PANEL = true en Secrets: las métricas del proceso no son para cualquier visitante
+with st.sidebar:
+    if "DEBUG_PANEL" in st.secrets and st.secrets["DEBUG_PANEL"] and st.checkbox("🐞 Panel de depuración", key="debug_panel"):
+        st.caption("Etapas medidas en esta ejecución (RPC, descargas, simulación, render).")
+        if run_spans:
+            df_spans = pd.DataFrame(run_spans)
+            st.dataframe(df_spans, use_container_width=True)
+            st.metric("Total medido", f"{df_spans['ms'].sum():,.1f} ms")
+        else:
+            st.info("Nada medido todavía en esta ejecución.")
+        with st.expander("Métricas del proceso (Prometheus)"):
+            st.code(REGISTRY.render(), language="text")
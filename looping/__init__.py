@@ -0,0 +1,5 @@
+"""Núcleo de Looping Master sin Streamlit: motor de backtest, cascada de defensas y lectura on-chain.
+
+Los módulos no se importan aquí a propósito: cada uno carga sus dependencias
+pesadas (yfinance, web3, eth_abi) solo cuando de verdad las necesita.
+"""
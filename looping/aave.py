@@ -0,0 +1,160 @@
+import threading
+import time
+
+from .metrics import span
+from .reserves import read_user_reserves
+from .rpc_pool import get_pool
+
+# ==============================================================================
+#  CONFIGURACIÓN DE REDES Y CONTRATOS AAVE V3
+# ==============================================================================
+
+# Usamos 'pool_provider' (AddressProvider) para encontrar siempre la dirección correcta del Pool
+NETWORKS = {
+    "Base": {
+        "chain_id": 8453,
+        "rpcs": ["https://base.drpc.org", "https://mainnet.base.org"],
+        "pool_provider": "0xe20fCBdBfFC4Dd138cE8b2E6FBb6CB49777ad64D"
+    },
+    "Arbitrum": {
+        "chain_id": 42161,
+        "rpcs": ["https://arb1.arbitrum.io/rpc", "https://rpc.ankr.com/arbitrum"],
+        "pool_provider": "0xa97684ead0e402dC232d5A977953DF7ECBaB3CDb"
+    },
+    "Ethereum": {
+        "chain_id": 1,
+        "rpcs": ["https://eth.llamarpc.com", "https://rpc.ankr.com/eth"],
+        "pool_provider": "0x2f39d218133AFaB8F2B819B1066c7E434Ad94E9e"
+    },
+    "Optimism": {
+        "chain_id": 10,
+        "rpcs": ["https://mainnet.optimism.io", "https://rpc.ankr.com/optimism"],
+        "pool_provider": "0xa97684ead0e402dC232d5A977953DF7ECBaB3CDb"
+    },
+    "Polygon": {
+        "chain_id": 137,
+        "rpcs": ["https://polygon-rpc.com", "https://rpc.ankr.com/polygon"],
+        "pool_provider": "0xa97684ead0e402dC232d5A977953DF7ECBaB3CDb"
+    },
+    "Avalanche": {
+        "chain_id": 43114,
+        "rpcs": ["https://api.avax.network/ext/bc/C/rpc"],
+        "pool_provider": "0xa97684ead0e402dC232d5A977953DF7ECBaB3CDb"
+    }
+}
+
+# ABI LIGERO (Solo lo necesario para conectar y leer totales rápidamente)
+AAVE_ABI = [
+    {
+        "inputs": [],
+        "name": "getPool",
+        "outputs": [{"internalType": "address", "name": "", "type": "address"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [{"internalType": "address", "name": "user", "type": "address"}],
+        "name": "getUserAccountData",
+        "outputs": [
+            {"internalType": "uint256", "name": "totalCollateralBase", "type": "uint256"},
+            {"internalType": "uint256", "name": "totalDebtBase", "type": "uint256"},
+            {"internalType": "uint256", "name": "availableBorrowsBase", "type": "uint256"},
+            {"internalType": "uint256", "name": "currentLiquidationThreshold", "type": "uint256"},
+            {"internalType": "uint256", "name": "ltv", "type": "uint256"},
+            {"internalType": "uint256", "name": "healthFactor", "type": "uint256"}
+        ],
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+
+# Selectores precalculados (keccak de la firma) para las lecturas en lote
+GET_POOL_SELECTOR = "0x026b1d5f"  # getPool()
+ACCOUNT_DATA_TYPES = ["uint256"] * 6
+
+# El Pool de cada red casi nunca cambia: se resuelve una vez y se reutiliza
+POOL_ADDRESS_TTL = 24 * 3600
+
+_pool_addresses = {}
+_pool_lock = threading.Lock()
+
+# ==============================================================================
+#  LECTURAS ON-CHAIN
+# ==============================================================================
+
+
+def network_pool(network_name, preferred=()):
+    """Pool RPC compartido de la red; `preferred` son RPC privados que van primero"""
+    config = NETWORKS[network_name]
+    return get_pool(network_name, config["chain_id"], config["rpcs"], preferred)
+
+
+def cached_pool_address(network_name):
+    """Dirección del Pool ya resuelta (None si no se conoce o caducó)"""
+    with _pool_lock:
+        hit = _pool_addresses.get(network_name)
+    return hit[0] if hit and time.time() - hit[1] < POOL_ADDRESS_TTL else None
+
+
+def remember_pool_address(network_name, address):
+    with _pool_lock:
+        if address is None:
+            _pool_addresses.pop(network_name, None)
+        else:
+            _pool_addresses[network_name] = (address, time.time())
+
+
+def pool_address(w3, network_name):
+    """Dirección real del Pool, resuelta a través del AddressProvider de la red (cacheada por red)"""
+    address = cached_pool_address(network_name)
+    if address is None:
+        prov_addr = w3.to_checksum_address(NETWORKS[network_name]["pool_provider"])
+        address = w3.eth.contract(address=prov_addr, abi=AAVE_ABI).functions.getPool().call()
+        remember_pool_address(network_name, address)
+    return address
+
+
+def _resolve_pool_address(rpc_pool, network_name):
+    from eth_abi import decode
+    from web3 import Web3
+
+    with span("aave.getPool", network=network_name):
+        (raw,), _ = rpc_pool.batch([("eth_call", [{"to": NETWORKS[network_name]["pool_provider"], "data": GET_POOL_SELECTOR}, "latest"])])
+    address = Web3.to_checksum_address(decode(["address"], bytes.fromhex(raw[2:]))[0])
+    remember_pool_address(network_name, address)
+    return address
+
+
+def read_account_data(rpc_pool, network_name, user):
+    """Lee getUserAccountData de una wallet en un solo viaje JSON-RPC.
+
+    El lote lleva eth_chainId (verifica la red), eth_blockNumber y la lectura;
+    si el RPC falla, el pool reintenta en el siguiente mejor. Solo la primera
+    vez por red hace falta un viaje previo para resolver el Pool. Devuelve
+    (datos crudos, bloque, endpoint usado).
+    """
+    from eth_abi import decode
+    from web3 import Web3
+
+    from .multicall import account_data_calldata
+
+    pool_addr = cached_pool_address(network_name) or _resolve_pool_address(rpc_pool, network_name)
+    call = {"to": pool_addr, "data": "0x" + account_data_calldata(Web3.to_checksum_address(user)).hex()}
+    with span("aave.getUserAccountData", network=network_name):
+        # El bloque es el último al responder; la lectura "latest" es de ese bloque salvo carrera de milisegundos
+        (block_hex, raw), ep = rpc_pool.batch([("eth_blockNumber", []), ("eth_call", [call, "latest"])])
+    if len(raw) < 2 + 64 * len(ACCOUNT_DATA_TYPES):
+        # Respuesta vacía: el Pool cacheado ya no es el de la red
+        remember_pool_address(network_name, None)
+        raise RuntimeError(f"getUserAccountData vacío en {pool_addr}")
+    return decode(ACCOUNT_DATA_TYPES, bytes.fromhex(raw[2:])), int(block_hex, 16), ep
+
+
+def read_reserves_breakdown(rpc_pool, network_name, user):
+    """Desglose por reserva (saldos reales por activo); None si la red no lo permite"""
+    try:
+        df, _ = rpc_pool.call(lambda w3: read_user_reserves(w3, network_name, NETWORKS[network_name]["pool_provider"], user),
+                              probe=False)
+        return df
+    except Exception:
+        return None
@@ -0,0 +1,198 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from .metrics import record_backtest, span
+
+# ==============================================================================
+#  MOTOR DE BACKTEST (SIN STREAMLIT)
+# ==============================================================================
+# Máquina de estados de defensa/liquidación sobre arrays NumPy. Entre dos
+# eventos el precio de liquidación y el colateral no cambian, así que en lugar
+# de recorrer vela a vela saltamos directamente a la siguiente vela que toca el
+# trigger y rellenamos el tramo intermedio de golpe.
+
+ACTION_HOLD = "Hold"
+ACTION_DEFENSE = "DEFENSA 🛡️"
+ACTION_LIQUIDATED = "LIQUIDATED ☠️"
+
+RESULT_COLUMNS = ["Acción", "Liq Price", "Inversión Acumulada", "Valor Estrategia", "Valor HODL"]
+
+
+def initial_position(capital, leverage, ltv, start_price):
+    """Devuelve (colateral en tokens, deuda USD, precio liq., ratio objetivo) de la posición inicial"""
+    collateral_usd = capital * leverage
+    debt_usd = collateral_usd - capital
+    collateral_amt = collateral_usd / start_price
+    liq_price = debt_usd / (collateral_amt * ltv)
+    target_ratio = liq_price / start_price
+    return collateral_amt, debt_usd, liq_price, target_ratio
+
+
+def next_event(lows, start, liq_price, threshold):
+    """Índice de la siguiente vela (>= start) cuyo mínimo toca trigger o liquidación, o None"""
+    barrier = max(liq_price * (1 + threshold), liq_price)
+    n = lows.size
+    # Ventana creciente: los eventos suelen llegar en rachas, así que casi
+    # nunca hace falta comparar el resto completo de la serie
+    window = 16
+    while start < n:
+        stop = min(n, start + window)
+        hits = (lows[start:stop] <= barrier).nonzero()[0]
+        if hits.size:
+            return start + int(hits[0])
+        start = stop
+        window *= 4
+    return None
+
+
+def simulate_defense(opens, lows, closes, capital, leverage, threshold, ltv, start_price=None,
+                     state=None):
+    """Simula la estrategia de defensa en cascada sobre arrays Open/Low/Close.
+
+    Devuelve un dict con los arrays por vela (acción, liq, inversión, valor, hodl),
+    el número de velas procesadas (se corta en la liquidación) y el estado final.
+    Si se pasa `state` (estado final de una llamada previa) se continúa desde ahí.
+    """
+    opens = np.asarray(opens, dtype=float)
+    lows = np.asarray(lows, dtype=float)
+    closes = np.asarray(closes, dtype=float)
+    n = closes.size
+
+    if state is None:
+        if start_price is None:
+            start_price = float(closes[0])
+        collateral_amt, debt_usd, liq_price, target_ratio = initial_position(capital, leverage, ltv, start_price)
+        state = {
+            "start_price": start_price,
+            "collateral_amt": collateral_amt,
+            "debt_usd": debt_usd,
+            "liq_price": liq_price,
+            "target_ratio": target_ratio,
+            "total_injected": 0.0,
+            "is_liquidated": False,
+            "events": 0,
+        }
+    else:
+        state = dict(state)
+
+    start_price = state["start_price"]
+    collateral_amt = state["collateral_amt"]
+    debt_usd = state["debt_usd"]
+    liq_price = state["liq_price"]
+    target_ratio = state["target_ratio"]
+    total_injected = state["total_injected"]
+    is_liquidated = state["is_liquidated"]
+
+    actions = np.full(n, ACTION_HOLD, dtype=object)
+    liq_arr = np.empty(n)
+    collat_arr = np.empty(n)
+    inj_arr = np.empty(n)
+
+    pos = 0
+    end = n
+    while pos < n and not is_liquidated:
+        idx = next_event(lows, pos, liq_price, threshold)
+        seg_end = n if idx is None else idx
+
+        # Tramo sin eventos: estado constante
+        liq_arr[pos:seg_end] = liq_price
+        collat_arr[pos:seg_end] = collateral_amt
+        inj_arr[pos:seg_end] = total_injected
+        if idx is None:
+            break
+
+        trigger_price = liq_price * (1 + threshold)
+        if lows[idx] <= trigger_price:
+            defense_price = min(opens[idx], trigger_price)
+
+            if defense_price <= liq_price:
+                is_liquidated = True
+                actions[idx] = ACTION_LIQUIDATED
+            else:
+                target_liq_new = defense_price * target_ratio
+                needed_collat_amt = debt_usd / (target_liq_new * ltv)
+                add_collat_amt = needed_collat_amt - collateral_amt
+
+                if add_collat_amt > 0:
+                    total_injected += add_collat_amt * defense_price
+                    collateral_amt += add_collat_amt
+                    liq_price = target_liq_new
+                    actions[idx] = ACTION_DEFENSE
+                    state["events"] += 1
+
+        if lows[idx] <= liq_price and not is_liquidated:
+            is_liquidated = True
+
+        liq_arr[idx] = liq_price
+        collat_arr[idx] = collateral_amt
+        inj_arr[idx] = total_injected
+        pos = idx + 1
+        if is_liquidated:
+            end = idx + 1
+
+    values = collat_arr[:end] * closes[:end] - debt_usd
+    liq_out = liq_arr[:end].copy()
+    if is_liquidated:
+        values[-1] = 0.0
+        liq_out[-1] = 0.0
+
+    state.update({
+        "collateral_amt": collateral_amt,
+        "liq_price": liq_price,
+        "total_injected": total_injected,
+        "is_liquidated": is_liquidated,
+    })
+
+    return {
+        "rows": end,
+        "Acción": actions[:end],
+        "Liq Price": liq_out,
+        "Inversión Acumulada": capital + inj_arr[:end],
+        "Valor Estrategia": values,
+        "Valor HODL": (capital / start_price) * closes[:end],
+        "state": state,
+    }
+
+
+def ohlc_arrays(df_hist):
+    """Normaliza la salida de yf.download y devuelve (índice, open, low, close) sin velas vacías"""
+    if isinstance(df_hist.columns, pd.MultiIndex):
+        df_hist = df_hist.copy()
+        df_hist.columns = df_hist.columns.get_level_values(0)
+    df_hist = df_hist[df_hist["Close"].notna()]
+    return (
+        df_hist.index,
+        df_hist["Open"].to_numpy(dtype=float),
+        df_hist["Low"].to_numpy(dtype=float),
+        df_hist["Close"].to_numpy(dtype=float),
+    )
+
+
+def run_backtest(df_hist, capital, leverage, threshold, ltv):
+    """Ejecuta el backtest sobre un DataFrame OHLC y devuelve (df_res, resumen)"""
+    index, opens, lows, closes = ohlc_arrays(df_hist)
+    if closes.size == 0:
+        return pd.DataFrame(columns=RESULT_COLUMNS), None
+
+    t0 = time.perf_counter()
+    with span("backtest.simulate", bars=closes.size):
+        sim = simulate_defense(opens, lows, closes, capital, leverage, threshold, ltv)
+    rows = sim["rows"]
+    record_backtest("daily", rows, time.perf_counter() - t0)
+
+    df_res = pd.DataFrame({col: sim[col] for col in RESULT_COLUMNS}, index=index[:rows])
+    df_res.index.name = "Fecha"
+
+    state = sim["state"]
+    summary = {
+        "start_date": index[0].date() if hasattr(index[0], "date") else index[0],
+        "start_price": state["start_price"],
+        "debt_usd": state["debt_usd"],
+        "is_liquidated": state["is_liquidated"],
+        "total_injected": state["total_injected"],
+        "defenses": state["events"],
+        "final_value": float(df_res["Valor Estrategia"].iloc[-1]) if rows else 0.0,
+    }
+    return df_res, summary
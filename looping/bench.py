@@ -0,0 +1,223 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .backtest_engine import run_backtest
+from .cascade import capital_surface
+from .multicall import account_frame, decode_account_data
+from .plans import calculator_plan, mode_a_plan, mode_b_plan
+
+# ==============================================================================
+#  BENCHMARKS REPRODUCIBLES (SIN RED)
+# ==============================================================================
+# Datos sintéticos con semilla fija y respuestas de getUserAccountData ya
+# codificadas: nada toca Yahoo ni RPC. Cada caso se mide `repeat` veces tras
+# un calentamiento y en una pasada aparte con tracemalloc para el pico de
+# memoria (tracemalloc ralentiza, por eso no se mezcla con los tiempos).
+#
+# python -m looping bench --out bench.json
+# python -m looping bench --compare bench_base.json
+
+SEED = 20240101
+REGRESSION_TOLERANCE = 0.10    # 10% más lento que la referencia = regresión
+
+# Velas por año según resolución (cripto cotiza 24/7)
+BARS_PER_YEAR = {"1d": 365, "1h": 365 * 24}
+
+# Respuestas grabadas de getUserAccountData (6 uint256): colateral y deuda en
+# base 1e8, LT y LTV en bps, HF en 1e18. La de sin deuda devuelve HF = uint256 máx.
+UINT256_MAX = 2 ** 256 - 1
+RECORDED_ACCOUNT_DATA = [
+    (2_512_345_678_901, 1_203_456_789_012, 650_000_000_000, 8_250, 8_000, 1_722_000_000_000_000_000),
+    (98_765_432_100, 71_234_567_800, 2_100_000_000, 7_800, 7_300, 1_081_500_000_000_000_000),
+    (5_000_000_000, 0, 4_000_000_000, 8_300, 8_050, UINT256_MAX),
+    (40_000_000_000_000, 30_500_000_000_000, 1_200_000_000_000, 8_000, 7_700, 1_049_180_327_868_852_459),
+    (0, 0, 0, 0, 0, UINT256_MAX),
+]
+
+
+def synthetic_ohlc(years, interval="1d", seed=SEED, start_price=30000.0, annual_vol=0.8):
+    """OHLC sintético (GBM con mechas) con el mismo formato que load_history"""
+    n = int(years * BARS_PER_YEAR[interval])
+    rng = np.random.default_rng(seed)
+    step_vol = annual_vol / np.sqrt(BARS_PER_YEAR[interval])
+    closes = start_price * np.exp(np.cumsum(rng.normal(0.0, step_vol, n)))
+    opens = np.concatenate(([start_price], closes[:-1]))
+    wick = np.abs(rng.normal(0.0, step_vol, n))
+    lows = np.minimum(opens, closes) * (1 - wick)
+    highs = np.maximum(opens, closes) * (1 + wick)
+    freq = "D" if interval == "1d" else "h"
+    index = pd.date_range("2015-01-01", periods=n, freq=freq, name="Date")
+    return pd.DataFrame({"Open": opens, "High": highs, "Low": lows, "Close": closes}, index=index)
+
+
+def encode_account_data(values):
+    """Codifica una tupla de 6 enteros como returnData ABI (6 palabras de 32 bytes)"""
+    return b"".join(int(v).to_bytes(32, "big") for v in values)
+
+
+def account_results(n, fail_every=50):
+    """n respuestas (success, returnData) a partir de las grabadas, con algún fallo intercalado"""
+    payloads = [encode_account_data(v) for v in RECORDED_ACCOUNT_DATA]
+    return [(False, b"") if fail_every and i % fail_every == fail_every - 1 else (True, payloads[i % len(payloads)])
+            for i in range(n)]
+
+
+# ==============================================================================
+#  CASOS
+# ==============================================================================
+
+
+def _cases(quick=False):
+    """Lista de (nombre, preparación, función, unidades procesadas por llamada, unidad)"""
+    cases = []
+
+    # Cascada de la Calculadora y mapa Apalancamiento × Umbral (sin la memoización, salvo el caso _memo)
+    cases.append(("calculator_plan_30z", None,
+                  lambda _: calculator_plan.__wrapped__(100000.0, 130000.0, 10000.0, 2.0, 0.78, 0.15, 30), 30, "zonas"))
+    cases.append(("calculator_plan_30z_memo", None,
+                  lambda _: calculator_plan(100000.0, 130000.0, 10000.0, 2.0, 0.78, 0.15, 30), 30, "zonas"))
+    levs, ths = np.round(np.arange(1.1, 5.0 + 1e-9, 0.1), 2), np.round(np.arange(0.01, 0.505, 0.01), 2)
+    cases.append(("capital_surface_40x50", None,
+                  lambda _: capital_surface(10000.0, 100000.0, 0.78, levs, ths, 5), levs.size * ths.size, "celdas"))
+
+    # Planes del escáner
+    cases.append(("mode_a_plan_30z", None,
+                  lambda _: mode_a_plan.__wrapped__(3000.0, 10.0, 0.825, 18000.0, 20000.0, 0.10, 30), 30, "zonas"))
+    cases.append(("mode_b_plan_10d", None,
+                  lambda _: mode_b_plan.__wrapped__(25000.0, 12000.0, 0.825, 1.72, 10, 3000.0, "ETH-USD"), 10, "defensas"))
+
+    # Backtest sobre las distintas longitudes de histórico
+    sizes = [(1, "1d"), (5, "1d"), (10, "1d"), (1, "1h")] if quick else \
+            [(1, "1d"), (5, "1d"), (10, "1d"), (1, "1h"), (5, "1h"), (10, "1h")]
+    for years, interval in sizes:
+        n_bars = years * BARS_PER_YEAR[interval]
+        cases.append((f"backtest_{years}y_{interval}", lambda y=years, iv=interval: synthetic_ohlc(y, iv),
+                      lambda df: run_backtest(df, 10000.0, 2.0, 0.15, 0.78), n_bars, "velas"))
+
+    # Decodificación de respuestas multicall (como una watchlist)
+    for n in ([1_000, 10_000] if quick else [1_000, 10_000, 100_000]):
+        def prepare(n=n):
+            results = account_results(n)
+            return [f"0x{i:040x}" for i in range(n)], results
+
+        def decode(fx):
+            addresses, results = fx
+            raw, ok = decode_account_data(results)
+            return account_frame(addresses, raw, ok)
+        cases.append((f"decode_accounts_{n}", prepare, decode, n, "cuentas"))
+    return cases
+
+
+def _measure(fn, fixture, repeat, warmup):
+    for _ in range(warmup):
+        fn(fixture)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(fixture)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def _peak_memory(fn, fixture):
+    tracemalloc.start()
+    try:
+        fn(fixture)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(repeat=5, warmup=1, quick=False, only=None):
+    """Ejecuta todos los casos (o los que contengan `only`) y devuelve el informe como dict"""
+    results = {}
+    for name, prepare, fn, units, unit in _cases(quick):
+        if only and only not in name:
+            continue
+        fixture = prepare() if prepare else None
+        times = _measure(fn, fixture, repeat, warmup)
+        best, median = min(times), statistics.median(times)
+        results[name] = {
+            "repeat": repeat,
+            "min_s": best,
+            "median_s": median,
+            "units": units,
+            "unit": unit,
+            "throughput_per_s": units / median if median > 0 else None,
+            "peak_mem_bytes": _peak_memory(fn, fixture),
+        }
+    return {"meta": environment(), "results": results}
+
+
+def environment():
+    """Contexto del informe para poder comparar entre commits y máquinas"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "seed": SEED,
+    }
+
+
+# ==============================================================================
+#  COMPARACIÓN ENTRE INFORMES
+# ==============================================================================
+
+
+def load_report(path):
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def save_report(report, path):
+    Path(path).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+def compare(base, current, tolerance=REGRESSION_TOLERANCE):
+    """Tabla caso a caso (mejor tiempo actual / referencia). `regresion` marca los que empeoran más de `tolerance`
+
+    Se compara el mínimo y no la mediana: es el menos sensible al ruido de la máquina.
+    """
+    rows = []
+    for name, cur in current["results"].items():
+        ref = base["results"].get(name)
+        if ref is None:
+            continue
+        ratio = cur["min_s"] / ref["min_s"] if ref["min_s"] > 0 else float("nan")
+        rows.append({
+            "caso": name,
+            "base_ms": ref["min_s"] * 1000,
+            "actual_ms": cur["min_s"] * 1000,
+            "ratio": ratio,
+            "mem_ratio": cur["peak_mem_bytes"] / ref["peak_mem_bytes"] if ref["peak_mem_bytes"] else float("nan"),
+            "regresion": ratio > 1 + tolerance,
+        })
+    return pd.DataFrame(rows, columns=["caso", "base_ms", "actual_ms", "ratio", "mem_ratio", "regresion"])
+
+
+def report_frame(report):
+    """Informe en forma de tabla legible"""
+    df = pd.DataFrame.from_dict(report["results"], orient="index")
+    if df.empty:
+        return df
+    df.index.name = "caso"
+    return df.assign(median_ms=df["median_s"] * 1000, peak_mem_mb=df["peak_mem_bytes"] / 2**20)[
+        ["median_ms", "throughput_per_s", "unit", "peak_mem_mb"]
+    ].reset_index()
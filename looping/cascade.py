@@ -0,0 +1,87 @@
+import numpy as np
+
+# ==============================================================================
+#  MOTOR DE DEFENSA EN CASCADA (FORMA CERRADA)
+# ==============================================================================
+# Cada zona mueve el precio de liquidación por un factor constante
+# q = (1 + umbral) * ratio_objetivo, así que la zona i se calcula directamente:
+#   liq_i      = liq_0 * q^i
+#   trigger_i  = liq_{i-1} * (1 + umbral)
+#   colateral_i = deuda / (liq_i * LTV)
+# Todas las zonas (y todas las combinaciones de parámetros, por broadcasting)
+# se evalúan en un único paso vectorizado.
+
+
+def cascade(price, debt_usd, collat_amt, ltv, threshold, zones, clamp=False):
+    """Calcula todas las zonas de la cascada de una vez.
+
+    Acepta escalares o arrays que hagan broadcasting entre sí; el eje de zonas
+    se añade al final. Con `clamp=True` nunca se retira colateral (Modo A del
+    escáner); sin él se reproduce la tabla de la Calculadora.
+    Devuelve un dict de arrays con forma (..., zones).
+    """
+    price = np.asarray(price, dtype=float)[..., None]
+    debt_usd = np.asarray(debt_usd, dtype=float)[..., None]
+    collat_amt = np.asarray(collat_amt, dtype=float)[..., None]
+    ltv = np.asarray(ltv, dtype=float)[..., None]
+    threshold = np.asarray(threshold, dtype=float)[..., None]
+    i = np.arange(1, zones + 1)
+
+    valid = (collat_amt > 0) & (ltv > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        liq_0 = np.where(valid, debt_usd / (collat_amt * ltv), 0.0)
+        target_ratio = liq_0 / price
+        q = (1 + threshold) * target_ratio
+
+        new_liq = liq_0 * q ** i
+        trigger = liq_0 * q ** (i - 1) * (1 + threshold)
+        needed = np.where(new_liq > 0, debt_usd / (new_liq * ltv), np.nan)
+
+    # Colateral tras cada zona (si no hay precio objetivo válido, no se toca)
+    collat_before = np.broadcast_to(collat_amt, needed.shape)
+    collat = np.where(np.isnan(needed), collat_before, needed)
+    if clamp:
+        collat = np.maximum.accumulate(np.maximum(collat, collat_amt), axis=-1)
+    prev = np.concatenate([np.broadcast_to(collat_amt, collat.shape[:-1] + (1,)), collat[..., :-1]], axis=-1)
+
+    add = collat - prev
+    cost = add * trigger
+    cum_cost = np.cumsum(cost, axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        new_hf = np.where(debt_usd > 0, collat * trigger * ltv / debt_usd, 999.0)
+        drop_pct = (price - trigger) / price
+
+    return {
+        "liq_0": liq_0[..., 0],
+        "target_ratio": target_ratio[..., 0],
+        "trigger": trigger,
+        "drop_pct": drop_pct,
+        "new_liq": new_liq,
+        "add": add,
+        "cost": cost,
+        "cum_cost": cum_cost,
+        "collat": collat,
+        "new_hf": new_hf,
+    }
+
+
+def position_from_leverage(capital, leverage, price):
+    """(deuda USD, colateral en tokens) de una posición abierta con `leverage`"""
+    capital = np.asarray(capital, dtype=float)
+    leverage = np.asarray(leverage, dtype=float)
+    collat_usd = capital * leverage
+    return collat_usd - capital, collat_usd / price
+
+
+def capital_surface(capital, price, ltv, leverages, thresholds, zones):
+    """Superficie apalancamiento × umbral del capital total requerido y la caída cubierta.
+
+    Devuelve (capital_total, caida_cubierta) con forma (len(leverages), len(thresholds)).
+    """
+    lev = np.asarray(leverages, dtype=float)[:, None]
+    th = np.asarray(thresholds, dtype=float)[None, :]
+    debt_usd, collat_amt = position_from_leverage(capital, lev, price)
+    res = cascade(price, debt_usd, collat_amt, ltv, th, zones)
+    total = capital + res["cum_cost"][..., -1]
+    return total, res["drop_pct"][..., -1]
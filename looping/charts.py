@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+from .backtest_engine import ACTION_HOLD
+
+# ==============================================================================
+#  SERIES LARGAS: DIEZMADO LTTB Y TRAZAS WEBGL
+# ==============================================================================
+# Un backtest de años (o intradía) son decenas de miles de puntos por serie,
+# y mandarlos todos como SVG bloquea el navegador. Antes de pintar, cada serie
+# de la ventana visible se reduce con LTTB (Largest-Triangle-Three-Buckets,
+# conserva picos y valles), se unen los índices elegidos de todas las series y
+# se añaden siempre las velas con evento (defensas y liquidación). Por encima
+# de WEBGL_THRESHOLD puntos se pinta con Scattergl en lugar de Scatter.
+
+MAX_POINTS = 1500          # puntos por serie tras el diezmado
+WEBGL_THRESHOLD = 1000     # a partir de aquí, trazas WebGL
+
+
+def lttb_indices(x, y, n_out):
+    """Índices de los n_out puntos que elige LTTB (incluye siempre el primero y el último)"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = x.size
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Cubo i = [edges[i], edges[i+1]); el primer y el último punto van aparte
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Vértice C: la media del cubo siguiente (o el último punto)
+        if i + 2 < edges.size:
+            nlo, nhi = edges[i + 1], edges[i + 2]
+            cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        # El punto del cubo que forma el triángulo de mayor área con A y C
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def _numeric_x(index):
+    if isinstance(index, pd.DatetimeIndex):
+        return index.as_unit("ns").asi8.astype(float)
+    return np.arange(len(index), dtype=float)
+
+
+def downsample_frame(df, columns, keep=None, max_points=MAX_POINTS):
+    """Filas de df que bastan para dibujar `columns` (LTTB por serie) más las marcadas en `keep`"""
+    if len(df) <= max_points:
+        return df
+    x = _numeric_x(df.index)
+    mask = np.zeros(len(df), dtype=bool)
+    for col in columns:
+        y = df[col].to_numpy(dtype=float)
+        finite = np.isfinite(y)
+        mask[np.flatnonzero(finite)[lttb_indices(x[finite], y[finite], max_points)]] = True
+    if keep is not None:
+        mask |= np.asarray(keep, dtype=bool)
+    return df[mask]
+
+
+def event_mask(df):
+    """Velas con evento (defensa o liquidación) de un resultado de backtest"""
+    return (df["Acción"] != ACTION_HOLD).to_numpy()
+
+
+def window(df, start=None, end=None):
+    """Recorte del resultado a la ventana visible [start, end] (fechas incluidas)"""
+    # Las velas intradía de Yahoo vienen con zona horaria
+    tz = getattr(df.index, "tz", None)
+    if start is not None:
+        df = df[df.index >= pd.Timestamp(start).tz_localize(tz)]
+    if end is not None:
+        df = df[df.index < (pd.Timestamp(end) + pd.Timedelta(days=1)).tz_localize(tz)]
+    return df
+
+
+def scatter_trace(n_points):
+    """go.Scattergl para series largas, go.Scatter (SVG) para las cortas"""
+    import plotly.graph_objects as go
+
+    return go.Scattergl if n_points > WEBGL_THRESHOLD else go.Scatter
@@ -0,0 +1,303 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+import pandas as pd
+
+# ==============================================================================
+#  CLI PARA TRABAJOS POR LOTES (SIN STREAMLIT)
+# ==============================================================================
+# python -m looping backtest --config trabajos.json --out resultados.csv
+# python -m looping scan --config wallets.csv --out riesgo.json
+# python -m looping bench --out bench.json [--compare bench_base.json]
+# python -m looping watch --config wallets.csv --sink stdout --sink file:alertas.jsonl
+#
+# El config es una lista JSON de trabajos (o un solo objeto) o un CSV con una
+# fila por trabajo. Los RPC privados se leen de <RED>_RPC_URL en el entorno,
+# igual que en los Secrets de la app.
+
+BACKTEST_DEFAULTS = {
+    "start": None,          # por defecto, hace 2 años (como la app)
+    "end": None,
+    "interval": "1d",
+    "capital": 10000.0,
+    "leverage": 2.0,
+    "threshold": 0.15,
+    "ltv": 0.78,
+}
+
+
+def load_jobs(path):
+    """Lee los trabajos de un JSON (lista u objeto) o de un CSV"""
+    if path == "-":
+        text = sys.stdin.read()
+        return _parse_json(text) if text.lstrip().startswith(("[", "{")) else list(csv.DictReader(text.splitlines()))
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as fh:
+            return list(csv.DictReader(fh))
+    with open(path, encoding="utf-8") as fh:
+        return _parse_json(fh.read())
+
+
+def _parse_json(text):
+    data = json.loads(text)
+    return data if isinstance(data, list) else [data]
+
+
+def _as_date(value, default):
+    if value in (None, ""):
+        return default
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def env_rpc_urls(network_name):
+    """RPC privado de la red desde el entorno (<RED>_RPC_URL), si lo hay"""
+    url = os.environ.get(f"{network_name.upper()}_RPC_URL", "").strip().strip('"').strip("'")
+    return [url] if url else []
+
+
+# ==============================================================================
+#  SUBCOMANDOS
+# ==============================================================================
+
+
+def run_backtest_job(job):
+    """Ejecuta un trabajo de backtest y devuelve su fila de resumen"""
+    from .backtest_engine import run_backtest
+    from .intraday import clip_start, iter_intraday_chunks, run_streaming_backtest
+    from .price_store import load_history
+    from .result_cache import get_result_cache, result_key
+
+    cfg = {**BACKTEST_DEFAULTS, **{k: v for k, v in job.items() if v not in (None, "")}}
+    ticker = cfg["ticker"]
+    end = _as_date(cfg["end"], date.today())
+    start = _as_date(cfg["start"], end - timedelta(days=365 * 2))
+    capital, leverage = float(cfg["capital"]), float(cfg["leverage"])
+    threshold, ltv = float(cfg["threshold"]), float(cfg["ltv"])
+    interval = cfg["interval"]
+
+    cache = get_result_cache()
+    if interval == "1d":
+        df_hist = load_history(ticker, start, end)
+        if df_hist.empty:
+            summary = None
+        else:
+            key = result_key("1d", ticker, start, df_hist.index[-1], capital, leverage, threshold, ltv)
+            _, summary = cache.cached(key, lambda: run_backtest(df_hist, capital, leverage, threshold, ltv))
+    else:
+        start = clip_start(start, interval)
+        # La descarga excluye el día `end`: el mismo límite identifica los datos en la clave
+        key = result_key(interval, ticker, start, end, capital, leverage, threshold, ltv)
+        _, summary = cache.cached(key, lambda: run_streaming_backtest(
+            iter_intraday_chunks(ticker, start, end, interval), capital, leverage, threshold, ltv
+        ))
+
+    row = {"ticker": ticker, "interval": interval, "start": start.isoformat(), "end": end.isoformat(),
+           "capital": capital, "leverage": leverage, "threshold": threshold, "ltv": ltv}
+    if summary is None:
+        return {**row, "error": "Sin datos"}
+    return {**row, **summary, "start_date": str(summary["start_date"])}
+
+
+def cmd_backtest(args):
+    rows = []
+    for job in load_jobs(args.config):
+        try:
+            rows.append(run_backtest_job(job))
+        except Exception as e:
+            rows.append({"ticker": job.get("ticker"), "error": f"{type(e).__name__}: {e}"})
+    return pd.DataFrame(rows)
+
+
+def cmd_scan(args):
+    from .aave import NETWORKS, network_pool, pool_address
+    from .multicall import parse_addresses, scan_accounts
+    from .snapshots import get_snapshot_store, rows_from_frame
+
+    # Agrupar por red: una sola pasada multicall por red
+    by_net = {}
+    for job in load_jobs(args.config):
+        net = job.get("network") or args.network
+        if net not in NETWORKS:
+            raise SystemExit(f"Red desconocida: {net!r} (opciones: {', '.join(NETWORKS)})")
+        by_net.setdefault(net, []).append(job.get("address", ""))
+
+    frames = []
+    for net, raw in by_net.items():
+        addrs, bad = parse_addresses("\n".join(raw))
+        if bad:
+            print(f"[{net}] ignoradas {len(bad)} entradas no válidas", file=sys.stderr)
+        if not addrs:
+            continue
+        rpc_pool = network_pool(net, env_rpc_urls(net))
+
+        def read(w3):
+            block = w3.eth.block_number
+            return scan_accounts(w3, pool_address(w3, net), addrs, args.chunk_size, block_identifier=block), block
+
+        ((df, calls), block), ep = rpc_pool.call(read)
+        print(f"[{net}] {len(addrs)} wallets en {calls} llamadas RPC ({ep.url}, bloque {block})", file=sys.stderr)
+        get_snapshot_store().record(rows_from_frame(net, df, block))
+        frames.append(df.assign(Red=net))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def cmd_bench(args):
+    from .bench import compare, load_report, report_frame, run_benchmarks, save_report
+
+    report = run_benchmarks(repeat=args.repeat, quick=args.quick, only=args.only)
+    if args.out and args.out.lower().endswith(".json"):
+        save_report(report, args.out)
+    elif not args.compare:
+        print(json.dumps(report, indent=2))
+    print(report_frame(report).to_string(index=False), file=sys.stderr)
+
+    if args.compare:
+        diff = compare(load_report(args.compare), report, args.tolerance)
+        print(diff.to_string(index=False), file=sys.stderr)
+        # Código de salida 1 si algún caso empeora: sirve como control en CI/cron
+        return 1 if diff["regresion"].any() else 0
+    return 0
+
+
+def cmd_watch(args):
+    from .aave import network_pool
+    from .snapshots import get_snapshot_store
+    from .watcher import MultiSink, Watcher, local_pool, make_sink, targets_from_jobs
+
+    targets, baselines, bad = targets_from_jobs(load_jobs(args.config), args.network)
+    if bad:
+        print(f"Ignoradas {len(bad)} entradas no válidas", file=sys.stderr)
+    if not targets:
+        raise SystemExit("Sin wallets que vigilar")
+
+    # --rpc RED=URL sustituye los RPC de la red (cadena local o fork); si no, los públicos + <RED>_RPC_URL
+    overrides = dict(spec.split("=", 1) for spec in args.rpc)
+    pools = {net: local_pool(overrides[net]) if net in overrides else network_pool(net, env_rpc_urls(net))
+             for net in targets}
+    pool_addresses = dict(spec.split("=", 1) for spec in args.pool_address)
+
+    watcher = Watcher(targets, MultiSink(make_sink(s) for s in args.sink or ["stdout"]),
+                      num_defenses=args.defenses, pools=pools, pool_addresses=pool_addresses,
+                      baselines=baselines, poll_interval=args.interval, chunk_size=args.chunk_size,
+                      store=None if args.no_store else get_snapshot_store())
+    if args.once:
+        watcher.run_once()
+        return 0
+    print(f"Vigilando {sum(len(a) for a in targets.values())} wallets en {', '.join(targets)} "
+          f"(Ctrl+C para salir)", file=sys.stderr)
+    watcher.run()
+    return 0
+
+
+def cmd_leads(args):
+    from .leads import LeadQueue, LeadWorker, MoosendClient
+
+    queue = LeadQueue()
+    if args.requeue_failed:
+        print(f"Reencolados {queue.requeue_failed()} leads fallidos", file=sys.stderr)
+    if not args.status:
+        api_key = os.environ.get("MOOSEND_API_KEY")
+        if not api_key or not args.list_id:
+            raise SystemExit("Hace falta MOOSEND_API_KEY y --list-id para enviar la cola")
+        sent = LeadWorker(queue, MoosendClient(api_key, args.list_id)).drain()
+        print(f"Procesados {sent} leads", file=sys.stderr)
+    return pd.DataFrame([queue.counts()])
+
+
+def cmd_history(args):
+    from .snapshots import get_snapshot_store
+
+    store = get_snapshot_store()
+    if args.address:
+        df = store.history(args.address, args.network, limit=args.limit)
+    elif args.below is not None:
+        df = store.below(args.below, args.network)
+    else:
+        raise SystemExit("Indica --address (evolución de una wallet) o --below (wallets con HF bajo)")
+    return df.drop(columns=["ts"])
+
+
+# ==============================================================================
+#  ENTRADA
+# ==============================================================================
+
+
+def write_output(df, out):
+    """CSV o JSON según la extensión de --out; CSV por stdout si no se indica"""
+    if not out or out == "-":
+        df.to_csv(sys.stdout, index=False)
+    elif out.lower().endswith(".json"):
+        df.to_json(out, orient="records", indent=2, date_format="iso", force_ascii=False)
+    else:
+        df.to_csv(out, index=False)
+
+
+def build_parser():
+    from .multicall import DEFAULT_CHUNK_SIZE
+
+    parser = argparse.ArgumentParser(prog="looping", description="Backtests y escaneos de Looping Master por lotes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_bt = sub.add_parser("backtest", help="Backtest de defensa por trabajo (ticker, start, end, interval, capital, leverage, threshold, ltv)")
+    p_bt.add_argument("--config", required=True, help="JSON o CSV con los trabajos ('-' para stdin)")
+    p_bt.add_argument("--out", help="Fichero de salida .csv o .json (por defecto CSV por stdout)")
+    p_bt.set_defaults(func=cmd_backtest)
+
+    p_sc = sub.add_parser("scan", help="Salud (HF) de una lista de wallets (address, network)")
+    p_sc.add_argument("--config", required=True, help="JSON o CSV con las wallets ('-' para stdin)")
+    p_sc.add_argument("--network", default="Base", help="Red por defecto para filas sin 'network'")
+    p_sc.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Wallets por llamada multicall")
+    p_sc.add_argument("--out", help="Fichero de salida .csv o .json (por defecto CSV por stdout)")
+    p_sc.set_defaults(func=cmd_scan)
+
+    p_be = sub.add_parser("bench", help="Benchmarks sin red de cascada, backtest, planes y decodificación")
+    p_be.add_argument("--out", help="Guardar el informe en un .json (por defecto JSON por stdout)")
+    p_be.add_argument("--repeat", type=int, default=5, help="Repeticiones por caso")
+    p_be.add_argument("--quick", action="store_true", help="Omitir los históricos y lotes más grandes")
+    p_be.add_argument("--only", help="Solo los casos cuyo nombre contenga este texto")
+    p_be.add_argument("--compare", help="Informe .json de referencia contra el que comparar")
+    p_be.add_argument("--tolerance", type=float, default=0.10, help="Margen antes de marcar regresión (0.10 = 10%%)")
+    p_be.set_defaults(func=cmd_bench)
+
+    p_wa = sub.add_parser("watch", help="Vigila el HF de una lista de wallets bloque a bloque y avisa por zonas")
+    p_wa.add_argument("--config", required=True, help="JSON o CSV con address, network y baseline_hf opcional")
+    p_wa.add_argument("--network", default="Base", help="Red por defecto para filas sin 'network'")
+    p_wa.add_argument("--sink", action="append", help="stdout, file:ruta.jsonl o webhook:URL (repetible)")
+    p_wa.add_argument("--defenses", type=int, default=5, help="Número de defensas del plan (Modo B)")
+    p_wa.add_argument("--interval", type=float, default=1.0, help="Segundos entre consultas de bloque")
+    p_wa.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Wallets por llamada multicall")
+    p_wa.add_argument("--rpc", action="append", default=[], metavar="RED=URL", help="RPC propio para una red (p. ej. anvil)")
+    p_wa.add_argument("--pool-address", action="append", default=[], metavar="RED=0x...",
+                      help="Dirección del Pool si la cadena no tiene el AddressProvider")
+    p_wa.add_argument("--once", action="store_true", help="Una sola vuelta y salir (cron)")
+    p_wa.add_argument("--no-store", action="store_true", help="No guardar las lecturas en el histórico local")
+    p_wa.set_defaults(func=cmd_watch)
+
+    p_le = sub.add_parser("leads", help="Vacía la cola local de suscriptores contra Moosend (MOOSEND_API_KEY)")
+    p_le.add_argument("--list-id", default=os.environ.get("MOOSEND_LIST_ID"), help="Lista de Moosend (o MOOSEND_LIST_ID)")
+    p_le.add_argument("--status", action="store_true", help="Solo mostrar cuántos hay por estado")
+    p_le.add_argument("--requeue-failed", action="store_true", help="Vuelve a encolar los leads dados por perdidos antes de enviar")
+    p_le.add_argument("--out", help="Fichero de salida .csv o .json (por defecto CSV por stdout)")
+    p_le.set_defaults(func=cmd_leads)
+
+    p_hi = sub.add_parser("history", help="Consultas sobre el histórico local de escaneos (sin RPC)")
+    p_hi.add_argument("--address", help="Evolución del HF de esta wallet")
+    p_hi.add_argument("--below", type=float, metavar="HF", help="Wallets cuya última lectura tiene HF por debajo de este valor")
+    p_hi.add_argument("--network", help="Solo esta red")
+    p_hi.add_argument("--limit", type=int, help="Solo las N lecturas más recientes (con --address)")
+    p_hi.add_argument("--out", help="Fichero de salida .csv o .json (por defecto CSV por stdout)")
+    p_hi.set_defaults(func=cmd_history)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    result = args.func(args)
+    if isinstance(result, pd.DataFrame):
+        write_output(result, args.out)
+        return 0
+    return result
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+
+from .multicall import account_data_calldata, decode_account_data
+
+# ==============================================================================
+#  HISTÓRICO DEL HEALTH FACTOR (REPLAY POR BLOQUES EN NODO ARCHIVO)
+# ==============================================================================
+# Se muestrea getUserAccountData en bloques pasados con eth_call + número de
+# bloque, enviando cada ronda como un único batch JSON-RPC. Tras una primera
+# pasada uniforme, solo se subdividen los tramos donde el HF cambia mucho
+# (bisección), así que no hace falta leer cada bloque. Al hablar JSON-RPC en
+# crudo funciona igual contra un nodo local (anvil --fork-url ...).
+
+RPC_BATCH_SIZE = 50        # peticiones por batch (muchos RPC públicos cortan en 100)
+RPC_TIMEOUT = 20
+DEFAULT_SAMPLES = 32       # puntos de la primera pasada uniforme
+DEFAULT_REL_TOL = 0.05     # cambio relativo de HF que justifica subdividir
+DEFAULT_MAX_POINTS = 256
+DEFAULT_MAX_ROUNDS = 6
+
+HISTORY_COLUMNS = ["block", "timestamp", "col_usd", "debt_usd", "lt_avg", "hf"]
+
+
+def batch_rpc(session, url, requests_, batch_size=RPC_BATCH_SIZE, timeout=RPC_TIMEOUT):
+    """Envía [(método, params), ...] en batches JSON-RPC. Devuelve los `result` (None si esa petición falló)"""
+    results = [None] * len(requests_)
+    for start in range(0, len(requests_), batch_size):
+        chunk = requests_[start:start + batch_size]
+        payload = [
+            {"jsonrpc": "2.0", "id": start + i, "method": method, "params": params}
+            for i, (method, params) in enumerate(chunk)
+        ]
+        r = session.post(url, json=payload, timeout=timeout)
+        r.raise_for_status()
+        body = r.json()
+        if isinstance(body, dict):
+            # Algunos nodos responden un único error si no aceptan batches
+            raise ValueError(body.get("error", {}).get("message", "Respuesta batch no válida"))
+        for item in body:
+            if "result" in item:
+                results[item["id"]] = item["result"]
+    return results
+
+
+def latest_block(session, url):
+    number, = batch_rpc(session, url, [("eth_blockNumber", [])])
+    return int(number, 16)
+
+
+def block_range_for_days(session, url, days, probe_span=10_000):
+    """(bloque inicial, bloque final) que cubren aproximadamente los últimos `days` días"""
+    head = latest_block(session, url)
+    ref = max(0, head - probe_span)
+    b_head, b_ref = batch_rpc(session, url, [
+        ("eth_getBlockByNumber", [hex(head), False]),
+        ("eth_getBlockByNumber", [hex(ref), False]),
+    ])
+    span_s = int(b_head["timestamp"], 16) - int(b_ref["timestamp"], 16)
+    block_time = span_s / (head - ref) if head > ref and span_s > 0 else 12.0
+    return max(0, head - int(days * 86400 / block_time)), head
+
+
+def _read_blocks(session, url, pool_addr, user, blocks):
+    """Lee cuenta y timestamp de cada bloque en un mismo batch"""
+    call = {"to": pool_addr, "data": "0x" + account_data_calldata(user).hex()}
+    reqs = []
+    for b in blocks:
+        reqs.append(("eth_call", [call, hex(b)]))
+        reqs.append(("eth_getBlockByNumber", [hex(b), False]))
+    res = batch_rpc(session, url, reqs)
+
+    pairs, stamps = [], []
+    for i in range(len(blocks)):
+        ret, blk = res[2 * i], res[2 * i + 1]
+        data = bytes.fromhex(ret[2:]) if isinstance(ret, str) else b""
+        pairs.append((ret is not None, data))
+        stamps.append(int(blk["timestamp"], 16) if blk else None)
+    raw, ok = decode_account_data(pairs)
+    return raw, ok, stamps
+
+
+def _to_points(blocks, raw, ok, stamps):
+    points = {}
+    for b, row, good, ts in zip(blocks, raw, ok, stamps):
+        if not good:
+            continue
+        debt = row[1] / 10**8
+        points[b] = {
+            "block": b,
+            "timestamp": ts,
+            "col_usd": row[0] / 10**8,
+            "debt_usd": debt,
+            "lt_avg": row[3] / 10000,
+            "hf": row[5] / 10**18 if debt > 0 else np.inf,
+        }
+    return points
+
+
+def _needs_split(a, b, rel_tol):
+    if b["block"] - a["block"] < 2:
+        return False
+    ha, hb = a["hf"], b["hf"]
+    if np.isinf(ha) != np.isinf(hb):
+        return True  # se abrió o se cerró la deuda en el tramo
+    if np.isinf(ha):
+        return False
+    return abs(hb - ha) / max(min(ha, hb), 1e-9) > rel_tol
+
+
+def hf_history(session, url, pool_addr, user, from_block, to_block,
+               samples=DEFAULT_SAMPLES, rel_tol=DEFAULT_REL_TOL,
+               max_points=DEFAULT_MAX_POINTS, max_rounds=DEFAULT_MAX_ROUNDS):
+    """Serie histórica del HF entre dos bloques con refinado adaptativo.
+
+    Devuelve (DataFrame ordenado por bloque, número de rondas de lectura).
+    """
+    blocks = sorted(set(np.linspace(from_block, to_block, max(2, samples)).astype(int).tolist()))
+    points = {}
+    attempted = set(blocks)  # los bloques que fallan no se vuelven a pedir
+    rounds = 0
+    while blocks and rounds < max_rounds:
+        raw, ok, stamps = _read_blocks(session, url, pool_addr, user, blocks)
+        points.update(_to_points(blocks, raw, ok, stamps))
+        rounds += 1
+        if not points:
+            raise ValueError("El RPC no devolvió estado histórico (¿es un nodo archivo?)")
+
+        ordered = [points[b] for b in sorted(points)]
+        budget = max_points - len(points)
+        blocks = []
+        for a, b in zip(ordered, ordered[1:]):
+            if budget <= 0:
+                break
+            mid = (a["block"] + b["block"]) // 2
+            if mid not in attempted and _needs_split(a, b, rel_tol):
+                blocks.append(mid)
+                attempted.add(mid)
+                budget -= 1
+
+    df = pd.DataFrame([points[b] for b in sorted(points)], columns=HISTORY_COLUMNS)
+    df["Fecha"] = pd.to_datetime(df["timestamp"], unit="s")
+    return df, rounds
@@ -0,0 +1,107 @@
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .backtest_engine import ACTION_HOLD, RESULT_COLUMNS, ohlc_arrays, simulate_defense
+from .metrics import record_backtest, span
+
+# ==============================================================================
+#  BACKTEST INTRADÍA POR BLOQUES (STREAMING)
+# ==============================================================================
+# Las velas diarias esconden las mechas intradía, que es justo donde se
+# liquida un looping. Yahoo solo sirve el intradía en ventanas limitadas, así
+# que se descarga ventana a ventana y cada bloque pasa por la máquina de
+# estados de backtest_engine arrastrando el estado del anterior. Del
+# resultado solo se guarda una fila por día (la última vela) más las velas
+# con evento, por lo que la memoria no crece con la resolución.
+
+# intervalo -> (días máximos hacia atrás que sirve Yahoo, días por descarga)
+INTRADAY_LIMITS = {
+    "1h": (729, 120),
+    "15m": (59, 30),
+    "5m": (59, 15),
+}
+
+
+def clip_start(start, interval, today=None):
+    """Fecha de inicio más antigua que Yahoo acepta para ese intervalo"""
+    today = today or date.today()
+    lookback, _ = INTRADAY_LIMITS[interval]
+    return max(start, today - timedelta(days=lookback))
+
+
+def iter_intraday_chunks(ticker, start, end, interval):
+    """Descarga el histórico intradía ventana a ventana (generador de DataFrames OHLC)"""
+    import yfinance as yf  # diferido: solo se carga si hay que descargar
+
+    if isinstance(start, datetime):
+        start = start.date()
+    _, window = INTRADAY_LIMITS[interval]
+    cur = clip_start(start, interval)
+    while cur < end:
+        nxt = min(end, cur + timedelta(days=window))
+        with span("yf.download", ticker=ticker, interval=interval):
+            df = yf.download(ticker, start=cur, end=nxt, interval=interval, progress=False)
+        if df is not None and not df.empty:
+            yield df
+        cur = nxt
+
+
+def _compact(index, sim):
+    """Se queda con la última vela de cada día y con las velas que tienen evento"""
+    rows = sim["rows"]
+    idx = pd.DatetimeIndex(index[:rows])
+    days = idx.normalize().asi8
+    last_of_day = np.r_[days[1:] != days[:-1], True]
+    keep = last_of_day | (sim["Acción"] != ACTION_HOLD)
+    if rows:
+        keep[-1] = True
+    return pd.DataFrame({col: sim[col][keep] for col in RESULT_COLUMNS}, index=idx[keep])
+
+
+def run_streaming_backtest(chunks, capital, leverage, threshold, ltv):
+    """Backtest sobre un iterable de bloques OHLC consecutivos. Devuelve (df_res, resumen) como run_backtest"""
+    state = None
+    parts = []
+    bars = 0
+    start_date = None
+
+    for df in chunks:
+        index, opens, lows, closes = ohlc_arrays(df)
+        if closes.size == 0:
+            continue
+        if start_date is None:
+            start_date = index[0].date()
+        t0 = time.perf_counter()
+        with span("backtest.simulate", bars=closes.size, chunk=len(parts)):
+            sim = simulate_defense(opens, lows, closes, capital, leverage, threshold, ltv, state=state)
+        record_backtest("intraday", sim["rows"], time.perf_counter() - t0)
+        state = sim["state"]
+        bars += sim["rows"]
+        parts.append(_compact(index, sim))
+        if state["is_liquidated"]:
+            break
+
+    if state is None:
+        return pd.DataFrame(columns=RESULT_COLUMNS), None
+
+    df_res = pd.concat(parts)
+    # Un día puede quedar partido entre dos bloques: nos quedamos con su última vela y los eventos
+    days = df_res.index.normalize()
+    last_of_day = ~days.duplicated(keep="last")
+    df_res = df_res[last_of_day | (df_res["Acción"] != ACTION_HOLD).to_numpy()]
+    df_res.index.name = "Fecha"
+
+    summary = {
+        "start_date": start_date,
+        "start_price": state["start_price"],
+        "debt_usd": state["debt_usd"],
+        "is_liquidated": state["is_liquidated"],
+        "total_injected": state["total_injected"],
+        "defenses": state["events"],
+        "final_value": float(df_res["Valor Estrategia"].iloc[-1]),
+        "bars": bars,
+    }
+    return df_res, summary
@@ -0,0 +1,333 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import requests
+
+from .metrics import REGISTRY, span
+from .rpc_pool import make_session
+
+# ==============================================================================
+#  COLA DURADERA DE SUSCRIPTORES (MOOSEND)
+# ==============================================================================
+# El formulario de la portada ya no llama a Moosend: guarda el lead en un
+# SQLite local y responde al momento. Un hilo de fondo por proceso reclama
+# los pendientes (con un plazo de reserva, por si hay varios procesos), los
+# envía con una sesión HTTP reutilizada y timeouts, y reintenta con espera
+# exponencial los fallos de red, 429 y 5xx. El email es la clave: un mismo
+# lead enviado dos veces solo se encola una. Si se acumula cola (Moosend caído
+# un rato), se vacía con subscribe_many en lotes en lugar de uno a uno.
+# Los reintentos cubren más de un día de caída; lo que aun así se da por
+# perdido se vuelve a encolar con `python -m looping leads --requeue-failed`.
+#
+# MOOSEND_API_URL permite apuntar a un stub HTTP local para pruebas.
+
+DEFAULT_DB_PATH = os.environ.get("LOOPING_LEADS_DB", os.path.join(".data", "leads.sqlite"))
+MOOSEND_API_URL = os.environ.get("MOOSEND_API_URL", "https://api.moosend.com/v3")
+
+TIMEOUT = (3.05, 10)      # (conexión, lectura) en segundos
+BULK_THRESHOLD = 5        # pendientes a partir de los que se usa subscribe_many
+MAX_BULK = 1000           # suscriptores por subscribe_many (límite de Moosend)
+MAX_ATTEMPTS = 40         # ~10 intentos en la primera hora y después uno por hora: algo más de un día
+BACKOFF_BASE = 5.0        # segundos; se dobla en cada intento
+BACKOFF_MAX = 3600.0
+LEASE = 120.0             # segundos que un proceso se reserva un lote reclamado
+POLL_INTERVAL = 30.0      # el hilo también se despierta solo al encolar
+
+STATUS_PENDING = "pending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+logger = logging.getLogger("looping.leads")
+
+LEADS = REGISTRY.counter("looping_leads_total", "Leads por resultado (encolado, duplicado, enviado, reintento, fallido, reencolado)", ["result"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    email TEXT PRIMARY KEY,
+    name TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL,
+    sent_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS leads_due ON leads (status, next_attempt);
+"""
+
+
+class MoosendError(Exception):
+    """Fallo de la API; `retryable` indica si tiene sentido volver a intentarlo"""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class MoosendClient:
+    """Cliente mínimo de la API v3 de Moosend (alta simple y en lote)"""
+
+    def __init__(self, api_key, list_id, base_url=MOOSEND_API_URL, timeout=TIMEOUT, session=None):
+        self.api_key = api_key
+        self.list_id = list_id
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = session or make_session(pool_size=2)
+
+    def _post(self, path, payload):
+        url = f"{self.base_url}/subscribers/{self.list_id}/{path}"
+        try:
+            r = self.session.post(url, params={"apikey": self.api_key}, json=payload, timeout=self.timeout,
+                                  headers={"Accept": "application/json"})
+        except requests.RequestException as e:
+            raise MoosendError(f"{type(e).__name__}: {e}")
+        # Límite de peticiones, caída del servicio o credenciales: el lead no tiene la culpa
+        if r.status_code in (401, 403, 408, 429) or r.status_code >= 500:
+            raise MoosendError(f"HTTP {r.status_code}")
+        try:
+            body = r.json()
+        except ValueError:
+            body = {}
+        if r.status_code != 200 or body.get("Code", 0) != 0:
+            raise MoosendError(body.get("Error") or f"HTTP {r.status_code}", retryable=False)
+        return body
+
+    def subscribe(self, name, email):
+        return self._post("subscribe.json", {"Name": name, "Email": email, "HasExternalDoubleOptIn": False})
+
+    def subscribe_many(self, leads):
+        """leads = [(email, nombre), ...]"""
+        return self._post("subscribe_many.json", {
+            "HasExternalDoubleOptIn": False,
+            "Subscribers": [{"Name": name, "Email": email} for email, name in leads],
+        })
+
+
+def backoff(attempts):
+    """Espera antes del siguiente intento (exponencial con jitter)"""
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(0, attempts - 1)) * random.uniform(0.8, 1.2)
+
+
+# ==============================================================================
+#  COLA
+# ==============================================================================
+
+
+class LeadQueue:
+    """Leads pendientes en SQLite; sobrevive a reinicios y la comparten los procesos"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def submit(self, name, email):
+        """Encola el lead. False si ese email ya estaba pendiente o enviado"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            # Un lead dado por perdido vuelve a la cola si la persona lo reenvía
+            cur = conn.execute(
+                "INSERT INTO leads (email, name, status, next_attempt, created) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (email) DO UPDATE SET name = excluded.name, status = excluded.status, attempts = 0, "
+                "next_attempt = excluded.next_attempt WHERE leads.status = ?",
+                (email.strip().lower(), (name or "").strip(), STATUS_PENDING, now, now, STATUS_FAILED))
+            new = cur.rowcount == 1
+        finally:
+            conn.close()
+        LEADS.inc(result="queued" if new else "duplicate")
+        return new
+
+    def claim(self, limit, lease=LEASE):
+        """Reserva hasta `limit` pendientes vencidos. Devuelve [(email, nombre, intentos)]"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT email, name, attempts FROM leads WHERE status = ? AND next_attempt <= ? "
+                "ORDER BY next_attempt LIMIT ?", (STATUS_PENDING, now, int(limit))).fetchall()
+            conn.executemany("UPDATE leads SET next_attempt = ? WHERE email = ?", [(now + lease, r[0]) for r in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return rows
+
+    def _update(self, sql, params):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")
+            conn.executemany(sql, params)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def mark_sent(self, emails):
+        now = time.time()
+        self._update("UPDATE leads SET status = ?, sent_at = ?, last_error = NULL WHERE email = ?",
+                     [(STATUS_SENT, now, e) for e in emails])
+        LEADS.inc(len(emails), result="sent")
+
+    def mark_failed(self, emails, error):
+        self._update("UPDATE leads SET status = ?, attempts = attempts + 1, last_error = ? WHERE email = ?",
+                     [(STATUS_FAILED, str(error), e) for e in emails])
+        LEADS.inc(len(emails), result="failed")
+
+    def mark_retry(self, rows, error):
+        """Programa otro intento (o da por perdido el lead tras MAX_ATTEMPTS)"""
+        now = time.time()
+        retry = [(now + backoff(attempts + 1), str(error), email) for email, _, attempts in rows
+                 if attempts + 1 < MAX_ATTEMPTS]
+        self._update("UPDATE leads SET attempts = attempts + 1, next_attempt = ?, last_error = ? WHERE email = ?", retry)
+        LEADS.inc(len(retry), result="retry")
+        exhausted = [email for email, _, attempts in rows if attempts + 1 >= MAX_ATTEMPTS]
+        if exhausted:
+            self.mark_failed(exhausted, error)
+
+    def requeue_failed(self):
+        """Devuelve a la cola los leads dados por perdidos. Devuelve cuántos"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            cur = conn.execute("UPDATE leads SET status = ?, attempts = 0, next_attempt = ? WHERE status = ?",
+                               (STATUS_PENDING, now, STATUS_FAILED))
+            count = cur.rowcount
+        finally:
+            conn.close()
+        LEADS.inc(count, result="requeued")
+        return count
+
+    def next_due(self):
+        """Segundos hasta el siguiente pendiente (None si no hay)"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT MIN(next_attempt) FROM leads WHERE status = ?", (STATUS_PENDING,)).fetchone()
+        finally:
+            conn.close()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def counts(self):
+        """{estado: número de leads}"""
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM leads GROUP BY status").fetchall())
+        finally:
+            conn.close()
+
+
+# ==============================================================================
+#  ENVÍO EN SEGUNDO PLANO
+# ==============================================================================
+
+
+class LeadWorker:
+    """Vacía la cola contra Moosend: uno a uno si hay pocos, subscribe_many si hay cola"""
+
+    def __init__(self, queue, client, bulk_threshold=BULK_THRESHOLD, max_bulk=MAX_BULK, poll_interval=POLL_INTERVAL):
+        self.queue = queue
+        self.client = client
+        self.bulk_threshold = bulk_threshold
+        self.max_bulk = max_bulk
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, name, email):
+        """Encola y despierta al hilo; no espera al envío"""
+        new = self.queue.submit(name, email)
+        self._wake.set()
+        return new
+
+    def _send_each(self, rows):
+        for row in rows:
+            email, name, _ = row
+            try:
+                self.client.subscribe(name, email)
+            except MoosendError as e:
+                if e.retryable:
+                    self.queue.mark_retry([row], e)
+                else:
+                    self.queue.mark_failed([email], e)
+            else:
+                self.queue.mark_sent([email])
+
+    def run_once(self):
+        """Procesa un lote de pendientes vencidos. Devuelve cuántos se reclamaron"""
+        rows = self.queue.claim(self.max_bulk)
+        if not rows:
+            return 0
+        with span("leads.send", leads=len(rows)):
+            if len(rows) < self.bulk_threshold:
+                self._send_each(rows)
+            else:
+                try:
+                    self.client.subscribe_many([(email, name) for email, name, _ in rows])
+                except MoosendError as e:
+                    if e.retryable:
+                        self.queue.mark_retry(rows, e)
+                    else:
+                        # Un email inválido tumba el lote entero: se separan para aislarlo
+                        self._send_each(rows)
+                else:
+                    self.queue.mark_sent([email for email, _, _ in rows])
+        return len(rows)
+
+    def drain(self):
+        """Procesa hasta que no quede nada vencido (CLI y pruebas)"""
+        total = 0
+        while True:
+            n = self.run_once()
+            if not n:
+                return total
+            total += n
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                busy = self.run_once()
+            except Exception as e:
+                logger.warning("leads: %s", e)
+                busy = 0
+            if busy:
+                continue
+            due = self.queue.next_due()
+            self._wake.wait(self.poll_interval if due is None else min(due, self.poll_interval))
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="leads-worker")
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_lead_worker(api_key, list_id):
+    """Cola y hilo de envío compartidos del proceso (se arrancan la primera vez)"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = LeadWorker(LeadQueue(), MoosendClient(api_key, list_id)).start()
+        return _worker
@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==============================================================================
+#  MÉTRICAS Y TRAZAS POR ETAPA
+# ==============================================================================
+# Sin dependencias: contadores e histogramas en memoria del proceso, volcados
+# en formato de texto Prometheus (GET /metrics si se arranca el servidor con
+# LOOPING_METRICS_PORT; escucha en 127.0.0.1 salvo que LOOPING_METRICS_HOST
+# diga otra cosa). Cada `span` mide una etapa, la suma al histograma de
+# etapas, la apunta en la traza de la ejecución actual (panel de depuración) y
+# la emite como log JSON por el logger "looping.metrics" (LOOPING_SPAN_LOG=1
+# para verla por stderr sin configurar logging).
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RATE_BUCKETS = (1e3, 1e4, 1e5, 3e5, 1e6, 3e6, 1e7, 3e7, 1e8)
+
+logger = logging.getLogger("looping.metrics")
+if os.environ.get("LOOPING_SPAN_LOG") == "1" and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_one(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    """Contador monótono con etiquetas"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _render_one(self, key, value):
+        return [f"{self.name}{_label_str(self.labelnames, key)} {value}"]
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con cubos fijos (como prometheus_client)"""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= b) for c, b in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, n + 1)
+
+    def count(self, **labels):
+        hit = self._values.get(self._key(labels))
+        return hit[2] if hit else 0
+
+    def _render_one(self, key, value):
+        counts, total, n = value
+        labels = self.labelnames
+        lines = []
+        for le, c in [(f"{b:g}", c) for b, c in zip(self.buckets, counts)] + [("+Inf", n)]:
+            le_label = 'le="%s"' % le
+            lines.append(f"{self.name}_bucket{_label_str(labels, key, [le_label])} {c}")
+        lines.append(f"{self.name}_sum{_label_str(labels, key)} {total}")
+        lines.append(f"{self.name}_count{_label_str(labels, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self):
+        """Todas las métricas en formato de texto Prometheus 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("looping_stage_seconds", "Duración de cada etapa instrumentada", ["stage"])
+STAGE_ERRORS = REGISTRY.counter("looping_stage_errors_total", "Etapas terminadas con excepción", ["stage"])
+RPC_SECONDS = REGISTRY.histogram("looping_rpc_request_seconds", "Latencia de las llamadas RPC correctas", ["endpoint"])
+RPC_REQUESTS = REGISTRY.counter("looping_rpc_requests_total", "Llamadas RPC por endpoint y resultado", ["endpoint", "result"])
+CACHE_REQUESTS = REGISTRY.counter("looping_cache_requests_total", "Consultas a cachés (hit/miss)", ["cache", "result"])
+BACKTEST_ROWS = REGISTRY.counter("looping_backtest_rows_total", "Velas simuladas", ["engine"])
+BACKTEST_ROWS_PER_SECOND = REGISTRY.histogram("looping_backtest_rows_per_second", "Velas por segundo de cada backtest",
+                                              ["engine"], buckets=RATE_BUCKETS)
+
+
+# ==============================================================================
+#  TRAZAS (PANEL DE DEPURACIÓN Y LOGS)
+# ==============================================================================
+
+_trace = ContextVar("looping_trace", default=None)
+
+
+def start_trace():
+    """Empieza una traza nueva para la ejecución actual y la devuelve (lista de spans)"""
+    spans = []
+    _trace.set(spans)
+    return spans
+
+
+def current_trace():
+    return _trace.get() or []
+
+
+@contextmanager
+def span(stage, **labels):
+    """Mide una etapa: histograma de etapas, traza actual y log JSON"""
+    t0 = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        record = {"stage": stage, "ms": round(elapsed * 1000, 2), "ok": ok, **labels}
+        spans = _trace.get()
+        if spans is not None:
+            spans.append(record)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"event": "span", **record}, default=str, ensure_ascii=False))
+
+
+def record_rpc(endpoint, elapsed=None):
+    """Llamada RPC terminada: con `elapsed` si fue bien, sin él si falló.
+
+    `endpoint` acaba como etiqueta pública: el host, nunca la URL con la API key.
+    """
+    RPC_REQUESTS.inc(endpoint=endpoint, result="ok" if elapsed is not None else "error")
+    if elapsed is not None:
+        RPC_SECONDS.observe(elapsed, endpoint=endpoint)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_backtest(engine, rows, elapsed):
+    BACKTEST_ROWS.inc(rows, engine=engine)
+    if elapsed > 0:
+        BACKTEST_ROWS_PER_SECOND.observe(rows / elapsed, engine=engine)
+
+
+# ==============================================================================
+#  ENDPOINT /metrics
+# ==============================================================================
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve(port, host="127.0.0.1"):
+    """Arranca (una sola vez por proceso) el servidor /metrics en un hilo daemon"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
+
+
+def serve_from_env():
+    """Servidor /metrics si LOOPING_METRICS_PORT está definido; None si no (o si el puerto está ocupado)"""
+    port = os.environ.get("LOOPING_METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return serve(port, os.environ.get("LOOPING_METRICS_HOST", "127.0.0.1"))
+    except OSError:
+        return None
@@ -0,0 +1,167 @@
+import numpy as np
+
+from .backtest_engine import initial_position, ohlc_arrays
+
+# ==============================================================================
+#  MOTOR MONTE CARLO DE PROBABILIDAD DE LIQUIDACIÓN
+# ==============================================================================
+# Misma regla de defensa que el backtest (trigger en liq * (1 + umbral),
+# recarga hasta recuperar el ratio objetivo) aplicada a miles de trayectorias
+# a la vez: el bucle es sobre días y cada paso opera con arrays de tamaño
+# "número de trayectorias". Las trayectorias se generan día a día y por
+# bloques de trayectorias, así que la memoria no depende del horizonte.
+#
+# Todo escala con el precio inicial, por lo que se simula con precio 1.
+
+DEFAULT_CHUNK = 50_000
+DEFAULT_BLOCK = 20           # días por bloque en el bootstrap
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+def fit_returns(df_hist):
+    """Rendimientos logarítmicos diarios del histórico (cierre, apertura y mínimo respecto al cierre previo)"""
+    _, opens, lows, closes = ohlc_arrays(df_hist)
+    if closes.size < 3:
+        raise ValueError("Histórico insuficiente para estimar rendimientos")
+    prev = closes[:-1]
+    r_close = np.log(closes[1:] / prev)
+    r_open = np.log(opens[1:] / prev)
+    r_low = np.log(lows[1:] / prev)
+    # Mecha: cuánto baja el mínimo por debajo de min(apertura, cierre)
+    wick = np.maximum(0.0, np.minimum(r_open, r_close) - r_low)
+    return {
+        "r_close": r_close,
+        "r_open": r_open,
+        "r_low": np.minimum(r_low, np.minimum(r_open, r_close)),
+        "wick": wick,
+        "mu": float(r_close.mean()),
+        "sigma": float(r_close.std(ddof=1)),
+    }
+
+
+class _Bootstrap:
+    """Generador día a día de rendimientos por bloques contiguos del histórico"""
+
+    def __init__(self, model, n, block, rng):
+        self.model = model
+        self.n_hist = model["r_close"].size
+        self.block = max(1, min(block, self.n_hist))
+        self.rng = rng
+        self.idx = rng.integers(0, self.n_hist - self.block + 1, n)
+        self.left = np.full(n, self.block)
+
+    def step(self):
+        renew = self.left == 0
+        if renew.any():
+            self.idx[renew] = self.rng.integers(0, self.n_hist - self.block + 1, int(renew.sum()))
+            self.left[renew] = self.block
+        i = self.idx
+        out = self.model["r_close"][i], self.model["r_open"][i], self.model["r_low"][i]
+        self.idx = i + 1
+        self.left -= 1
+        return out
+
+
+class _GBM:
+    """Generador día a día de un movimiento browniano geométrico con mechas del histórico"""
+
+    def __init__(self, model, n, rng, mu=None, sigma=None):
+        self.n = n
+        self.rng = rng
+        self.drift = (model["mu"] if mu is None else mu)
+        self.sigma = model["sigma"] if sigma is None else sigma
+        self.wick = model["wick"]
+
+    def step(self):
+        r_close = self.drift + self.sigma * self.rng.standard_normal(self.n)
+        r_open = np.zeros(self.n)
+        r_low = np.minimum(0.0, r_close) - self.wick[self.rng.integers(0, self.wick.size, self.n)]
+        return r_close, r_open, r_low
+
+
+def _simulate_chunk(gen, n, horizon, capital, leverage, threshold, ltv):
+    collat, debt_usd, liq, target_ratio = initial_position(capital, leverage, ltv, 1.0)
+    collat = np.full(n, collat)
+    liq = np.full(n, liq)
+    injected = np.zeros(n)
+    alive = np.ones(n, dtype=bool)
+    liq_day = np.full(n, -1)
+    defenses = np.zeros(n, dtype=np.int32)
+    close = np.ones(n)
+
+    for day in range(horizon):
+        r_close, r_open, r_low = gen.step()
+        open_p = close * np.exp(r_open)
+        low_p = close * np.exp(r_low)
+        close = close * np.exp(r_close)
+
+        trigger = liq * (1 + threshold)
+        hit = alive & (low_p <= trigger)
+        if hit.any():
+            defense_p = np.minimum(open_p, trigger)
+            dead = hit & (defense_p <= liq)
+            defend = hit & ~dead
+            target_liq = defense_p * target_ratio
+            with np.errstate(divide="ignore", invalid="ignore"):
+                add = np.where(defend, debt_usd / (target_liq * ltv) - collat, 0.0)
+            add = np.where(add > 0, add, 0.0)
+            injected += add * defense_p
+            collat += add
+            liq = np.where(add > 0, target_liq, liq)
+            defenses += add > 0
+            newly = dead | (alive & (low_p <= liq))
+        else:
+            newly = alive & (low_p <= liq)
+
+        liq_day[newly] = day
+        alive &= ~newly
+
+    final_value = np.where(alive, collat * close - debt_usd, 0.0)
+    return {
+        "liquidated": ~alive,
+        "liq_day": liq_day,
+        "injected": injected,
+        "final_value": final_value,
+        "defenses": defenses,
+        "final_price": close,
+    }
+
+
+def simulate_paths(model, n_paths, horizon, capital, leverage, threshold, ltv,
+                   method="bootstrap", block=DEFAULT_BLOCK, chunk=DEFAULT_CHUNK, seed=None,
+                   mu=None, sigma=None):
+    """Simula `n_paths` trayectorias de `horizon` días y aplica la regla de defensa a todas.
+
+    `method` es "bootstrap" (bloques del histórico) o "gbm". Devuelve un dict de
+    arrays por trayectoria (liquidated, liq_day, injected, final_value, defenses, final_price).
+    """
+    rng = np.random.default_rng(seed)
+    parts = []
+    for start in range(0, n_paths, chunk):
+        n = min(chunk, n_paths - start)
+        if method == "gbm":
+            gen = _GBM(model, n, rng, mu, sigma)
+        else:
+            gen = _Bootstrap(model, n, block, rng)
+        parts.append(_simulate_chunk(gen, n, horizon, capital, leverage, threshold, ltv))
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def summarize(res, capital, quantiles=QUANTILES):
+    """Probabilidad de liquidación y cuantiles de capital inyectado y valor final"""
+    liquidated = res["liquidated"]
+    days = res["liq_day"][liquidated]
+    return {
+        "paths": liquidated.size,
+        "p_liquidation": float(liquidated.mean()),
+        "p_defense": float((res["defenses"] > 0).mean()),
+        "median_liq_day": float(np.median(days)) if days.size else None,
+        "quantiles": {
+            q: {
+                "injected": float(np.quantile(res["injected"], q)),
+                "final_value": float(np.quantile(res["final_value"], q)),
+                "roi": float(np.quantile((res["final_value"] - capital - res["injected"]) / (capital + res["injected"]), q)),
+            }
+            for q in quantiles
+        },
+    }
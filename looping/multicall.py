@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+#  LECTURA MASIVA DE CUENTAS AAVE VÍA MULTICALL3
+# ==============================================================================
+# Multicall3 está desplegado en la misma dirección en todas las redes que
+# usamos. Empaquetamos miles de getUserAccountData en llamadas aggregate3 y
+# decodificamos todas las respuestas de golpe con NumPy (6 uint256 por cuenta).
+
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+# Llamadas por aggregate3; los RPC públicos suelen cortar por gas/tamaño por encima de ~1000
+DEFAULT_CHUNK_SIZE = 500
+
+# Selectores precalculados (keccak de la firma) para no cargar web3 al importar
+ACCOUNT_DATA_SELECTOR = bytes.fromhex("bf92857c")  # getUserAccountData(address)
+ACCOUNT_DATA_WORDS = 6
+
+# Pesos para reconstruir un uint256 a partir de 4 palabras uint64 big-endian
+_WORD_WEIGHTS = np.array([2.0 ** 192, 2.0 ** 128, 2.0 ** 64, 1.0])
+
+WATCHLIST_COLUMNS = ["address", "col_usd", "debt_usd", "lt_avg", "hf", "ok"]
+
+
+def parse_addresses(text):
+    """Extrae direcciones válidas (checksum, sin duplicados) de un texto libre. Devuelve (válidas, inválidas)"""
+    from web3 import Web3
+
+    tokens = [t.strip() for t in text.replace(",", "\n").replace(";", "\n").split()]
+    valid, invalid = [], []
+    for t in tokens:
+        if not t:
+            continue
+        if Web3.is_address(t):
+            valid.append(Web3.to_checksum_address(t))
+        else:
+            invalid.append(t)
+    return list(dict.fromkeys(valid)), invalid
+
+
+def account_data_calldata(address):
+    from eth_abi import encode
+
+    return ACCOUNT_DATA_SELECTOR + encode(["address"], [address])
+
+
+def decode_account_data(results):
+    """Decodifica en bloque una lista de (success, returnData) de getUserAccountData.
+
+    Devuelve (matriz float (n, 6) con los valores crudos, máscara de éxito).
+    """
+    n = len(results)
+    size = ACCOUNT_DATA_WORDS * 32
+    ok = np.array([bool(s) and len(r) == size for s, r in results], dtype=bool)
+    blob = b"".join(r if good else b"\x00" * size for (_, r), good in zip(results, ok))
+    words = np.frombuffer(blob, dtype=">u8").reshape(n, ACCOUNT_DATA_WORDS, 4).astype(float)
+    return words @ _WORD_WEIGHTS, ok
+
+
+def account_frame(addresses, raw, ok):
+    """Convierte los valores crudos al mismo formato que portfolio_data (ordenado por HF)"""
+    df = pd.DataFrame({
+        "address": addresses,
+        "col_usd": raw[:, 0] / 10**8,
+        "debt_usd": raw[:, 1] / 10**8,
+        "lt_avg": raw[:, 3] / 10000,
+        "hf": raw[:, 5] / 10**18,
+        "ok": ok,
+    }, columns=WATCHLIST_COLUMNS)
+    # Sin deuda Aave devuelve uint256 máximo como HF
+    df.loc[df["debt_usd"] == 0, "hf"] = np.inf
+    df.loc[~df["ok"], ["col_usd", "debt_usd", "lt_avg", "hf"]] = np.nan
+    return df.sort_values("hf", na_position="last").reset_index(drop=True)
+
+
+def aggregate3(w3, calls, chunk_size=DEFAULT_CHUNK_SIZE, block_identifier="latest"):
+    """Ejecuta [(target, callData), ...] con allowFailure en lotes aggregate3.
+
+    Devuelve (lista de (success, returnData), número de llamadas RPC realizadas).
+    """
+    from web3 import Web3
+
+    mc = w3.eth.contract(address=Web3.to_checksum_address(MULTICALL3_ADDRESS), abi=MULTICALL3_ABI)
+    results = []
+    rpc_calls = 0
+    for i in range(0, len(calls), chunk_size):
+        chunk = [(Web3.to_checksum_address(t), True, data) for t, data in calls[i:i + chunk_size]]
+        results.extend(mc.functions.aggregate3(chunk).call(block_identifier=block_identifier))
+        rpc_calls += 1
+    return results, rpc_calls
+
+
+def scan_accounts(w3, pool_addr, addresses, chunk_size=DEFAULT_CHUNK_SIZE, block_identifier="latest"):
+    """Lee getUserAccountData de todas las direcciones en lotes aggregate3.
+
+    Devuelve (DataFrame ordenado por HF, número de llamadas RPC realizadas).
+    """
+    if not addresses:
+        return pd.DataFrame(columns=WATCHLIST_COLUMNS), 0
+
+    calls = [(pool_addr, account_data_calldata(a)) for a in addresses]
+    results, rpc_calls = aggregate3(w3, calls, chunk_size, block_identifier)
+
+    raw, ok = decode_account_data(results)
+    return account_frame(addresses, raw, ok), rpc_calls
@@ -0,0 +1,72 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+
+# ==============================================================================
+#  ESCÁNER MULTI-RED (UNA WALLET, TODAS LAS REDES A LA VEZ)
+# ==============================================================================
+# Cada red lee getUserAccountData en un lote JSON-RPC (getPool solo la
+# primera vez) en su propio hilo. Los resultados se entregan según van
+# llegando, así que la espera total es la de la red más lenta y no la suma
+# de todas.
+
+NETWORK_TIMEOUT = 30  # segundos máximos por red antes de darla por perdida
+
+
+def account_row(network_name, data, elapsed, rpc_url=None, block=None):
+    """Fila de resultados a partir de la respuesta cruda de getUserAccountData"""
+    debt_usd = data[1] / 10**8
+    return {
+        "Red": network_name,
+        "col_usd": data[0] / 10**8,
+        "debt_usd": debt_usd,
+        "lt_avg": data[3] / 10000,
+        "hf": data[5] / 10**18 if debt_usd > 0 else float("inf"),
+        "Estado": "✅ Posición" if data[0] > 0 or data[1] > 0 else "— Vacía",
+        "Tiempo (s)": round(elapsed, 2),
+        "rpc": rpc_url,
+        "block": block,
+    }
+
+
+def error_row(network_name, exc, elapsed):
+    return {
+        "Red": network_name,
+        "col_usd": None,
+        "debt_usd": None,
+        "lt_avg": None,
+        "hf": None,
+        "Estado": f"❌ {type(exc).__name__}",
+        "Tiempo (s)": round(elapsed, 2),
+        "rpc": None,
+        "block": None,
+    }
+
+
+def scan_networks(network_names, read_fn, max_workers=None, timeout=NETWORK_TIMEOUT):
+    """Lanza read_fn(red) en paralelo para todas las redes y va entregando filas según responden.
+
+    `read_fn` devuelve (datos crudos de getUserAccountData, RPC usado, bloque de la lectura).
+    """
+    network_names = list(network_names)
+    if not network_names:
+        return
+    t0 = time.perf_counter()
+    ex = ThreadPoolExecutor(max_workers=max_workers or len(network_names))
+    futures = {ex.submit(read_fn, name): name for name in network_names}
+    pending = set(futures)
+    try:
+        for fut in as_completed(futures, timeout=timeout):
+            pending.discard(fut)
+            name = futures[fut]
+            elapsed = time.perf_counter() - t0
+            try:
+                data, rpc_url, block = fut.result()
+                yield account_row(name, data, elapsed, rpc_url, block)
+            except Exception as e:
+                yield error_row(name, e, elapsed)
+    except FuturesTimeout as e:  # antes de Python 3.11 no es el TimeoutError nativo
+        for fut in pending:
+            yield error_row(futures[fut], e, time.perf_counter() - t0)
+    finally:
+        # No esperamos a las redes colgadas: sus hilos terminan solos por el timeout del RPC
+        ex.shutdown(wait=False, cancel_futures=True)
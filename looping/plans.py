@@ -0,0 +1,132 @@
+from functools import lru_cache, wraps
+
+import numpy as np
+import pandas as pd
+
+from .cascade import capital_surface, cascade, position_from_leverage
+from .metrics import record_cache
+
+# ==============================================================================
+#  PLANES DE DEFENSA (CALCULADORA, MODO A Y MODO B DEL ESCÁNER)
+# ==============================================================================
+# Tablas que muestra la interfaz, construidas sin Streamlit para poder usarlas
+# desde la CLI y medirlas aparte. Son funciones puras de sus parámetros, así
+# que se memorizan (LRU acotado): mover un slider y volver atrás, o que varias
+# sesiones pidan lo mismo, no recalcula nada.
+
+PLAN_CACHE_SIZE = 256
+
+# Rejilla del mapa Apalancamiento × Umbral de la Calculadora
+SURFACE_LEVERAGES = np.round(np.arange(1.1, 5.0 + 1e-9, 0.1), 2)
+SURFACE_THRESHOLDS = np.round(np.arange(0.01, 0.505, 0.01), 2)
+
+
+def _protect(value):
+    """Vista del resultado cacheado que no permite alterar la caché (copia del DataFrame, arrays de solo lectura)"""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()  # copia completa: las tablas son pequeñas y no dependemos del copy-on-write de pandas 3
+    if isinstance(value, np.ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(value, tuple):
+        return tuple(_protect(v) for v in value)
+    return value
+
+
+def memoized(fn):
+    """LRU acotado sobre los argumentos de fn; la original queda en `fn.__wrapped__`"""
+    cached = lru_cache(maxsize=PLAN_CACHE_SIZE)(fn)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        hits = cached.cache_info().hits
+        result = cached(*args, **kwargs)
+        record_cache(fn.__name__, cached.cache_info().hits > hits)
+        return _protect(result)
+
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+
+@memoized
+def calculator_plan(price, target, capital, leverage, ltv, threshold, zones):
+    """Tabla en cascada de la Calculadora. Devuelve (DataFrame, precio de liquidación inicial)"""
+    debt_usd, collat_amt = position_from_leverage(capital, leverage, price)
+    cc = cascade(price, debt_usd, collat_amt, ltv, threshold, zones)
+
+    # Métricas financieras
+    total_inv = capital + cc["cum_cost"]
+    final_val = cc["collat"] * target
+    net_prof = (final_val - debt_usd) - total_inv
+    roi = np.where(total_inv > 0, net_prof / np.where(total_inv > 0, total_inv, 1) * 100, 0)
+    ratio = np.where(cc["drop_pct"] > 0, roi / np.where(cc["drop_pct"] > 0, cc["drop_pct"] * 100, 1), 0)
+
+    df = pd.DataFrame({
+        "Zona": [f"#{i}" for i in range(1, zones + 1)],
+        "Precio Activación": cc["trigger"],
+        "Caída (%)": cc["drop_pct"],
+        "Inversión Extra ($)": cc["cost"],
+        "Total Invertido ($)": total_inv,
+        "Nuevo P. Liq": cc["new_liq"],
+        "Nuevo HF": cc["new_hf"],
+        "Beneficio ($)": net_prof,
+        "ROI (%)": roi,
+        "Ratio": ratio
+    })
+    return df, float(cc["liq_0"])
+
+
+@memoized
+def mode_a_plan(price, asset_amt, asset_lt, debt_eff, debt_usd, threshold, zones):
+    """Plan del Modo A (un colateral defendido, el resto fijo). `debt_eff` es la deuda no cubierta por los demás"""
+    sc = cascade(price, debt_eff, asset_amt, asset_lt, threshold, zones, clamp=True)
+    # HF real: lo que cubre este activo más lo que ya cubren los demás
+    covered_others = debt_usd - debt_eff
+    return pd.DataFrame({
+        "Zona": [f"#{i}" for i in range(1, zones + 1)],
+        "Precio Activación": sc["trigger"],
+        "Inyectar (Tokens)": sc["add"],
+        "Costo ($)": sc["cost"],
+        "Acumulado ($)": sc["cum_cost"],
+        "Nuevo Liq": sc["new_liq"],
+        "Nuevo HF": (sc["collat"] * sc["trigger"] * asset_lt + covered_others) / debt_usd
+    })
+
+
+@memoized
+def mode_b_triggers(current_hf, num_defenses):
+    """HF de activación de cada defensa del Modo B, repartidos linealmente entre el HF actual y 1.0"""
+    i = np.arange(1, num_defenses + 1)
+    hf_step = (current_hf - 1.0) / num_defenses
+    return np.maximum(current_hf - hf_step * i, 1.001)
+
+
+@memoized
+def mode_b_plan(col_usd, debt_usd, lt_avg, current_hf, num_defenses, w_price, w_ticker):
+    """Plan preventivo del Modo B: capital a restaurar en cada defensa"""
+    trigger_hf = mode_b_triggers(current_hf, num_defenses)
+
+    drop_pct = 1 - (trigger_hf / current_hf)
+    shocked_col = col_usd * (1 - drop_pct)
+    shocked_lt_val = (col_usd * lt_avg) * (1 - drop_pct)
+
+    needed_capital = np.maximum(debt_usd - (shocked_lt_val / current_hf), 0)
+    final_debt = debt_usd - needed_capital
+    with np.errstate(divide="ignore", invalid="ignore"):
+        final_hf = np.where(final_debt > 0, (shocked_col * lt_avg) / final_debt, 999.0)
+
+    return pd.DataFrame({
+        "Trigger HF": [f"{v:.2f}" for v in trigger_hf],
+        "Caída Mercado": [f"-{v:.2%}" for v in drop_pct],
+        f"Precio {w_ticker}": w_price * (1 - drop_pct),
+        "Capital a Restaurar ($)": needed_capital,
+        "Nuevo HF": [f"{v:.2f}" for v in final_hf]
+    })
+
+
+@memoized
+def calculator_surface(capital, price, ltv, zones):
+    """Mapa Apalancamiento × Umbral de la Calculadora: (capital total requerido, caída cubierta)"""
+    return capital_surface(capital, price, ltv, SURFACE_LEVERAGES, SURFACE_THRESHOLDS, zones)
@@ -0,0 +1,201 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from .backtest_engine import ACTION_DEFENSE, ACTION_HOLD, ACTION_LIQUIDATED
+from .metrics import record_backtest, span
+
+# ==============================================================================
+#  BACKTEST MULTI-ACTIVO (POSICIÓN TIPO AAVE CON VARIOS COLATERALES)
+# ==============================================================================
+# Misma regla de defensa que el backtest de un activo, expresada en Health
+# Factor: con un solo activo "precio <= liq * (1 + umbral)" equivale a
+# "HF <= 1 + umbral" y "volver al ratio objetivo" equivale a volver al HF
+# inicial. El HF de la cartera es sum(tokens_i * precio_i * LT_i) / deuda, es
+# decir, un producto matriz-vector por vela, así que añadir activos apenas
+# cuesta: solo crece el ancho de las matrices.
+
+PORTFOLIO_COLUMNS = ["Acción", "HF", "LT Medio", "Inversión Acumulada", "Valor Estrategia", "Valor HODL"]
+
+
+def fetch_panel(tickers, start, end):
+    """Descarga todos los tickers en una sola llamada y los alinea en un índice de fechas común"""
+    import yfinance as yf  # diferido: solo se carga si hay que descargar
+
+    tickers = list(dict.fromkeys(tickers))
+    with span("yf.download", tickers=len(tickers)):
+        raw = yf.download(tickers, start=start, end=end, progress=False, group_by="column")
+    if raw.empty:
+        return None
+
+    panel = {}
+    for field in ["Open", "Low", "Close"]:
+        frame = raw[field]
+        if isinstance(frame, pd.Series):
+            frame = frame.to_frame(tickers[0])
+        panel[field] = frame.reindex(columns=tickers)
+
+    # Solo fechas en las que todos los activos tienen vela
+    valid = panel["Close"].notna().all(axis=1)
+    for field in panel:
+        panel[field] = panel[field][valid]
+    panel["Open"] = panel["Open"].fillna(panel["Close"])
+    panel["Low"] = panel["Low"].fillna(panel["Close"])
+    return panel
+
+
+def _next_event(lows, start, weighted, debt_usd, threshold):
+    """Siguiente vela cuyo HF en mínimos toca el trigger o la liquidación"""
+    barrier = max(1 + threshold, 1.0) * debt_usd
+    n = lows.shape[0]
+    window = 16
+    while start < n:
+        stop = min(n, start + window)
+        # HF * deuda en los mínimos de cada vela de la ventana
+        hits = (lows[start:stop] @ weighted <= barrier).nonzero()[0]
+        if hits.size:
+            return start + int(hits[0])
+        start = stop
+        window *= 4
+    return None
+
+
+def simulate_portfolio(opens, lows, closes, weights, lts, capital, leverage, threshold, defense_asset=0):
+    """Simula la cartera apalancada sobre matrices (velas × activos).
+
+    `weights` reparte el colateral inicial, `lts` son los liquidation thresholds
+    por activo y `defense_asset` es la columna que recibe las inyecciones.
+    """
+    opens = np.asarray(opens, dtype=float)
+    lows = np.asarray(lows, dtype=float)
+    closes = np.asarray(closes, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    weights = weights / weights.sum()
+    lts = np.asarray(lts, dtype=float)
+    n = closes.shape[0]
+
+    start_prices = closes[0]
+    collateral_usd = capital * leverage
+    debt_usd = collateral_usd - capital
+    amounts = collateral_usd * weights / start_prices
+    hodl_amounts = capital * weights / start_prices
+
+    hf_target = (amounts * start_prices) @ lts / debt_usd
+    k = defense_asset
+
+    actions = np.full(n, ACTION_HOLD, dtype=object)
+    amounts_hist = np.empty((n, amounts.size))
+    inj_arr = np.empty(n)
+    total_injected = 0.0
+    is_liquidated = False
+    defenses = 0
+
+    pos = 0
+    end = n
+    while pos < n and not is_liquidated:
+        weighted = amounts * lts
+        idx = _next_event(lows, pos, weighted, debt_usd, threshold)
+        seg_end = n if idx is None else idx
+
+        amounts_hist[pos:seg_end] = amounts
+        inj_arr[pos:seg_end] = total_injected
+        if idx is None:
+            break
+
+        trigger_num = (1 + threshold) * debt_usd
+        low_num = lows[idx] @ weighted
+        if low_num <= trigger_num:
+            # Precio de defensa: en la apertura si ya abrió por debajo del trigger,
+            # si no en el punto del recorrido apertura -> mínimo donde HF = 1 + umbral
+            open_num = opens[idx] @ weighted
+            if open_num <= trigger_num or open_num == low_num:
+                defense_prices = opens[idx]
+                defense_num = open_num
+            else:
+                frac = (open_num - trigger_num) / (open_num - low_num)
+                defense_prices = opens[idx] + frac * (lows[idx] - opens[idx])
+                defense_num = trigger_num
+
+            if defense_num <= debt_usd:
+                is_liquidated = True
+                actions[idx] = ACTION_LIQUIDATED
+            else:
+                gap = hf_target * debt_usd - defense_num
+                # Tolerancia relativa: con HF ya en objetivo no inyectamos ruido de coma flotante
+                if gap > 1e-9 * debt_usd:
+                    add_amt = gap / (defense_prices[k] * lts[k])
+                    total_injected += add_amt * defense_prices[k]
+                    amounts = amounts.copy()
+                    amounts[k] += add_amt
+                    actions[idx] = ACTION_DEFENSE
+                    defenses += 1
+
+        if lows[idx] @ (amounts * lts) <= debt_usd and not is_liquidated:
+            is_liquidated = True
+
+        amounts_hist[idx] = amounts
+        inj_arr[idx] = total_injected
+        pos = idx + 1
+        if is_liquidated:
+            end = idx + 1
+
+    amounts_hist = amounts_hist[:end]
+    col_close = amounts_hist * closes[:end]
+    col_value = col_close.sum(axis=1)
+    hf = (col_close @ lts) / debt_usd
+    lt_avg = (col_close @ lts) / col_value
+    values = col_value - debt_usd
+    if is_liquidated:
+        values[-1] = 0.0
+        hf[-1] = 0.0
+
+    return {
+        "rows": end,
+        "Acción": actions[:end],
+        "HF": hf,
+        "LT Medio": lt_avg,
+        "Inversión Acumulada": capital + inj_arr[:end],
+        "Valor Estrategia": values,
+        "Valor HODL": closes[:end] @ hodl_amounts,
+        "amounts": amounts_hist,
+        "start_prices": start_prices,
+        "debt_usd": debt_usd,
+        "hf_target": hf_target,
+        "total_injected": total_injected,
+        "is_liquidated": is_liquidated,
+        "defenses": defenses,
+    }
+
+
+def run_portfolio_backtest(panel, weights, lts, capital, leverage, threshold, defense_ticker):
+    """Ejecuta el backtest de cartera sobre el panel de fetch_panel y devuelve (df_res, resumen)"""
+    closes = panel["Close"]
+    if closes.empty:
+        return pd.DataFrame(columns=PORTFOLIO_COLUMNS), None
+    tickers = list(closes.columns)
+
+    t0 = time.perf_counter()
+    with span("backtest.simulate", bars=len(closes), assets=len(tickers)):
+        sim = simulate_portfolio(
+            panel["Open"].to_numpy(), panel["Low"].to_numpy(), closes.to_numpy(),
+            [weights[t] for t in tickers], [lts[t] for t in tickers],
+            capital, leverage, threshold, tickers.index(defense_ticker)
+        )
+    rows = sim["rows"]
+    record_backtest("portfolio", rows, time.perf_counter() - t0)
+    df_res = pd.DataFrame({col: sim[col] for col in PORTFOLIO_COLUMNS}, index=closes.index[:rows])
+    df_res.index.name = "Fecha"
+
+    summary = {
+        "start_date": closes.index[0].date(),
+        "start_prices": dict(zip(tickers, sim["start_prices"])),
+        "final_amounts": dict(zip(tickers, sim["amounts"][-1])),
+        "debt_usd": sim["debt_usd"],
+        "hf_target": sim["hf_target"],
+        "is_liquidated": sim["is_liquidated"],
+        "total_injected": sim["total_injected"],
+        "defenses": sim["defenses"],
+        "final_value": float(df_res["Valor Estrategia"].iloc[-1]),
+    }
+    return df_res, summary
@@ -0,0 +1,204 @@
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+from .metrics import record_cache, span
+
+# ==============================================================================
+#  ALMACÉN LOCAL DE PRECIOS OHLC (ARRAYS MAPEADOS EN MEMORIA)
+# ==============================================================================
+# Un fichero .npy por ticker con un array estructurado ordenado por fecha.
+# Se abre con mmap_mode='r', así que todos los procesos de Streamlit comparten
+# las mismas páginas del sistema operativo en vez de tener cada sesión su
+# propia copia. Solo se descargan de Yahoo las velas que faltan.
+
+DEFAULT_DATA_DIR = os.environ.get("LOOPING_DATA_DIR", os.path.join(".data", "prices"))
+
+# Segundos que damos por buena la última vela antes de volver a preguntar a Yahoo
+DEFAULT_MAX_AGE = 15 * 60
+
+OHLC_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+OHLC_DTYPE = np.dtype([("ts", "<i8")] + [(f, "<f8") for f in OHLC_FIELDS])
+
+
+def _to_records(df):
+    """Convierte la salida de yf.download en un array estructurado OHLC_DTYPE"""
+    if df is None or df.empty:
+        return np.empty(0, dtype=OHLC_DTYPE)
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.copy()
+        df.columns = df.columns.get_level_values(0)
+    idx = pd.DatetimeIndex(df.index)
+    if idx.tz is not None:
+        idx = idx.tz_convert("UTC").tz_localize(None)
+    rec = np.empty(len(df), dtype=OHLC_DTYPE)
+    rec["ts"] = idx.as_unit("ns").asi8
+    for f in OHLC_FIELDS:
+        rec[f] = df[f].to_numpy(dtype=float) if f in df.columns else np.nan
+    return rec
+
+
+def _merge(*parts):
+    """Une varios bloques quedándose con la última versión de cada vela"""
+    parts = [p for p in parts if p is not None and p.size]
+    if not parts:
+        return np.empty(0, dtype=OHLC_DTYPE)
+    rec = np.concatenate(parts)
+    # np.unique se queda con la primera aparición: invertimos para priorizar lo más nuevo
+    rev = rec[::-1]
+    _, first = np.unique(rev["ts"], return_index=True)
+    return rev[first]
+
+
+def _to_ts(d):
+    return pd.Timestamp(d).value
+
+
+class PriceStore:
+    """Almacén de precios por ticker con descarga incremental"""
+
+    def __init__(self, root=DEFAULT_DATA_DIR, max_age=DEFAULT_MAX_AGE, interval="1d"):
+        self.root = root
+        self.max_age = max_age
+        self.interval = interval
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, ticker):
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", ticker.upper())
+        return os.path.join(self.root, f"{safe}_{self.interval}.npy")
+
+    @contextmanager
+    def _lock(self, ticker):
+        """Evita que varios procesos descarguen el mismo ticker a la vez"""
+        if fcntl is None:
+            yield
+            return
+        with open(self._path(ticker) + ".lock", "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def read(self, ticker):
+        """Devuelve el array mapeado en memoria del ticker (o None si no hay nada guardado)"""
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def _write(self, ticker, rec):
+        path = self._path(ticker)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            np.save(fh, rec)
+        # Reemplazo atómico: los lectores con el mmap antiguo siguen siendo válidos
+        os.replace(tmp, path)
+
+    def _covered_from(self, ticker):
+        """Fecha (ts) desde la que ya se pidió histórico, aunque Yahoo no tuviera velas tan antiguas"""
+        try:
+            with open(self._path(ticker) + ".json") as fh:
+                return json.load(fh)["from"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _is_fresh(self, ticker, stored, start):
+        if stored is None or stored.size == 0:
+            return False
+        covered = self._covered_from(ticker)
+        if covered is None or covered > _to_ts(start):
+            return False
+        try:
+            return time.time() - os.path.getmtime(self._path(ticker)) < self.max_age
+        except OSError:
+            return False
+
+    def _download(self, ticker, start, end):
+        import yfinance as yf  # diferido: solo se carga si hay que descargar
+
+        with span("yf.download", ticker=ticker, interval=self.interval):
+            return _to_records(yf.download(ticker, start=start, end=end, interval=self.interval, progress=False))
+
+    def update(self, ticker, start):
+        """Descarga solo lo que falta (histórico anterior a lo guardado y velas nuevas)"""
+        stored = self.read(ticker)
+        fresh = self._is_fresh(ticker, stored, start)
+        record_cache("price_store", fresh)
+        if fresh:
+            return stored
+
+        with self._lock(ticker):
+            # Otro proceso pudo actualizar mientras esperábamos el lock
+            stored = self.read(ticker)
+            if self._is_fresh(ticker, stored, start):
+                return stored
+
+            tomorrow = date.today() + timedelta(days=1)
+            try:
+                if stored is None or stored.size == 0:
+                    merged = self._download(ticker, start, tomorrow)
+                else:
+                    first = pd.Timestamp(int(stored["ts"][0])).date()
+                    last = pd.Timestamp(int(stored["ts"][-1])).date()
+                    covered = self._covered_from(ticker)
+                    needs_older = covered is None or _to_ts(start) < covered
+                    older = self._download(ticker, start, first) if needs_older and _to_ts(start) < stored["ts"][0] else None
+                    # Repetimos la última vela guardada por si estaba incompleta
+                    newer = self._download(ticker, last, tomorrow)
+                    merged = _merge(np.array(stored), older, newer)
+            except Exception:
+                # Yahoo caído o limitando: servimos lo que haya en disco
+                if stored is not None and stored.size:
+                    return stored
+                raise
+
+            if merged.size:
+                covered = self._covered_from(ticker)
+                covered = _to_ts(start) if covered is None else min(covered, _to_ts(start))
+                self._write(ticker, merged)
+                with open(self._path(ticker) + ".json", "w") as fh:
+                    json.dump({"from": covered}, fh)
+            return self.read(ticker)
+
+    def load(self, ticker, start, end=None):
+        """DataFrame OHLC del ticker entre start (incluido) y end (excluido), servido desde disco"""
+        rec = self.update(ticker, start)
+        if rec is None or rec.size == 0:
+            return pd.DataFrame(columns=OHLC_FIELDS)
+        end = end or date.today()
+        lo = np.searchsorted(rec["ts"], _to_ts(start), side="left")
+        hi = np.searchsorted(rec["ts"], _to_ts(end), side="left")
+        part = rec[lo:hi]
+        df = pd.DataFrame({f: part[f] for f in OHLC_FIELDS},
+                          index=pd.DatetimeIndex(part["ts"].astype("datetime64[ns]"), name="Date"))
+        return df
+
+
+_default_store = None
+
+
+def get_store():
+    """Almacén compartido del proceso"""
+    global _default_store
+    if _default_store is None:
+        _default_store = PriceStore()
+    return _default_store
+
+
+def load_history(ticker, start, end=None):
+    """Sustituto de yf.download(ticker, start, end) que sirve desde el almacén local"""
+    if isinstance(start, datetime):
+        start = start.date()
+    return get_store().load(ticker, start, end)
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from .metrics import record_cache, span
+
+# ==============================================================================
+#  CACHÉ DE COTIZACIONES COMPARTIDA (TTL + DESCARGA EN LOTE)
+# ==============================================================================
+# Cada rerun del escáner pedía el precio a Yahoo otra vez. Aquí todas las
+# sesiones del proceso comparten una caché en memoria: todos los tickers
+# conocidos se descargan en una sola llamada y, cuando caducan, se refrescan
+# en un hilo de fondo mientras se sigue sirviendo el último precio. Solo se
+# bloquea la primera vez que se pide un ticker que no está en la caché, y
+# entonces se descarga solo ese ticker (en frío, el lote completo con él
+# dentro: una sola descarga). Los tickers sin cotización se
+# recuerdan MISS_TTL segundos para no volver a Yahoo en cada interacción.
+
+DEFAULT_TTL = float(os.environ.get("LOOPING_QUOTE_TTL", 60))
+MISS_TTL = float(os.environ.get("LOOPING_QUOTE_MISS_TTL", 300))
+
+
+def fetch_quotes(tickers):
+    """Último cierre de cada ticker en una sola descarga. Devuelve {ticker: precio}"""
+    import yfinance as yf  # diferido: solo se carga si hay que descargar
+
+    tickers = sorted(set(tickers))
+    if not tickers:
+        return {}
+    with span("yf.download", tickers=len(tickers)):
+        raw = yf.download(tickers, period="5d", interval="1d", progress=False, group_by="column")
+    if raw is None or raw.empty:
+        return {}
+    closes = raw["Close"]
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(tickers[0])
+    last = closes.ffill().iloc[-1]
+    return {t: float(p) for t, p in last.items() if pd.notna(p)}
+
+
+class QuoteCache:
+    """Precios compartidos por todo el proceso con refresco en segundo plano"""
+
+    def __init__(self, tickers=(), ttl=DEFAULT_TTL, fetcher=fetch_quotes, miss_ttl=MISS_TTL):
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.fetcher = fetcher
+        self.tickers = set(tickers)
+        self.prices = {}
+        self.misses = {}      # ticker -> hora del último intento sin cotización
+        self.updated = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _download(self, tickers):
+        try:
+            return self.fetcher(tickers)
+        except Exception:
+            return {}
+
+    def _refresh(self, extra=()):
+        """Descarga en lote de todos los tickers conocidos (más `extra`)"""
+        with self._lock:
+            tickers = list(self.tickers.union(extra))  # copia: otros hilos añaden tickers mientras se descarga
+        prices = self._download(tickers)
+        with self._lock:
+            if prices:
+                self.prices.update(prices)
+                self.updated = time.time()
+
+    def _refresh_background(self):
+        try:
+            self._refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_background, daemon=True).start()
+
+    def _fetch_missing(self, ticker, cold):
+        # En frío, un solo lote que ya incluye el ticker; si no, solo ese ticker (el lote va en segundo plano)
+        if cold:
+            self._refresh([ticker])
+        else:
+            price = self._download([ticker]).get(ticker)
+            if price is not None:
+                with self._lock:
+                    self.prices[ticker] = price
+        with self._lock:
+            price = self.prices.get(ticker)
+            if price is None:
+                self.misses[ticker] = time.time()
+            else:
+                self.tickers.add(ticker)
+                self.misses.pop(ticker, None)
+            return price
+
+    def get(self, ticker):
+        """Precio del ticker; si está caducado devuelve el último y refresca en segundo plano"""
+        now = time.time()
+        with self._lock:
+            price = self.prices.get(ticker)
+            cold = not self.updated
+            stale = now - self.updated > self.ttl
+            missed = now - self.misses.get(ticker, float("-inf")) < self.miss_ttl
+        record_cache("quotes", price is not None and not stale)
+
+        if price is None:
+            if missed or (price := self._fetch_missing(ticker, cold)) is None:
+                raise KeyError(f"Sin cotización para {ticker}")
+            if cold:
+                return price  # el lote en frío ya trajo todos los tickers
+        if stale:
+            self._refresh_async()
+        return price
+
+    def age(self):
+        return time.time() - self.updated if self.updated else None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_quote_cache(tickers=(), ttl=DEFAULT_TTL):
+    """Caché compartida del proceso (se crea la primera vez con los tickers indicados)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QuoteCache(tickers, ttl)
+        else:
+            with _cache._lock:
+                _cache.tickers.update(tickers)
+        return _cache
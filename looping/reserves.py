@@ -0,0 +1,196 @@
+import threading
+import time
+
+import pandas as pd
+
+from .metrics import record_cache
+from .multicall import aggregate3
+
+# ==============================================================================
+#  DESGLOSE DE LA POSICIÓN POR RESERVA (COLATERAL Y DEUDA POR ACTIVO)
+# ==============================================================================
+# Todo se resuelve desde el mismo AddressProvider que ya usamos:
+#   - getPoolDataProvider(): lista de reservas, configuración y saldos por usuario
+#   - getPriceOracle():      precios de todas las reservas en una llamada
+# La lista de reservas con sus decimales y liquidation thresholds cambia muy
+# poco, así que se cachea por red. Con ella en caché, el desglose de una
+# wallet (saldos de todas las reservas + precios) es un único aggregate3.
+
+ADDRESS_PROVIDER_ABI = [
+    {
+        "inputs": [],
+        "name": "getPoolDataProvider",
+        "outputs": [{"internalType": "address", "name": "", "type": "address"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [],
+        "name": "getPriceOracle",
+        "outputs": [{"internalType": "address", "name": "", "type": "address"}],
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+
+DATA_PROVIDER_ABI = [
+    {
+        "inputs": [],
+        "name": "getAllReservesTokens",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "string", "name": "symbol", "type": "string"},
+                    {"internalType": "address", "name": "tokenAddress", "type": "address"}
+                ],
+                "internalType": "struct IPoolDataProvider.TokenData[]",
+                "name": "",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+
+# Selectores precalculados (keccak de la firma) para no cargar web3 al importar
+RESERVE_CONFIG_SELECTOR = bytes.fromhex("3e150141")  # getReserveConfigurationData(address)
+# decimals, ltv, liquidationThreshold, liquidationBonus, reserveFactor,
+# usageAsCollateralEnabled, borrowingEnabled, stableBorrowRateEnabled, isActive, isFrozen
+RESERVE_CONFIG_TYPES = ["uint256"] * 5 + ["bool"] * 5
+
+USER_RESERVE_SELECTOR = bytes.fromhex("28dd2d01")  # getUserReserveData(address,address)
+USER_RESERVE_TYPES = ["uint256"] * 7 + ["uint40", "bool"]
+
+ASSET_PRICES_SELECTOR = bytes.fromhex("9d23d9f2")  # getAssetsPrices(address[])
+BASE_UNIT_SELECTOR = bytes.fromhex("8c89b64f")  # BASE_CURRENCY_UNIT()
+
+RESERVES_TTL = 3600    # segundos que vale la lista de reservas de una red
+BLOCK_TTL = 12         # segundos que reutilizamos un desglose (≈ un bloque)
+
+RESERVE_COLUMNS = ["symbol", "asset", "decimals", "price_usd", "collateral", "collateral_usd",
+                   "debt", "debt_usd", "lt", "as_collateral"]
+
+_reserves_cache = {}
+_user_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _fetch_reserves_meta(w3, provider_addr):
+    from eth_abi import decode, encode
+    from web3 import Web3
+
+    provider = w3.eth.contract(address=Web3.to_checksum_address(provider_addr), abi=ADDRESS_PROVIDER_ABI)
+    data_provider = provider.functions.getPoolDataProvider().call()
+    oracle = provider.functions.getPriceOracle().call()
+    tokens = w3.eth.contract(address=data_provider, abi=DATA_PROVIDER_ABI).functions.getAllReservesTokens().call()
+
+    calls = [(data_provider, RESERVE_CONFIG_SELECTOR + encode(["address"], [addr])) for _, addr in tokens]
+    calls.append((oracle, BASE_UNIT_SELECTOR))
+    results, _ = aggregate3(w3, calls)
+
+    reserves = []
+    for (symbol, addr), (ok, ret) in zip(tokens, results[:-1]):
+        if not ok:
+            continue
+        cfg = decode(RESERVE_CONFIG_TYPES, ret)
+        reserves.append({
+            "symbol": symbol,
+            "asset": Web3.to_checksum_address(addr),
+            "decimals": cfg[0],
+            "lt": cfg[2] / 10000,
+        })
+    ok, ret = results[-1]
+    base_unit = decode(["uint256"], ret)[0] if ok else 10**8
+    return {
+        "data_provider": data_provider,
+        "oracle": oracle,
+        "base_unit": base_unit,
+        "reserves": reserves,
+        "fetched": time.time(),
+    }
+
+
+def get_reserves_meta(w3, network_name, provider_addr):
+    """Lista de reservas de la red (símbolo, dirección, decimales, LT) cacheada por red"""
+    with _cache_lock:
+        meta = _reserves_cache.get(network_name)
+        if meta and time.time() - meta["fetched"] < RESERVES_TTL:
+            record_cache("reserves_meta", True)
+            return meta
+    record_cache("reserves_meta", False)
+    meta = _fetch_reserves_meta(w3, provider_addr)
+    with _cache_lock:
+        _reserves_cache[network_name] = meta
+    return meta
+
+
+def read_user_reserves(w3, network_name, provider_addr, user):
+    """Desglose por reserva de una wallet: saldos, deuda, precio oráculo y LT. Devuelve un DataFrame"""
+    from eth_abi import decode, encode
+    from web3 import Web3
+
+    user = Web3.to_checksum_address(user)
+    key = (network_name, user)
+    with _cache_lock:
+        hit = _user_cache.get(key)
+        if hit and time.time() - hit[0] < BLOCK_TTL:
+            record_cache("reserves", True)
+            return hit[1]
+    record_cache("reserves", False)
+
+    meta = get_reserves_meta(w3, network_name, provider_addr)
+    reserves = meta["reserves"]
+    assets = [r["asset"] for r in reserves]
+
+    calls = [(meta["data_provider"], USER_RESERVE_SELECTOR + encode(["address", "address"], [a, user])) for a in assets]
+    calls.append((meta["oracle"], ASSET_PRICES_SELECTOR + encode(["address[]"], [assets])))
+    results, _ = aggregate3(w3, calls)
+
+    ok, ret = results[-1]
+    prices = decode(["uint256[]"], ret)[0] if ok else [0] * len(assets)
+
+    rows = []
+    for r, (ok, ret), price in zip(reserves, results[:-1], prices):
+        if not ok:
+            continue
+        u = decode(USER_RESERVE_TYPES, ret)
+        a_balance, stable_debt, variable_debt = u[0], u[1], u[2]
+        if a_balance == 0 and stable_debt == 0 and variable_debt == 0:
+            continue
+        scale = 10 ** r["decimals"]
+        price_usd = price / meta["base_unit"]
+        collateral = a_balance / scale
+        debt = (stable_debt + variable_debt) / scale
+        rows.append({
+            "symbol": r["symbol"],
+            "asset": r["asset"],
+            "decimals": r["decimals"],
+            "price_usd": price_usd,
+            "collateral": collateral,
+            "collateral_usd": collateral * price_usd,
+            "debt": debt,
+            "debt_usd": debt * price_usd,
+            "lt": r["lt"],
+            "as_collateral": bool(u[8]),
+        })
+
+    df = pd.DataFrame(rows, columns=RESERVE_COLUMNS)
+    with _cache_lock:
+        _user_cache[key] = (time.time(), df)
+    return df
+
+
+def single_asset_view(df_reserves, symbol):
+    """Datos para la cascada del Modo A con el resto de colaterales fijos.
+
+    Devuelve (tokens del activo, precio, LT del activo, deuda efectiva), donde la
+    deuda efectiva descuenta lo que ya cubren los demás colaterales
+    (deuda - sum(valor_j * LT_j)), de modo que liq = deuda_efectiva / (tokens * LT).
+    """
+    coll = df_reserves[df_reserves["as_collateral"] & (df_reserves["collateral"] > 0)]
+    row = coll[coll["symbol"] == symbol].iloc[0]
+    others = coll[coll["symbol"] != symbol]
+    covered_by_others = float((others["collateral_usd"] * others["lt"]).sum())
+    debt_usd = float(df_reserves["debt_usd"].sum())
+    return float(row["collateral"]), float(row["price_usd"]), float(row["lt"]), debt_usd - covered_by_others
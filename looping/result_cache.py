@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+
+import pandas as pd
+
+from .metrics import record_cache
+
+# ==============================================================================
+#  CACHÉ PERSISTENTE DE RESULTADOS DE BACKTEST (LRU POR TAMAÑO Y EDAD)
+# ==============================================================================
+# Mucha gente lanza exactamente el mismo backtest (BTC-USD, fecha por defecto,
+# 2x, 15%). El resultado depende solo de los parámetros y de hasta qué vela
+# llega el histórico, así que se guarda en disco con esa clave y lo comparten
+# todas las sesiones y procesos, también tras un reinicio. Un fichero por
+# resultado, escrito de forma atómica; la fecha de modificación hace de
+# "último uso" para el LRU. Se expulsa lo caducado y, si aún se pasa de
+# tamaño, lo menos usado.
+
+DEFAULT_RESULTS_DIR = os.environ.get("LOOPING_RESULTS_DIR", os.path.join(".data", "results"))
+DEFAULT_MAX_BYTES = int(float(os.environ.get("LOOPING_RESULT_CACHE_MB", 256)) * 2**20)
+DEFAULT_MAX_AGE = float(os.environ.get("LOOPING_RESULT_CACHE_DAYS", 7)) * 86400
+
+# Subir al cambiar la lógica del motor: invalida todo lo guardado
+ENGINE_VERSION = 1
+
+
+def result_key(kind, ticker, start, last_bar, capital, leverage, threshold, ltv, **extra):
+    """Clave estable de un backtest a partir de sus parámetros"""
+    fields = {
+        "v": ENGINE_VERSION, "kind": kind, "ticker": str(ticker).upper(), "start": str(start),
+        "last_bar": str(pd.Timestamp(last_bar)), "capital": float(capital), "leverage": float(leverage),
+        "threshold": float(threshold), "ltv": float(ltv), **{k: str(v) for k, v in extra.items()},
+    }
+    return hashlib.sha1(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+def _compact(df_res):
+    """La columna de acciones repite tres textos: como categoría ocupa un byte por fila"""
+    if "Acción" in df_res.columns and not isinstance(df_res["Acción"].dtype, pd.CategoricalDtype):
+        df_res = df_res.assign(**{"Acción": df_res["Acción"].astype("category")})
+    return df_res
+
+
+def _expand(df_res):
+    """Deshace _compact: misma columna y tipo que devuelve el motor"""
+    if "Acción" in df_res.columns and isinstance(df_res["Acción"].dtype, pd.CategoricalDtype):
+        col = df_res["Acción"]
+        df_res["Acción"] = col.astype(col.cat.categories.dtype)
+    return df_res
+
+
+class ResultCache:
+    """Resultados (df_res, resumen) en disco con expulsión LRU por tamaño total y edad"""
+
+    def __init__(self, root=DEFAULT_RESULTS_DIR, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.pkl")
+
+    def get(self, key):
+        """(df_res, resumen) guardado o None; un acierto cuenta como uso reciente"""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                record_cache("backtest_results", False)
+                return None
+            with open(path, "rb") as fh:
+                df_res, summary = pickle.load(fh)
+            os.utime(path)
+        except Exception:  # fichero a medias, corrupto o de otra versión de pandas: se recalcula
+            record_cache("backtest_results", False)
+            return None
+        record_cache("backtest_results", True)
+        return _expand(df_res), summary
+
+    def put(self, key, df_res, summary):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            pickle.dump((_compact(df_res), summary), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def entries(self):
+        """[(ruta, tamaño, último uso)] de los resultados guardados"""
+        out = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.endswith(".pkl"):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    out.append((entry.path, st.st_size, st.st_mtime))
+        return out
+
+    def evict(self):
+        """Borra lo caducado y, si aún se pasa de max_bytes, lo usado hace más tiempo"""
+        now = time.time()
+        keep, total = [], 0
+        for path, size, used in self.entries():
+            if now - used > self.max_age:
+                self._remove(path)
+            else:
+                keep.append((used, size, path))
+                total += size
+        for used, size, path in sorted(keep):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def cached(self, key, compute):
+        """Devuelve el resultado guardado o lo calcula con compute() y lo guarda (si hay resumen)"""
+        hit = self.get(key)
+        if hit is not None:
+            return hit
+        df_res, summary = compute()
+        if summary is not None:
+            self.put(key, df_res, summary)
+        return df_res, summary
+
+
+_default_cache = None
+
+
+def get_result_cache():
+    """Caché compartida del proceso"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
@@ -0,0 +1,292 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import record_rpc
+
+# ==============================================================================
+#  POOL DE PROVEEDORES RPC (SESIONES REUTILIZADAS + RANKING POR LATENCIA)
+# ==============================================================================
+# Un pool por red, compartido por todo el proceso. Cada endpoint conserva su
+# sesión HTTP keep-alive y su instancia Web3 entre clics. Los endpoints se
+# sondean en paralelo con eth_chainId (que además verifica la red) y se
+# ordenan por latencia media y tasa de error; si una llamada falla se pasa al
+# siguiente al vuelo y el endpoint caído queda en cuarentena un rato. Solo
+# penalizan los fallos del endpoint (red, timeout, 429/5xx, errores JSON-RPC
+# del nodo); un revert o una petición mal formada fallaría igual en todos, así
+# que se relanza sin tocar la salud de nadie. Un endpoint de otra red queda
+# fuera CHAIN_COOLDOWN segundos y después se vuelve a comprobar.
+#
+# Para las lecturas sensibles a la latencia hay `RpcPool.batch`: varias
+# llamadas JSON-RPC en un único POST, con eth_chainId delante para verificar
+# la red en ese mismo viaje en lugar de sondear antes.
+
+BROWSER_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+PROBE_TIMEOUT = 3      # segundos para el sondeo eth_chainId
+CALL_TIMEOUT = 10      # segundos por llamada real
+PROBE_TTL = 120        # segundos que vale un ranking antes de volver a sondear
+COOLDOWN = 60          # segundos de cuarentena tras un fallo
+CHAIN_COOLDOWN = 600   # segundos fuera del pool si responde con otro chainId
+EWMA_ALPHA = 0.3       # peso de la última medida en la latencia media
+
+
+def make_session(pool_size=16):
+    """Sesión HTTP keep-alive disfrazada de navegador Chrome"""
+    s = requests.Session()
+    s.headers.update({'User-Agent': BROWSER_UA})
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+class RpcError(Exception):
+    """Error devuelto dentro de una respuesta JSON-RPC; `transport` indica si es culpa del endpoint"""
+
+    def __init__(self, message, transport=True):
+        super().__init__(message)
+        self.transport = transport
+
+
+def _request_fault(error):
+    # Revert (código 3 o mensaje) o parámetros inválidos: la petición fallaría en cualquier nodo
+    error = error if isinstance(error, dict) else {}
+    return error.get("code") in (3, -32602) or "revert" in str(error.get("message", "")).lower()
+
+
+def is_endpoint_error(exc):
+    """True si el fallo es del endpoint (red, timeout, HTTP 429/5xx, error JSON-RPC del nodo) y no de la petición"""
+    if isinstance(exc, requests.HTTPError):
+        status = exc.response.status_code if exc.response is not None else None
+        return status is None or status in (401, 403, 408, 429) or status >= 500
+    if isinstance(exc, (requests.RequestException, ConnectionError, TimeoutError, json.JSONDecodeError)):
+        return True
+    if isinstance(exc, RpcError):
+        return exc.transport
+    # Errores JSON-RPC de web3 (Web3RPCError): se miran por su respuesta para no importar web3 aquí
+    response = getattr(exc, "rpc_response", None)
+    if isinstance(response, dict) and "error" in response:
+        return not _request_fault(response["error"])
+    return False
+
+
+class RpcEndpoint:
+    """Estado y estadísticas de un endpoint RPC"""
+
+    def __init__(self, url, preferred=False):
+        self.url = url
+        self.host = urlsplit(url).hostname or "?"   # sin ruta ni query: Alchemy/Infura llevan ahí la API key
+        self.preferred = preferred
+        self.session = make_session()
+        self._w3 = None
+        self.latency = None
+        self.ok = 0
+        self.errors = 0
+        self.down_until = 0.0
+        self.chain_ok = None
+        self._lock = threading.Lock()
+
+    @property
+    def w3(self):
+        """Instancia Web3 sobre la sesión del endpoint (web3 se importa la primera vez que hace falta)"""
+        if self._w3 is None:
+            from web3 import Web3
+            self._w3 = Web3(Web3.HTTPProvider(self.url, session=self.session, request_kwargs={'timeout': CALL_TIMEOUT}))
+        return self._w3
+
+    @property
+    def label(self):
+        """Nombre que se puede mostrar: nunca la URL completa"""
+        return "🔒 Privado" if self.preferred else self.host
+
+    @property
+    def error_rate(self):
+        total = self.ok + self.errors
+        return self.errors / total if total else 0.0
+
+    @property
+    def available(self):
+        return time.time() >= self.down_until
+
+    def score(self):
+        """Menor es mejor: latencia penalizada por la tasa de error"""
+        latency = self.latency if self.latency is not None else PROBE_TIMEOUT
+        return latency * (1 + 4 * self.error_rate)
+
+    def record_ok(self, elapsed):
+        record_rpc(self.host, elapsed)
+        with self._lock:
+            self.ok += 1
+            self.latency = elapsed if self.latency is None else (1 - EWMA_ALPHA) * self.latency + EWMA_ALPHA * elapsed
+            self.down_until = 0.0
+
+    def record_error(self, cooldown=COOLDOWN):
+        record_rpc(self.host)
+        with self._lock:
+            self.errors += 1
+            self.down_until = time.time() + cooldown
+
+    def probe(self, chain_id):
+        """Sondea el endpoint con eth_chainId y verifica la red"""
+        payload = {"jsonrpc": "2.0", "id": 1, "method": "eth_chainId", "params": []}
+        t0 = time.perf_counter()
+        try:
+            r = self.session.post(self.url, json=payload, timeout=PROBE_TIMEOUT)
+            r.raise_for_status()
+            result = int(r.json()["result"], 16)
+        except Exception:
+            self.record_error()
+            return False
+        self.chain_ok = result == chain_id
+        if not self.chain_ok:
+            self.record_error(CHAIN_COOLDOWN)
+            return False
+        self.record_ok(time.perf_counter() - t0)
+        return True
+
+    def batch(self, calls, timeout=CALL_TIMEOUT):
+        """Envía [(método, params), ...] en un solo POST JSON-RPC. Devuelve los resultados en orden"""
+        payload = [{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p) in enumerate(calls)]
+        r = self.session.post(self.url, json=payload, timeout=timeout)
+        r.raise_for_status()
+        body = r.json()
+        if not isinstance(body, list):
+            # Algunos RPC públicos no aceptan lotes y devuelven un único error
+            raise RpcError((body or {}).get("error", "respuesta sin lote"))
+        by_id = {item.get("id"): item for item in body}
+        results = []
+        for i, (method, _) in enumerate(calls):
+            item = by_id.get(i)
+            if item is None:
+                raise RpcError(f"{method}: sin respuesta")
+            if "error" in item:
+                raise RpcError(f"{method}: {item['error']}", transport=not _request_fault(item["error"]))
+            results.append(item["result"])
+        return results
+
+    def stats(self):
+        return {
+            "rpc": self.label,
+            "latencia_ms": None if self.latency is None else round(self.latency * 1000, 1),
+            "errores": self.errors,
+            "tasa_error": round(self.error_rate, 3),
+            "disponible": self.available,
+        }
+
+
+class RpcPool:
+    """Endpoints de una red ordenados por salud, con failover automático"""
+
+    def __init__(self, chain_id, urls, preferred=()):
+        self.chain_id = chain_id
+        self.endpoints = {}
+        self.last_probe = 0.0
+        self._lock = threading.Lock()
+        for url in list(preferred) + list(urls):
+            self.add(url, preferred=url in preferred)
+
+    def add(self, url, preferred=False):
+        if url not in self.endpoints:
+            self.endpoints[url] = RpcEndpoint(url, preferred)
+        elif preferred:
+            self.endpoints[url].preferred = True
+
+    def probe_all(self):
+        """Sondea todos los endpoints en paralelo (tarda lo que el más lento, acotado por PROBE_TIMEOUT)"""
+        eps = list(self.endpoints.values())
+        with ThreadPoolExecutor(max_workers=max(1, len(eps))) as ex:
+            list(ex.map(lambda ep: ep.probe(self.chain_id), eps))
+        self.last_probe = time.time()
+
+    def ranked(self, probe=True):
+        """Endpoints disponibles, los privados (Secrets) primero y después por puntuación"""
+        with self._lock:
+            if probe and time.time() - self.last_probe > PROBE_TTL:
+                self.probe_all()
+            else:
+                # Los de otra red vuelven a probarse cuando acaba su cuarentena
+                for ep in self.endpoints.values():
+                    if ep.chain_ok is False and ep.available:
+                        ep.probe(self.chain_id)
+        eps = [ep for ep in self.endpoints.values() if ep.available and ep.chain_ok is not False]
+        if not eps:
+            # Todos en cuarentena: mejor intentar con el menos malo que rendirse
+            eps = [ep for ep in self.endpoints.values() if ep.chain_ok is not False]
+        return sorted(eps, key=lambda ep: (not ep.preferred, ep.score()))
+
+    def best(self):
+        eps = self.ranked()
+        return eps[0] if eps else None
+
+    def call(self, fn, probe=True):
+        """Ejecuta fn(w3) en el mejor endpoint y, si falla, en el siguiente.
+
+        Devuelve (resultado, endpoint usado). Relanza el último error si fallan todos,
+        y al momento (sin penalizar al endpoint) si el fallo es de la propia petición.
+        Con probe=False no se sondea aunque el ranking haya caducado (el failover basta).
+        """
+        last_exc = None
+        for ep in self.ranked(probe):
+            t0 = time.perf_counter()
+            try:
+                result = fn(ep.w3)
+            except Exception as e:
+                if not is_endpoint_error(e):
+                    raise  # revert o entrada inválida: fallaría igual en cualquier endpoint
+                ep.record_error()
+                last_exc = e
+                continue
+            ep.record_ok(time.perf_counter() - t0)
+            return result, ep
+        raise last_exc or ConnectionError("Sin endpoints RPC disponibles")
+
+    def batch(self, calls):
+        """Lote JSON-RPC en un solo viaje con failover entre endpoints.
+
+        Antepone eth_chainId y comprueba la red con la propia respuesta, así que
+        no hace falta sondear antes. Devuelve (resultados, endpoint usado).
+        """
+        last_exc = None
+        for ep in self.ranked(probe=False):
+            t0 = time.perf_counter()
+            try:
+                chain_hex, *results = ep.batch([("eth_chainId", [])] + list(calls))
+            except Exception as e:
+                if not is_endpoint_error(e):
+                    raise
+                ep.record_error()
+                last_exc = e
+                continue
+            ep.chain_ok = int(chain_hex, 16) == self.chain_id
+            if not ep.chain_ok:
+                ep.record_error(CHAIN_COOLDOWN)
+                last_exc = RpcError(f"chainId {int(chain_hex, 16)} != {self.chain_id}")
+                continue
+            ep.record_ok(time.perf_counter() - t0)
+            return results, ep
+        raise last_exc or ConnectionError("Sin endpoints RPC disponibles")
+
+    def stats(self):
+        return [ep.stats() for ep in sorted(self.endpoints.values(), key=lambda ep: ep.score())]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(network_name, chain_id, urls, preferred=()):
+    """Pool compartido del proceso para una red (se crea la primera vez)"""
+    with _pools_lock:
+        pool = _pools.get(network_name)
+        if pool is None:
+            pool = _pools[network_name] = RpcPool(chain_id, urls, preferred)
+        else:
+            for url in preferred:
+                pool.add(url, preferred=True)
+        return pool
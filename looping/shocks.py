@@ -0,0 +1,130 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .backtest_engine import ohlc_arrays
+from .price_store import load_history
+
+# ==============================================================================
+#  MATRIZ DE SHOCKS CORRELACIONADOS (MODO B)
+# ==============================================================================
+# El plan lineal del Modo B mueve todo el colateral con la misma caída. Aquí
+# cada reserva de la posición (colateral y deuda) se asocia a un ticker de
+# Yahoo, se estima la covarianza de sus rendimientos con el histórico local y
+# se generan miles de escenarios correlacionados del horizonte elegido. Todo
+# es una sola pasada matricial: shocks (N × A) por exposiciones (A) da el
+# colateral ponderado por LT y la deuda de cada escenario, y de ahí el HF y
+# el capital a devolver para volver al HF actual. Las stablecoins no se
+# descargan: se tratan como precio fijo.
+
+DEFAULT_SCENARIOS = 20_000
+DEFAULT_HORIZON = 7           # días
+HISTORY_DAYS = 365 * 3
+PERCENTILES = [50.0, 75.0, 90.0, 95.0, 99.0, 99.9]
+
+METHOD_NORMAL = "normal"          # normal multivariante con la covarianza estimada
+METHOD_HISTORICAL = "historical"  # remuestreo de rendimientos conjuntos reales (colas y correlación de crisis)
+
+STABLECOINS = {"USDC", "USDT", "DAI", "USDBC", "USDC.E", "USDT0", "GHO", "LUSD", "FRAX", "PYUSD",
+               "USDE", "SUSDE", "CRVUSD", "EURC", "EURE", "RLUSD", "USDS", "SDAI", "SUSDS"}
+STABLE_TICKER = "USD"
+
+# Derivados de staking/wrappers sin cotización propia fiable: se usa el subyacente
+PROXIES = {"WETH": "ETH", "WSTETH": "ETH", "STETH": "ETH", "RETH": "ETH", "CBETH": "ETH", "WEETH": "ETH",
+           "EZETH": "ETH", "RSETH": "ETH", "OSETH": "ETH", "ETHX": "ETH", "WBTC": "BTC", "CBBTC": "BTC",
+           "TBTC": "BTC", "LBTC": "BTC", "BTC.B": "BTC", "WAVAX": "AVAX", "SAVAX": "AVAX", "WMATIC": "MATIC",
+           "WPOL": "POL", "MATICX": "MATIC", "WS": "S", "JITOSOL": "SOL", "MSOL": "SOL"}
+
+
+def proxy_ticker(symbol):
+    """Ticker de Yahoo con el que se modela una reserva ('USD' para stablecoins)"""
+    sym = symbol.upper()
+    if sym in STABLECOINS:
+        return STABLE_TICKER
+    return f"{PROXIES.get(sym, sym)}-USD"
+
+
+def position_exposures(df_reserves):
+    """Exposiciones por ticker: DataFrame con 'col_lt_usd' (colateral × LT) y 'debt_usd'"""
+    df = df_reserves.assign(ticker=df_reserves["symbol"].map(proxy_ticker))
+    col_lt = (df["collateral_usd"] * df["lt"]).where(df["as_collateral"], 0.0)
+    out = pd.DataFrame({"col_lt_usd": col_lt, "debt_usd": df["debt_usd"]}).groupby(df["ticker"]).sum()
+    return out[(out["col_lt_usd"] > 0) | (out["debt_usd"] > 0)]
+
+
+def load_returns(tickers, start=None, end=None):
+    """Rendimientos logarítmicos diarios alineados en fechas comunes (columna 0 para 'USD')"""
+    start = start or date.today() - timedelta(days=HISTORY_DAYS)
+    closes = {}
+    for ticker in tickers:
+        if ticker == STABLE_TICKER:
+            continue
+        df_hist = load_history(ticker, start, end)
+        if df_hist.empty:
+            raise ValueError(f"Sin histórico para {ticker}")
+        index, _, _, close = ohlc_arrays(df_hist)
+        closes[ticker] = pd.Series(close, index=pd.DatetimeIndex(index).normalize())
+    if closes:
+        returns = np.log(pd.DataFrame(closes).dropna()).diff().iloc[1:]
+    else:
+        returns = pd.DataFrame(index=pd.DatetimeIndex([]))
+    return returns.reindex(columns=list(tickers), fill_value=0.0)
+
+
+def fit_shock_model(returns, horizon=DEFAULT_HORIZON):
+    """Covarianza del horizonte, su raíz (para los escenarios normales) y los rendimientos conjuntos del horizonte"""
+    r = returns.to_numpy(dtype=float)
+    if r.shape[0] < max(30, horizon + 2):
+        raise ValueError("Histórico común insuficiente para estimar la covarianza")
+    cov = np.cov(r, rowvar=False).reshape(r.shape[1], r.shape[1]) * horizon
+    # Raíz por autovalores: tolera activos idénticos o sin volatilidad (matriz semidefinida)
+    w, v = np.linalg.eigh(cov)
+    root = v * np.sqrt(np.clip(w, 0.0, None))
+    # Rendimientos reales de ventanas de `horizon` días (solapadas)
+    cum = np.vstack([np.zeros(r.shape[1]), np.cumsum(r, axis=0)])
+    windows = cum[horizon:] - cum[:-horizon]
+    return {"tickers": list(returns.columns), "cov": cov, "root": root, "windows": windows, "horizon": horizon}
+
+
+def simulate_shocks(model, n=DEFAULT_SCENARIOS, method=METHOD_NORMAL, seed=None):
+    """Matriz N × A de multiplicadores de precio (1 = sin cambio)"""
+    rng = np.random.default_rng(seed)
+    if method == METHOD_HISTORICAL:
+        log_r = model["windows"][rng.integers(0, model["windows"].shape[0], n)]
+    else:
+        z = rng.standard_normal((n, model["root"].shape[1]))
+        log_r = z @ model["root"].T
+    return np.exp(log_r)
+
+
+def evaluate_shocks(multipliers, col_lt_usd, debt_usd, target_hf):
+    """HF de cada escenario y capital a devolver (deuda) para volver a target_hf"""
+    shocked_col = multipliers @ np.asarray(col_lt_usd, dtype=float)
+    shocked_debt = multipliers @ np.asarray(debt_usd, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hf = np.where(shocked_debt > 0, shocked_col / shocked_debt, np.inf)
+    needed = np.maximum(shocked_debt - shocked_col / target_hf, 0.0)
+    return hf, needed, shocked_col
+
+
+def shock_table(exposures, model, target_hf, n=DEFAULT_SCENARIOS, method=METHOD_NORMAL,
+                percentiles=PERCENTILES, seed=None):
+    """Resumen por percentil de gravedad: caída del colateral, HF y capital a restaurar.
+
+    Devuelve (tabla, probabilidad de HF < 1). El percentil 99 es el escenario que
+    solo el 1% de los casos empeora (HF más bajo, más capital necesario).
+    """
+    exposures = exposures.reindex(model["tickers"], fill_value=0.0)
+    col_lt, debt = exposures["col_lt_usd"].to_numpy(), exposures["debt_usd"].to_numpy()
+    mult = simulate_shocks(model, n, method, seed)
+    hf, needed, shocked_col = evaluate_shocks(mult, col_lt, debt, target_hf)
+
+    tail = 100.0 - np.asarray(percentiles, dtype=float)
+    table = pd.DataFrame({
+        "Percentil": [f"P{p:g}" for p in percentiles],
+        "Caída Colateral": 1 - np.percentile(shocked_col, tail) / col_lt.sum(),
+        "HF": np.percentile(hf, tail),
+        "Capital a Restaurar ($)": np.percentile(needed, percentiles),
+    })
+    return table, float(np.mean(hf < 1.0))
@@ -0,0 +1,224 @@
+import atexit
+import logging
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from .metrics import REGISTRY, span
+
+# ==============================================================================
+#  HISTÓRICO LOCAL DE ESCANEOS (SQLITE)
+# ==============================================================================
+# Cada lectura on-chain (wallet suelta, multi-red, watchlist, vigilante, CLI)
+# se guarda como una fila (red, wallet, bloque, hora, colateral, deuda, LT,
+# HF) en un SQLite embebido. Las escrituras no bloquean el escaneo: se
+# encolan y un hilo las vuelca por lotes en una sola transacción. Además de
+# la tabla de histórico (índice por wallet, red y bloque) se mantiene `latest`
+# con la última lectura de cada wallet, indexada por HF, para que "qué wallets
+# están ahora por debajo de 1.3" sea una consulta de índice y no un GROUP BY.
+#
+# La base está en modo WAL: la app, el vigilante y la CLI pueden leer mientras
+# otro proceso escribe.
+
+DEFAULT_DB_PATH = os.environ.get("LOOPING_SNAPSHOTS_DB", os.path.join(".data", "snapshots.sqlite"))
+BATCH_SIZE = 1000        # filas por transacción (se cierra el lote al superarlo)
+FLUSH_INTERVAL = 0.5     # segundos que una fila puede esperar en la cola
+
+SNAPSHOT_COLUMNS = ["network", "address", "block", "ts", "col_usd", "debt_usd", "lt_avg", "hf"]
+
+logger = logging.getLogger("looping.snapshots")
+
+LOST_ROWS = REGISTRY.counter("looping_snapshots_lost_total", "Lecturas que no se pudieron guardar en el histórico")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    network TEXT NOT NULL,
+    address TEXT NOT NULL,
+    block INTEGER,
+    ts REAL NOT NULL,
+    col_usd REAL,
+    debt_usd REAL,
+    lt_avg REAL,
+    hf REAL
+);
+CREATE INDEX IF NOT EXISTS snapshots_wallet ON snapshots (address, network, block);
+CREATE INDEX IF NOT EXISTS snapshots_wallet_ts ON snapshots (address, network, ts);
+CREATE TABLE IF NOT EXISTS latest (
+    network TEXT NOT NULL,
+    address TEXT NOT NULL,
+    block INTEGER,
+    ts REAL NOT NULL,
+    col_usd REAL,
+    debt_usd REAL,
+    lt_avg REAL,
+    hf REAL,
+    PRIMARY KEY (address, network)
+);
+CREATE INDEX IF NOT EXISTS latest_hf ON latest (hf);
+"""
+
+# Solo se sustituye la última lectura si no es de un bloque anterior
+_UPSERT_LATEST = """
+INSERT INTO latest (network, address, block, ts, col_usd, debt_usd, lt_avg, hf)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (address, network) DO UPDATE SET
+    block = excluded.block, ts = excluded.ts, col_usd = excluded.col_usd,
+    debt_usd = excluded.debt_usd, lt_avg = excluded.lt_avg, hf = excluded.hf
+WHERE excluded.ts >= latest.ts
+"""
+
+
+def _hf_value(hf):
+    # Sin deuda el HF es infinito; SQLite no lo distingue bien de un número, se guarda NULL
+    return None if hf is None or not math.isfinite(hf) else float(hf)
+
+
+def snapshot_row(network_name, address, col_usd, debt_usd, lt_avg, hf, block=None, ts=None):
+    """Tupla lista para guardar a partir de valores ya convertidos (USD, fracción, HF)"""
+    return (network_name, address.lower(), None if block is None else int(block), ts or time.time(),
+            float(col_usd), float(debt_usd), float(lt_avg), _hf_value(hf))
+
+
+def rows_from_frame(network_name, df, block=None, ts=None):
+    """Filas de un DataFrame de scan_accounts (se descartan las lecturas fallidas)"""
+    ts = ts or time.time()
+    ok = df[df["ok"]] if "ok" in df.columns else df
+    return [snapshot_row(network_name, r.address, r.col_usd, r.debt_usd, r.lt_avg, r.hf, block, ts)
+            for r in ok.itertuples(index=False)]
+
+
+class SnapshotStore:
+    """Histórico de lecturas con escritura por lotes en segundo plano"""
+
+    def __init__(self, path=DEFAULT_DB_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="snapshots-writer")
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        # sqlite3 no comparte conexiones entre hilos: una por hilo lector
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # --------------------------------------------------------------------------
+    #  ESCRITURA
+    # --------------------------------------------------------------------------
+
+    def record(self, rows):
+        """Encola filas de snapshot_row/rows_from_frame; vuelve al instante"""
+        rows = list(rows)
+        if rows:
+            self._queue.put(rows)
+
+    def flush(self, timeout=10):
+        """Espera a que todo lo encolado hasta ahora esté escrito"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch, waiters = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.extend(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    with span("snapshots.write", rows=len(batch)), conn:
+                        conn.executemany(
+                            "INSERT INTO snapshots (network, address, block, ts, col_usd, debt_usd, lt_avg, hf) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                        conn.executemany(_UPSERT_LATEST, batch)
+                except sqlite3.Error as e:
+                    # El histórico es secundario: un fallo de disco no debe tumbar el escaneo
+                    logger.warning("snapshots: %d lecturas sin guardar: %s", len(batch), e)
+                    LOST_ROWS.inc(len(batch))
+            for w in waiters:
+                w.set()
+
+    # --------------------------------------------------------------------------
+    #  CONSULTAS
+    # --------------------------------------------------------------------------
+
+    def _frame(self, sql, params):
+        df = pd.read_sql_query(sql, self._reader(), params=params)
+        df["hf"] = df["hf"].astype(float).fillna(float("inf"))
+        df["datetime"] = pd.to_datetime(df["ts"], unit="s", utc=True)
+        return df
+
+    def history(self, address, network_name=None, since=None, limit=None):
+        """Lecturas de una wallet (todas las redes o una) en orden cronológico; `limit` = las más recientes"""
+        where, params = ["address = ?"], [address.lower()]
+        if network_name:
+            where.append("network = ?")
+            params.append(network_name)
+        if since is not None:
+            where.append("ts >= ?")
+            params.append(float(since))
+        sql = f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM snapshots WHERE {' AND '.join(where)}"
+        if limit:
+            sql = f"SELECT * FROM ({sql} ORDER BY ts DESC LIMIT ?)"
+            params.append(int(limit))
+        return self._frame(sql + " ORDER BY ts", params)
+
+    def below(self, max_hf, network_name=None):
+        """Última lectura de las wallets con deuda y HF por debajo de max_hf, de peor a mejor"""
+        sql = f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM latest WHERE hf IS NOT NULL AND hf < ? AND debt_usd > 0"
+        params = [float(max_hf)]
+        if network_name:
+            sql += " AND network = ?"
+            params.append(network_name)
+        return self._frame(sql + " ORDER BY hf", params)
+
+    def count(self):
+        """(lecturas guardadas, wallets distintas)"""
+        conn = self._reader()
+        return (conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0],
+                conn.execute("SELECT COUNT(*) FROM latest").fetchone()[0])
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_snapshot_store():
+    """Almacén compartido del proceso"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = SnapshotStore()
+        return _default_store
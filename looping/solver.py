@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+from .backtest_engine import next_event, ohlc_arrays
+from .plans import SURFACE_THRESHOLDS
+
+# ==============================================================================
+#  RESERVA MÍNIMA PARA SOBREVIVIR AL HISTÓRICO
+# ==============================================================================
+# La regla de defensa del backtest es invariante de escala: si todo se mide en
+# unidades de capital, la trayectoria del precio de liquidación solo depende
+# de los precios, del umbral y de r = (L - 1) / (L * LTV). Tras defender a
+# precio d el colateral queda en L·C/d tokens, así que cada defensa cuesta
+# L·C - colateral_previo·d. La reserva necesaria es lo inyectado en total.
+#
+# En vez de simular vela a vela cada umbral, se salta de evento en evento
+# buscando en el mínimo acumulado de los lows (búsqueda binaria: como el
+# precio de liquidación solo baja, el siguiente evento es la primera vela en
+# la que el mínimo acumulado cruza la barrera). Solo cuando la propia vela
+# de la defensa ya perforó la nueva barrera se mira la vela siguiente. Cada
+# umbral cuesta O(eventos · log n) y el resultado es idéntico al del motor.
+
+# Con (1 + umbral) · r >= 1 el trigger tras defender queda por encima del precio
+# de la defensa: se "defiende" en cada mínimo nuevo sin alejar la liquidación.
+# Esos umbrales no se buscan (serían una defensa por vela).
+
+SOLVE_COLUMNS = ["Umbral", "Sobrevive", "Reserva ($)", "Defensas", "Última defensa", "Liquidación"]
+
+ENTRY_START = "start"   # entrada en la primera vela (como la pestaña Backtest)
+ENTRY_WORST = "worst"   # entrada en el pico previo a la mayor caída del histórico
+
+
+def max_threshold(leverage, ltv):
+    """Umbral a partir del cual una defensa ya no aleja la liquidación"""
+    return leverage * ltv / (leverage - 1) - 1
+
+
+def worst_drawdown(closes, lows):
+    """(índice del pico, índice del valle, caída) de la mayor caída de cierre a mínimo posterior"""
+    peak_close = np.maximum.accumulate(closes)
+    dd = 1 - lows / peak_close
+    trough = int(np.argmax(dd))
+    peak = int(np.flatnonzero(closes[:trough + 1] == peak_close[trough])[0])
+    return peak, trough, float(dd[trough])
+
+
+def defense_path(opens, lows, runmin, leverage, ltv, threshold, start_price):
+    """Recorre la regla de defensa de evento en evento (misma lógica que simulate_defense).
+
+    `runmin` es np.minimum.accumulate(lows). Devuelve un dict con `survives`,
+    `injected` (en múltiplos del capital), `defenses`, `end` (vela de liquidación
+    o None) y `deepest` (vela de la última defensa).
+    """
+    ratio = (leverage - 1) / (leverage * ltv)
+    liq = start_price * ratio
+    collat = leverage / start_price     # tokens por unidad de capital
+    injected = 0.0
+    defenses = 0
+    deepest = None
+    pos = 0
+    n = lows.size
+    neg_runmin = -runmin
+
+    while pos < n:
+        barrier = max(liq * (1 + threshold), liq)
+        if pos == 0 or runmin[pos - 1] > barrier:
+            idx = int(np.searchsorted(neg_runmin, -barrier, side="left"))
+            if idx >= n:
+                break
+        else:
+            idx = next_event(lows, pos, liq, threshold)
+            if idx is None:
+                break
+
+        trigger = liq * (1 + threshold)
+        if lows[idx] <= trigger:
+            defense_price = min(opens[idx], trigger)
+            if defense_price <= liq:
+                return {"survives": False, "injected": injected, "defenses": defenses, "end": idx, "deepest": deepest}
+            needed = leverage / defense_price
+            if needed > collat:
+                injected += (needed - collat) * defense_price
+                collat = needed
+                liq = defense_price * ratio
+                defenses += 1
+                deepest = idx
+        if lows[idx] <= liq:
+            return {"survives": False, "injected": injected, "defenses": defenses, "end": idx, "deepest": deepest}
+        pos = idx + 1
+
+    return {"survives": True, "injected": injected, "defenses": defenses, "end": None, "deepest": deepest}
+
+
+def solve_reserve(df_hist, capital, leverage, ltv, thresholds=SURFACE_THRESHOLDS, entry=ENTRY_START):
+    """Reserva necesaria para cada umbral y el mejor (el que sobrevive con menos reserva).
+
+    Devuelve (DataFrame por umbral, resumen) o (DataFrame vacío, None) sin datos.
+    La tabla sale vacía (y best_threshold = None) si ningún umbral de la rejilla
+    queda por debajo de max_threshold, p. ej. si la posición ya es liquidable al entrar.
+    """
+    index, opens, lows, closes = ohlc_arrays(df_hist)
+    if closes.size == 0:
+        return pd.DataFrame(columns=SOLVE_COLUMNS), None
+
+    peak, trough, max_dd = worst_drawdown(closes, lows)
+    i0 = peak if entry == ENTRY_WORST else 0
+    opens, lows, closes = opens[i0:], lows[i0:], closes[i0:]
+    runmin = np.minimum.accumulate(lows)
+    start_price = float(closes[0])
+
+    th_max = max_threshold(leverage, ltv)
+    thresholds = np.asarray(thresholds, dtype=float)
+    rows = []
+    for th in thresholds[thresholds < th_max]:
+        res = defense_path(opens, lows, runmin, leverage, ltv, th, start_price)
+        rows.append({
+            "Umbral": th,
+            "Sobrevive": res["survives"],
+            "Reserva ($)": res["injected"] * capital,
+            "Defensas": res["defenses"],
+            "Última defensa": None if res["deepest"] is None else index[i0 + res["deepest"]],
+            "Liquidación": None if res["end"] is None else index[i0 + res["end"]],
+        })
+    df = pd.DataFrame(rows, columns=SOLVE_COLUMNS)
+
+    survivors = df[df["Sobrevive"].astype(bool)]
+    best = survivors.loc[survivors["Reserva ($)"].idxmin()] if not survivors.empty else None
+    low_idx = int(np.argmin(lows))
+    summary = {
+        "entry_date": index[i0],
+        "start_price": start_price,
+        "trough_date": index[i0 + low_idx],
+        "trough_price": float(lows[low_idx]),
+        "drawdown": 1 - float(lows[low_idx]) / start_price,
+        "max_drawdown": max_dd,
+        "max_drawdown_window": (index[peak], index[trough]),
+        "max_threshold": th_max,
+        "best_threshold": None if best is None else float(best["Umbral"]),
+        "best_reserve": None if best is None else float(best["Reserva ($)"]),
+    }
+    return df, summary
+
+
+def reserve_for(df_solve, threshold):
+    """Fila del umbral más cercano a `threshold` en la tabla del solver"""
+    i = (df_solve["Umbral"] - threshold).abs().idxmin()
+    return df_solve.loc[i]
@@ -0,0 +1,93 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .backtest_engine import ohlc_arrays, simulate_defense
+from .metrics import span
+
+# ==============================================================================
+#  BARRIDO DE PARÁMETROS (APALANCAMIENTO × UMBRAL × LTV)
+# ==============================================================================
+# Todo el grid se evalúa contra una única serie de precios. Las series se
+# envían una sola vez a cada proceso (initializer) y después solo viajan las
+# tuplas de parámetros, repartidas en bloques entre todos los núcleos.
+
+SWEEP_COLUMNS = ["Apalancamiento", "Umbral", "LTV", "Sobrevive", "Inyectado ($)", "Valor Final ($)", "Defensas"]
+
+# Por debajo de este tamaño de grid no compensa arrancar procesos
+MIN_PARALLEL_COMBOS = 64
+
+_worker_series = None
+
+
+def _init_worker(opens, lows, closes, capital):
+    global _worker_series
+    _worker_series = (opens, lows, closes, capital)
+
+
+def _run_chunk(combos):
+    """Evalúa un bloque de combinaciones con las series del proceso"""
+    opens, lows, closes, capital = _worker_series
+    out = []
+    for leverage, threshold, ltv in combos:
+        sim = simulate_defense(opens, lows, closes, capital, leverage, threshold, ltv)
+        state = sim["state"]
+        final_value = float(sim["Valor Estrategia"][-1]) if sim["rows"] else 0.0
+        out.append((
+            leverage, threshold, ltv,
+            not state["is_liquidated"],
+            state["total_injected"],
+            final_value,
+            state["events"],
+        ))
+    return out
+
+
+def frange(start, stop, step):
+    """Rango de floats inclusivo en ambos extremos (redondeado para evitar 0.30000000004)"""
+    if step <= 0 or stop < start:
+        return [round(start, 6)]
+    n = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return [round(start + i * step, 6) for i in range(n)]
+
+
+def run_sweep(df_hist, capital, leverages, thresholds, ltvs, max_workers=None):
+    """Ejecuta el backtest para todo el grid y devuelve un DataFrame con una fila por combinación"""
+    _, opens, lows, closes = ohlc_arrays(df_hist)
+    if closes.size == 0:
+        return pd.DataFrame(columns=SWEEP_COLUMNS)
+
+    combos = list(itertools.product(leverages, thresholds, ltvs))
+    workers = max_workers or os.cpu_count() or 1
+
+    with span("backtest.sweep", combos=len(combos), bars=closes.size):
+        rows = _run_grid(combos, workers, opens, lows, closes, capital)
+    return pd.DataFrame(rows, columns=SWEEP_COLUMNS)
+
+
+def _run_grid(combos, workers, opens, lows, closes, capital):
+    """Reparte el grid entre procesos, o lo corre en serie si es pequeño"""
+    if workers <= 1 or len(combos) < MIN_PARALLEL_COMBOS:
+        _init_worker(opens, lows, closes, capital)
+        rows = _run_chunk(combos)
+    else:
+        # Varios bloques por proceso para equilibrar carga (las combinaciones agresivas terminan antes)
+        chunk = max(1, len(combos) // (workers * 4))
+        chunks = [combos[i:i + chunk] for i in range(0, len(combos), chunk)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(opens, lows, closes, capital)) as ex:
+            rows = [r for part in ex.map(_run_chunk, chunks) for r in part]
+    return rows
+
+
+def sweep_pivot(df_sweep, value, ltv=None):
+    """Tabla Apalancamiento × Umbral de una métrica para un LTV concreto (el primero si no se indica)"""
+    if df_sweep.empty:
+        return pd.DataFrame()
+    if ltv is None:
+        ltv = df_sweep["LTV"].iloc[0]
+    sub = df_sweep[np.isclose(df_sweep["LTV"], ltv)]
+    return sub.pivot_table(index="Apalancamiento", columns="Umbral", values=value, aggfunc="first")
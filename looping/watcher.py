@@ -0,0 +1,279 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .aave import NETWORKS, network_pool, pool_address
+from .metrics import REGISTRY, span
+from .multicall import DEFAULT_CHUNK_SIZE, parse_addresses, scan_accounts
+from .plans import mode_b_triggers
+from .rpc_pool import RpcPool, make_session
+from .snapshots import rows_from_frame
+
+# ==============================================================================
+#  VIGILANTE DE SALUD (HF) EN SEGUNDO PLANO
+# ==============================================================================
+# Un hilo por red. Cada hilo pregunta el número de bloque (llamada barata) y
+# solo cuando llega un bloque nuevo relee todas las wallets de esa red en una
+# pasada multicall fijada a ese bloque. Cada HF se compara con los triggers
+# del plan del Modo B, calculados desde el HF de referencia de la wallet (el
+# primero visto, o el configurado). Se avisa una sola vez por zona: solo al
+# bajar a una zona más profunda; al recuperarse se rearma en silencio, pero
+# solo cuando el HF supera el trigger con margen (histéresis), para que un HF
+# que oscila alrededor de un trigger no avise en cada bloque. El HF de
+# referencia solo se rehace si sube de forma material (la posición se ha
+# reforzado), no por el ruido de cada bloque.
+#
+# python -m looping watch --config wallets.csv --sink webhook:https://... --sink file:alertas.jsonl
+
+DEFAULT_DEFENSES = 5
+POLL_INTERVAL = 1.0     # segundos entre consultas de bloque (por red)
+REARM_MARGIN = 0.25     # fracción del paso entre triggers que el HF debe recuperar para rearmar una zona
+BASELINE_TOLERANCE = 0.02   # subida relativa del HF sobre la referencia que rehace el plan
+
+LEVEL_DEFENSE = "defensa"
+LEVEL_LIQUIDATABLE = "liquidable"
+
+logger = logging.getLogger("looping.watcher")
+
+ALERTS = REGISTRY.counter("looping_watch_alerts_total", "Alertas enviadas por el vigilante", ["network", "level"])
+SCANS = REGISTRY.counter("looping_watch_scans_total", "Bloques procesados por el vigilante", ["network"])
+
+
+def zone_for(hf, triggers):
+    """Número de triggers ya cruzados (0 = por encima de la primera defensa)"""
+    return int(np.count_nonzero(hf <= triggers))
+
+
+def armed_zone(hf, baseline, triggers, num_defenses, margin=REARM_MARGIN):
+    """Zona más profunda que sigue avisada con este HF: solo se rearma la que se supera con margen"""
+    hf_margin = hf - margin * (baseline - 1.0) / num_defenses
+    return num_defenses + 1 if hf_margin < 1.0 else zone_for(hf_margin, triggers)
+
+
+# ==============================================================================
+#  DESTINOS DE LAS ALERTAS
+# ==============================================================================
+
+
+class StdoutSink:
+    """Una línea JSON por alerta en stdout"""
+
+    def send(self, alert):
+        print(json.dumps(alert, ensure_ascii=False), flush=True)
+
+
+class FileSink:
+    """Añade las alertas a un fichero JSON Lines"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, alert):
+        with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(alert, ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """POST JSON a una URL (Slack/Discord/propio). Los fallos se registran, no paran el vigilante"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+        self.session = make_session()
+
+    def send(self, alert):
+        try:
+            self.session.post(self.url, json=alert, timeout=self.timeout).raise_for_status()
+        except Exception as e:
+            logger.warning("webhook %s: %s", self.url, e)
+
+
+class MultiSink:
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def send(self, alert):
+        for sink in self.sinks:
+            sink.send(alert)
+
+
+def make_sink(spec):
+    """'stdout', 'file:ruta.jsonl', 'webhook:https://...' (o directamente la URL)"""
+    if spec in ("stdout", "-"):
+        return StdoutSink()
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):])
+    if spec.startswith("webhook:"):
+        return WebhookSink(spec[len("webhook:"):])
+    if spec.startswith(("http://", "https://")):
+        return WebhookSink(spec)
+    raise ValueError(f"Destino de alertas desconocido: {spec!r}")
+
+
+# ==============================================================================
+#  VIGILANTE
+# ==============================================================================
+
+
+class Watcher:
+    """Vigila pares (red, wallet) bloque a bloque y avisa al cruzar zonas de defensa.
+
+    `targets` es {red: [direcciones]} y `baselines` {(red, dirección): HF de referencia}
+    opcional. `pools` permite inyectar un RpcPool por red (p. ej. una cadena local) y
+    `store` un SnapshotStore donde guardar cada lectura.
+    """
+
+    def __init__(self, targets, sink, num_defenses=DEFAULT_DEFENSES, pools=None, pool_addresses=None,
+                 baselines=None, poll_interval=POLL_INTERVAL, chunk_size=DEFAULT_CHUNK_SIZE, store=None):
+        self.targets = {net: list(addrs) for net, addrs in targets.items() if addrs}
+        self.sink = sink
+        self.num_defenses = num_defenses
+        self.pools = dict(pools or {})
+        self.pool_addresses = dict(pool_addresses or {})
+        self.poll_interval = poll_interval
+        self.chunk_size = chunk_size
+        self.store = store
+        self.last_block = {}
+        self.states = {key: {"baseline": hf, "zone": 0} for key, hf in (baselines or {}).items()}
+        self._stop = threading.Event()
+
+    def _pool(self, network_name):
+        if network_name not in self.pools:
+            self.pools[network_name] = network_pool(network_name)
+        return self.pools[network_name]
+
+    def evaluate(self, network_name, address, hf, debt_usd, block):
+        """Actualiza el estado de la wallet y devuelve la alerta a enviar (o None)"""
+        key = (network_name, address)
+        if debt_usd <= 0 or not np.isfinite(hf):
+            self.states.pop(key, None)
+            return None
+
+        st = self.states.get(key)
+        if st is None or hf > st["baseline"] * (1 + BASELINE_TOLERANCE):
+            # Primera lectura o la posición se ha reforzado: el plan se recalcula desde aquí
+            st = self.states[key] = {"baseline": hf, "zone": 0}
+        triggers = mode_b_triggers(st["baseline"], self.num_defenses)
+        liquidatable = hf < 1.0
+        # HF < 1 cuenta como una zona más allá de la última defensa
+        zone = self.num_defenses + 1 if liquidatable else zone_for(hf, triggers)
+        if zone <= st["zone"]:
+            st["zone"] = min(st["zone"], armed_zone(hf, st["baseline"], triggers, self.num_defenses))
+            return None
+        st["zone"] = zone
+
+        level = LEVEL_LIQUIDATABLE if liquidatable else LEVEL_DEFENSE
+        ALERTS.inc(network=network_name, level=level)
+        return {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "network": network_name,
+            "address": address,
+            "block": block,
+            "hf": round(float(hf), 4),
+            "baseline_hf": round(float(st["baseline"]), 4),
+            "zone": zone,
+            "zones": self.num_defenses,
+            "trigger_hf": None if liquidatable else round(float(triggers[zone - 1]), 4),
+            "debt_usd": round(float(debt_usd), 2),
+            "level": level,
+            "message": (f"⚠️ {address[:10]}... en {network_name}: HF {hf:.3f} < 1.0, posición liquidable"
+                        if liquidatable else
+                        f"🛡️ {address[:10]}... en {network_name}: HF {hf:.3f}, defensa #{zone}/{self.num_defenses} "
+                        f"(trigger {triggers[zone - 1]:.3f})"),
+        }
+
+    def poll(self, network_name):
+        """Una vuelta: si hay bloque nuevo, relee todas las wallets de la red y envía las alertas"""
+        rpc_pool = self._pool(network_name)
+        block, _ = rpc_pool.call(lambda w3: w3.eth.block_number)
+        if block == self.last_block.get(network_name):
+            return []
+
+        addrs = self.targets[network_name]
+
+        def read(w3):
+            if network_name not in self.pool_addresses:
+                self.pool_addresses[network_name] = pool_address(w3, network_name)
+            return scan_accounts(w3, self.pool_addresses[network_name], addrs, self.chunk_size, block_identifier=block)
+
+        with span("watch.scan", network=network_name, wallets=len(addrs), block=block):
+            (df, _), _ = rpc_pool.call(read)
+        self.last_block[network_name] = block
+        SCANS.inc(network=network_name)
+        if self.store is not None:
+            self.store.record(rows_from_frame(network_name, df, block))
+
+        alerts = []
+        for row in df[df["ok"]].itertuples(index=False):
+            alert = self.evaluate(network_name, row.address, row.hf, row.debt_usd, block)
+            if alert:
+                alerts.append(alert)
+                self.sink.send(alert)
+        return alerts
+
+    def _run_network(self, network_name):
+        while not self._stop.is_set():
+            t0 = time.monotonic()
+            try:
+                self.poll(network_name)
+            except Exception as e:
+                logger.warning("%s: %s", network_name, e)
+            self._stop.wait(max(0.0, self.poll_interval - (time.monotonic() - t0)))
+
+    def run_once(self):
+        """Una vuelta por red (útil para cron y pruebas)"""
+        return [a for net in self.targets for a in self.poll(net)]
+
+    def run(self):
+        """Bloquea hasta stop() (o Ctrl+C) con un hilo por red"""
+        threads = [threading.Thread(target=self._run_network, args=(net,), daemon=True, name=f"watch-{net}")
+                   for net in self.targets]
+        for t in threads:
+            t.start()
+        try:
+            while any(t.is_alive() for t in threads):
+                for t in threads:
+                    t.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stop()
+        for t in threads:
+            t.join(timeout=5)
+
+    def stop(self):
+        self._stop.set()
+
+
+# ==============================================================================
+#  CONSTRUCCIÓN DESDE CONFIG
+# ==============================================================================
+
+
+def targets_from_jobs(jobs, default_network):
+    """Agrupa filas {address, network, baseline_hf} por red. Devuelve (targets, baselines, inválidas)"""
+    targets, baselines, bad = {}, {}, []
+    for job in jobs:
+        net = job.get("network") or default_network
+        if net not in NETWORKS:
+            raise ValueError(f"Red desconocida: {net!r} (opciones: {', '.join(NETWORKS)})")
+        valid, invalid = parse_addresses(job.get("address", ""))
+        bad.extend(invalid)
+        for addr in valid:
+            if addr not in targets.setdefault(net, []):
+                targets[net].append(addr)
+            if job.get("baseline_hf") not in (None, ""):
+                baselines[(net, addr)] = float(job["baseline_hf"])
+    return targets, baselines, bad
+
+
+def local_pool(url):
+    """RpcPool de un solo endpoint con el chainId que él mismo declare (anvil/hardhat, forks)"""
+    session = make_session()
+    r = session.post(url, json={"jsonrpc": "2.0", "id": 1, "method": "eth_chainId", "params": []}, timeout=5)
+    r.raise_for_status()
+    return RpcPool(int(r.json()["result"], 16), [url])
+
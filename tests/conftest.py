@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Las pruebas importan `looping` desde la raíz del repositorio (no hay paquete instalable)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
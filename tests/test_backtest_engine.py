@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from looping.backtest_engine import RESULT_COLUMNS, run_backtest
+from looping.bench import synthetic_ohlc
+
+# ==============================================================================
+#  MOTOR VECTORIZADO FRENTE AL BUCLE ORIGINAL DE LA PESTAÑA BACKTEST
+# ==============================================================================
+
+
+def reference_backtest(df_hist, capital, leverage, threshold, ltv):
+    """Bucle vela a vela tal como estaba en app.py antes de extraer el motor"""
+    start_price = float(df_hist.iloc[0]["Close"])
+    collateral_usd = capital * leverage
+    debt_usd = collateral_usd - capital
+    collateral_amt = collateral_usd / start_price
+    liq_price = debt_usd / (collateral_amt * ltv)
+    target_ratio = liq_price / start_price
+
+    history = []
+    total_injected = 0.0
+    is_liquidated = False
+    for date_idx, row in df_hist.iterrows():
+        if pd.isna(row["Close"]):
+            continue
+        low_val, close_val, open_val = float(row["Low"]), float(row["Close"]), float(row["Open"])
+        trigger_price = liq_price * (1 + threshold)
+        action = "Hold"
+        if low_val <= trigger_price and not is_liquidated:
+            defense_price = min(open_val, trigger_price)
+            if defense_price <= liq_price:
+                is_liquidated = True
+                action = "LIQUIDATED ☠️"
+            else:
+                target_liq_new = defense_price * target_ratio
+                needed_collat_amt = debt_usd / (target_liq_new * ltv)
+                add_collat_amt = needed_collat_amt - collateral_amt
+                if add_collat_amt > 0:
+                    total_injected += add_collat_amt * defense_price
+                    collateral_amt += add_collat_amt
+                    liq_price = target_liq_new
+                    action = "DEFENSA 🛡️"
+        if low_val <= liq_price and not is_liquidated:
+            is_liquidated = True
+        pos_value = (collateral_amt * close_val) - debt_usd if not is_liquidated else 0
+        history.append({
+            "Fecha": date_idx,
+            "Acción": action,
+            "Liq Price": liq_price if not is_liquidated else 0,
+            "Inversión Acumulada": capital + total_injected,
+            "Valor Estrategia": pos_value if not is_liquidated else 0,
+            "Valor HODL": (capital / start_price) * close_val,
+        })
+        if is_liquidated:
+            break
+    return pd.DataFrame(history).set_index("Fecha"), total_injected, is_liquidated
+
+
+@pytest.mark.parametrize("leverage,threshold,ltv", [
+    (2.0, 0.15, 0.78),
+    (1.5, 0.05, 0.85),
+    (3.0, 0.30, 0.75),
+    (4.0, 0.10, 0.80),
+])
+@pytest.mark.parametrize("seed", [1, 7])
+def test_run_backtest_matches_reference_loop(leverage, threshold, ltv, seed):
+    df_hist = synthetic_ohlc(3, seed=seed)
+    df_ref, injected, liquidated = reference_backtest(df_hist, 10000.0, leverage, threshold, ltv)
+    df_res, summary = run_backtest(df_hist, 10000.0, leverage, threshold, ltv)
+
+    assert list(df_res.columns) == RESULT_COLUMNS
+    assert len(df_res) == len(df_ref)
+    assert (df_res.index == df_ref.index).all()
+    assert list(df_res["Acción"]) == list(df_ref["Acción"])
+    for col in RESULT_COLUMNS[1:]:
+        np.testing.assert_allclose(df_res[col].to_numpy(float), df_ref[col].to_numpy(float), rtol=1e-9, atol=1e-6)
+    assert summary["is_liquidated"] == liquidated
+    assert summary["total_injected"] == pytest.approx(injected, rel=1e-9)
+
+
+def test_run_backtest_skips_empty_bars():
+    df_hist = synthetic_ohlc(1, seed=3)
+    df_hist.iloc[10:15, df_hist.columns.get_loc("Close")] = np.nan
+    df_ref, _, _ = reference_backtest(df_hist, 10000.0, 2.0, 0.15, 0.78)
+    df_res, _ = run_backtest(df_hist, 10000.0, 2.0, 0.15, 0.78)
+    assert (df_res.index == df_ref.index).all()
+
+
+def test_run_backtest_without_data():
+    df_res, summary = run_backtest(synthetic_ohlc(1).iloc[:0], 10000.0, 2.0, 0.15, 0.78)
+    assert df_res.empty and summary is None
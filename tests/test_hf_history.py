@@ -0,0 +1,109 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from looping.bench import encode_account_data
+from looping.hf_history import block_range_for_days, hf_history
+
+# ==============================================================================
+#  REPLAY DEL HF CONTRA UN NODO JSON-RPC GUIONIZADO
+# ==============================================================================
+# El nodo local responde eth_call con un HF que vale 2.0 hasta el bloque 500,
+# cae linealmente a 1.2 en el bloque 520 y se queda ahí. Los bloques de
+# `failing` devuelven error (nodo sin ese estado).
+
+HEAD = 1000
+BLOCK_TIME = 12
+
+
+def scripted_hf(block):
+    if block <= 500:
+        return 2.0
+    if block >= 520:
+        return 1.2
+    return 2.0 - 0.8 * (block - 500) / 20
+
+
+class _NodeHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        batch = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        data = json.dumps([self.server.answer(req) for req in batch]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class ScriptedNode(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _NodeHandler)
+        self.calls = Counter()
+        self.failing = set()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def answer(self, req):
+        method, params = req["method"], req["params"]
+        reply = {"jsonrpc": "2.0", "id": req["id"]}
+        if method == "eth_blockNumber":
+            return {**reply, "result": hex(HEAD)}
+        if method == "eth_getBlockByNumber":
+            return {**reply, "result": {"timestamp": hex(int(params[0], 16) * BLOCK_TIME)}}
+        block = int(params[1], 16)
+        self.calls[block] += 1
+        if block in self.failing:
+            return {**reply, "error": {"code": -32000, "message": "missing trie node"}}
+        hf = scripted_hf(block)
+        debt = 1_000 * 10**8
+        return {**reply, "result": "0x" + encode_account_data((int(debt * hf / 0.8), debt, 0, 8000, 7500, int(hf * 10**18))).hex()}
+
+
+@pytest.fixture
+def node():
+    server = ScriptedNode()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+POOL = "0x" + "11" * 20
+USER = "0x" + "22" * 20
+
+
+def test_refines_only_where_hf_moves(node):
+    df, rounds = hf_history(requests.Session(), node.url, POOL, USER, 0, HEAD, samples=11, rel_tol=0.02, max_rounds=6)
+    assert df["block"].is_monotonic_increasing
+    assert df["hf"].to_numpy() == pytest.approx([scripted_hf(b) for b in df["block"]])
+    inside = df[(df["block"] > 500) & (df["block"] < 520)]
+    assert len(inside) >= 3                     # la caída se ha subdividido
+    assert len(df) < 60                          # sin leer cada bloque
+    assert rounds <= 6
+    assert (df["timestamp"] == df["block"] * BLOCK_TIME).all()
+
+
+def test_stops_after_max_rounds(node):
+    _, rounds = hf_history(requests.Session(), node.url, POOL, USER, 0, HEAD, samples=11, rel_tol=0.0001, max_rounds=2)
+    assert rounds == 2
+
+
+def test_failed_blocks_are_not_requested_again(node):
+    node.failing = set(range(501, 520))
+    df, _ = hf_history(requests.Session(), node.url, POOL, USER, 0, HEAD, samples=11, rel_tol=0.02, max_rounds=6)
+    assert max(node.calls.values()) == 1
+    assert not set(df["block"]) & node.failing
+
+
+def test_block_range_for_days(node):
+    start, end = block_range_for_days(requests.Session(), node.url, 0.05)
+    assert end == HEAD
+    assert start == HEAD - int(0.05 * 86400 / BLOCK_TIME)
@@ -0,0 +1,130 @@
+import json
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from looping.leads import (BULK_THRESHOLD, MAX_ATTEMPTS, STATUS_FAILED, STATUS_PENDING, STATUS_SENT,
+                           LeadQueue, LeadWorker, MoosendClient)
+
+# ==============================================================================
+#  COLA DE LEADS CONTRA UN STUB HTTP LOCAL DE MOOSEND
+# ==============================================================================
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path.split("?")[0], body))
+        status, payload = self.server.replies.pop(0) if self.server.replies else (200, {"Code": 0})
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def moosend():
+    """Stub de la API: `replies` son las respuestas (estado, cuerpo) siguientes; `requests` lo recibido"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.replies, server.requests = [], []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def worker(tmp_path, moosend):
+    client = MoosendClient("key", "list", base_url=f"http://127.0.0.1:{moosend.server_port}/v3", timeout=(1, 2))
+    return LeadWorker(LeadQueue(str(tmp_path / "leads.sqlite")), client)
+
+
+def _row(queue, email):
+    conn = sqlite3.connect(queue.path)
+    try:
+        return conn.execute("SELECT status, attempts, next_attempt FROM leads WHERE email = ?", (email,)).fetchone()
+    finally:
+        conn.close()
+
+
+def _make_due(queue):
+    conn = sqlite3.connect(queue.path)
+    with conn:
+        conn.execute("UPDATE leads SET next_attempt = 0")
+    conn.close()
+
+
+def test_duplicate_email_is_queued_once(worker):
+    assert worker.submit("Ana", "ana@example.com")
+    assert not worker.submit("Ana", "  ANA@example.com ")
+    assert worker.queue.counts() == {STATUS_PENDING: 1}
+
+
+def test_lead_is_sent(worker, moosend):
+    worker.submit("Ana", "ana@example.com")
+    assert worker.drain() == 1
+    assert worker.queue.counts() == {STATUS_SENT: 1}
+    path, body = moosend.requests[0]
+    assert path == "/v3/subscribers/list/subscribe.json"
+    assert body["Email"] == "ana@example.com"
+    # Ya enviado: volver a enviarlo desde el formulario no lo encola otra vez
+    assert not worker.submit("Ana", "ana@example.com")
+
+
+def test_server_error_is_retried_later(worker, moosend):
+    worker.submit("Ana", "ana@example.com")
+    moosend.replies.append((503, {}))
+    assert worker.drain() == 1
+    status, attempts, _ = _row(worker.queue, "ana@example.com")
+    assert (status, attempts) == (STATUS_PENDING, 1)
+    assert worker.queue.next_due() > 0
+    assert worker.drain() == 0      # aún no toca
+
+    _make_due(worker.queue)
+    assert worker.drain() == 1
+    assert worker.queue.counts() == {STATUS_SENT: 1}
+
+
+def test_rejected_lead_fails_and_can_be_requeued(worker, moosend):
+    worker.submit("Ana", "not-an-email")
+    moosend.replies.append((200, {"Code": 1, "Error": "INVALID_EMAIL"}))
+    worker.drain()
+    assert worker.queue.counts() == {STATUS_FAILED: 1}
+
+    assert worker.queue.requeue_failed() == 1
+    assert worker.drain() == 1
+    assert worker.queue.counts() == {STATUS_SENT: 1}
+
+
+def test_lead_fails_after_max_attempts(worker, moosend):
+    worker.submit("Ana", "ana@example.com")
+    conn = sqlite3.connect(worker.queue.path)
+    with conn:
+        conn.execute("UPDATE leads SET attempts = ?", (MAX_ATTEMPTS - 1,))
+    conn.close()
+    moosend.replies.append((429, {}))
+    worker.drain()
+    assert worker.queue.counts() == {STATUS_FAILED: 1}
+
+
+def test_backlog_is_sent_in_bulk(worker, moosend):
+    for i in range(BULK_THRESHOLD):
+        worker.submit(f"Lead {i}", f"lead{i}@example.com")
+    assert worker.drain() == BULK_THRESHOLD
+    assert [path for path, _ in moosend.requests] == ["/v3/subscribers/list/subscribe_many.json"]
+    assert len(moosend.requests[0][1]["Subscribers"]) == BULK_THRESHOLD
+    assert worker.queue.counts() == {STATUS_SENT: BULK_THRESHOLD}
+
+
+def test_rejected_bulk_is_split_to_isolate_the_bad_lead(worker, moosend):
+    for i in range(BULK_THRESHOLD):
+        worker.submit(f"Lead {i}", f"lead{i}@example.com")
+    moosend.replies.extend([(200, {"Code": 1, "Error": "INVALID_EMAIL"}), (200, {"Code": 1, "Error": "INVALID_EMAIL"})])
+    worker.drain()
+    assert worker.queue.counts() == {STATUS_FAILED: 1, STATUS_SENT: BULK_THRESHOLD - 1}
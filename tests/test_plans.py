@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from looping.cascade import capital_surface
+from looping.plans import calculator_plan, mode_a_plan, mode_b_plan
+
+# ==============================================================================
+#  CASCADA Y PLANES FRENTE A LOS BUCLES ORIGINALES DE APP.PY
+# ==============================================================================
+
+
+def reference_calculator(price, target, capital, leverage, ltv, threshold, zones):
+    """Bucle de la tabla en cascada de la Calculadora (app.py original)"""
+    collat_usd = capital * leverage
+    debt_usd = collat_usd - capital
+    collat_amt = collat_usd / price
+    liq = debt_usd / (collat_amt * ltv)
+    target_ratio = liq / price
+
+    rows = []
+    curr_collat, curr_liq, cum_cost = collat_amt, liq, 0.0
+    for _ in range(zones):
+        trig_p = curr_liq * (1 + threshold)
+        drop_pct = (price - trig_p) / price
+        targ_liq = trig_p * target_ratio
+        add_col = debt_usd / (targ_liq * ltv) - curr_collat if targ_liq > 0 else 0
+        cost = add_col * trig_p
+        cum_cost += cost
+        curr_collat += add_col
+        total_inv = capital + cum_cost
+        net_prof = (curr_collat * target - debt_usd) - total_inv
+        roi = net_prof / total_inv * 100 if total_inv > 0 else 0
+        ratio = roi / (drop_pct * 100) if drop_pct > 0 else 0
+        new_hf = curr_collat * trig_p * ltv / debt_usd if debt_usd > 0 else 999
+        rows.append([trig_p, drop_pct, cost, total_inv, targ_liq, new_hf, net_prof, roi, ratio])
+        curr_liq = targ_liq
+    return np.array(rows), liq
+
+
+def reference_mode_a(price, asset_amt, asset_lt, debt_usd, threshold, zones):
+    """Bucle del Modo A del escáner (un solo colateral, app.py original)"""
+    liq = debt_usd / (asset_amt * asset_lt)
+    ratio_target = liq / price
+    rows = []
+    curr_c, curr_l, cum = asset_amt, liq, 0.0
+    for _ in range(zones):
+        trig = curr_l * (1 + threshold)
+        targ = trig * ratio_target
+        add_amt = max(0, debt_usd / (targ * asset_lt) - curr_c)
+        cost = add_amt * trig
+        cum += cost
+        curr_c += add_amt
+        rows.append([trig, add_amt, cost, cum, targ, curr_c * trig * asset_lt / debt_usd])
+        curr_l = targ
+    return np.array(rows)
+
+
+def reference_mode_b(col_usd, debt_usd, lt_avg, current_hf, num_defenses):
+    """Bucle del Modo B (multi-colateral, app.py original): (trigger, caída, capital, HF final)"""
+    hf_step = (current_hf - 1.0) / num_defenses
+    rows = []
+    for i in range(1, num_defenses + 1):
+        trigger_hf = max(current_hf - hf_step * i, 1.001)
+        drop_pct = 1 - trigger_hf / current_hf
+        shocked_col = col_usd * (1 - drop_pct)
+        needed = max(debt_usd - (col_usd * lt_avg) * (1 - drop_pct) / current_hf, 0)
+        final_debt = debt_usd - needed
+        final_hf = shocked_col * lt_avg / final_debt if final_debt > 0 else 999.0
+        rows.append([trigger_hf, drop_pct, needed, final_hf])
+    return np.array(rows)
+
+
+@pytest.mark.parametrize("leverage,ltv,threshold,zones", [
+    (2.0, 0.78, 0.15, 5),
+    (1.3, 0.85, 0.05, 10),
+    (4.5, 0.70, 0.30, 3),
+])
+def test_calculator_plan_matches_reference_loop(leverage, ltv, threshold, zones):
+    df, liq_0 = calculator_plan.__wrapped__(100000.0, 130000.0, 10000.0, leverage, ltv, threshold, zones)
+    ref, ref_liq = reference_calculator(100000.0, 130000.0, 10000.0, leverage, ltv, threshold, zones)
+    cols = ["Precio Activación", "Caída (%)", "Inversión Extra ($)", "Total Invertido ($)", "Nuevo P. Liq",
+            "Nuevo HF", "Beneficio ($)", "ROI (%)", "Ratio"]
+    np.testing.assert_allclose(df[cols].to_numpy(float), ref, rtol=1e-9, atol=1e-6)
+    assert liq_0 == pytest.approx(ref_liq)
+
+
+@pytest.mark.parametrize("threshold,zones", [(0.10, 5), (0.05, 10), (0.25, 2)])
+def test_mode_a_plan_matches_reference_loop(threshold, zones):
+    # Con un solo colateral la deuda no cubierta por los demás es toda la deuda
+    df = mode_a_plan.__wrapped__(3000.0, 10.0, 0.825, 18000.0, 18000.0, threshold, zones)
+    ref = reference_mode_a(3000.0, 10.0, 0.825, 18000.0, threshold, zones)
+    cols = ["Precio Activación", "Inyectar (Tokens)", "Costo ($)", "Acumulado ($)", "Nuevo Liq", "Nuevo HF"]
+    np.testing.assert_allclose(df[cols].to_numpy(float), ref, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("current_hf,num_defenses", [(1.72, 5), (1.05, 10), (3.0, 1)])
+def test_mode_b_plan_matches_reference_loop(current_hf, num_defenses):
+    df = mode_b_plan.__wrapped__(25000.0, 12000.0, 0.825, current_hf, num_defenses, 3000.0, "ETH-USD")
+    ref = reference_mode_b(25000.0, 12000.0, 0.825, current_hf, num_defenses)
+    assert list(df["Trigger HF"]) == [f"{v:.2f}" for v in ref[:, 0]]
+    assert list(df["Caída Mercado"]) == [f"-{v:.2%}" for v in ref[:, 1]]
+    np.testing.assert_allclose(df["Precio ETH-USD"], 3000.0 * (1 - ref[:, 1]))
+    np.testing.assert_allclose(df["Capital a Restaurar ($)"], ref[:, 2])
+    assert list(df["Nuevo HF"]) == [f"{v:.2f}" for v in ref[:, 3]]
+
+
+def test_capital_surface_matches_calculator_cells():
+    levs, ths = np.array([1.5, 2.0, 3.0]), np.array([0.05, 0.15])
+    total, drop = capital_surface(10000.0, 100000.0, 0.78, levs, ths, 5)
+    for i, lev in enumerate(levs):
+        for j, th in enumerate(ths):
+            ref, _ = reference_calculator(100000.0, 100000.0, 10000.0, lev, 0.78, th, 5)
+            assert total[i, j] == pytest.approx(ref[-1, 3], rel=1e-9)
+            assert drop[i, j] == pytest.approx(ref[-1, 1], rel=1e-9)
+
+
+def test_cached_plans_are_isolated_from_callers():
+    df, _ = calculator_plan(100000.0, 130000.0, 10000.0, 2.0, 0.78, 0.15, 5)
+    df.iloc[0, 1] = -1.0
+    again, _ = calculator_plan(100000.0, 130000.0, 10000.0, 2.0, 0.78, 0.15, 5)
+    assert again.iloc[0, 1] != -1.0
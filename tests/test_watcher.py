@@ -0,0 +1,75 @@
+import pytest
+
+from looping.plans import mode_b_triggers
+from looping.watcher import LEVEL_LIQUIDATABLE, Watcher
+
+# ==============================================================================
+#  ZONAS DEL VIGILANTE (HISTÉRESIS Y HF DE REFERENCIA)
+# ==============================================================================
+# Con HF de referencia 2.0 y 5 defensas los triggers son 1.8, 1.6, 1.4, 1.2 y
+# 1.001; el paso es 0.2, así que una zona se rearma 0.05 por encima de su trigger.
+
+KEY = ("Base", "0xabc")
+
+
+@pytest.fixture
+def watcher():
+    return Watcher({}, sink=None, num_defenses=5, baselines={KEY: 2.0})
+
+
+def feed(watcher, hfs, debt_usd=1000.0):
+    return [watcher.evaluate(*KEY, hf, debt_usd, block) for block, hf in enumerate(hfs)]
+
+
+def zones(alerts):
+    return [a["zone"] for a in alerts if a]
+
+
+def test_triggers():
+    assert list(mode_b_triggers(2.0, 5)) == pytest.approx([1.8, 1.6, 1.4, 1.2, 1.001])
+
+
+def test_flapping_around_a_trigger_alerts_once(watcher):
+    alerts = feed(watcher, [1.81, 1.79] * 20)
+    assert zones(alerts) == [1]
+
+
+def test_zone_rearms_after_recovering_past_the_margin(watcher):
+    alerts = feed(watcher, [1.79, 1.84, 1.79, 1.86, 1.79])
+    assert zones(alerts) == [1, 1]
+
+
+def test_deeper_zones_alert_in_order(watcher):
+    alerts = feed(watcher, [1.9, 1.79, 1.59, 1.61, 1.39, 1.41, 1.19])
+    assert zones(alerts) == [1, 2, 3, 4]
+    assert alerts[-1]["trigger_hf"] == pytest.approx(1.2)
+
+
+def test_jump_across_several_zones_alerts_deepest(watcher):
+    assert zones(feed(watcher, [1.5])) == [2]
+
+
+def test_liquidatable_alerts_once(watcher):
+    alerts = feed(watcher, [0.99, 1.0, 0.98, 1.02, 0.99])
+    assert zones(alerts) == [6]
+    assert alerts[0]["level"] == LEVEL_LIQUIDATABLE
+
+
+def test_small_uptick_keeps_baseline(watcher):
+    feed(watcher, [2.03])
+    assert watcher.states[KEY]["baseline"] == 2.0
+    feed(watcher, [2.05])
+    assert watcher.states[KEY]["baseline"] == 2.05
+
+
+def test_reinforced_position_rebuilds_the_plan(watcher):
+    alerts = feed(watcher, [1.79, 2.5, 2.19])
+    # Nueva referencia 2.5: primer trigger en 2.2
+    assert zones(alerts) == [1, 1]
+    assert alerts[-1]["baseline_hf"] == 2.5
+
+
+def test_repaid_debt_clears_state(watcher):
+    feed(watcher, [1.79])
+    assert watcher.evaluate(*KEY, float("inf"), 0.0, 10) is None
+    assert KEY not in watcher.states